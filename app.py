@@ -1,11 +1,34 @@
+import functools
+import html
+import os
+import threading
+import time
+
 import streamlit as st
-import mysql.connector
-from mysql.connector import Error
 import pandas as pd
 from datetime import datetime, date
 import plotly.express as px
-import plotly.graph_objects as go
-from passlib.context import CryptContext
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from bloodbank import BLOOD_GROUPS
+from bloodbank.auth import AuthBusy, AuthService, LoginThrottled
+from bloodbank.charts import FIGURE_CACHE
+from bloodbank.db import ConnectionPool, Error
+from bloodbank.eligibility import DONATION_INTERVAL_DAYS, NotEligible
+from bloodbank.exporter import EXPORT_FORMATS, EXTENSIONS, MIME_TYPES, export_query
+from bloodbank.fanout import QueryFanout
+from bloodbank.ids import IdService
+from bloodbank.importer import IMPORTERS, import_file
+from bloodbank.ledger import STOCK_BY_GROUP_QUERY, ensure_ledger, stock_by_group
+from bloodbank.matching import suggest_allocations, suggested_source
+from bloodbank.metrics import LATENCY_BUCKETS_MS, QUERY_METRICS, explain
+from bloodbank.migrations import check_indexes, migrate
+from bloodbank.pagination import DONATIONS, DONORS, PAGE_SIZES, RECIPIENTS, REQUESTS, PagePrefetcher, estimate_row_count
+from bloodbank.repositories import (
+    DONOR_AGES_QUERY, HOSPITAL_ACTIVITY_QUERY, HOSPITAL_DIRECTORY_QUERY, RECIPIENT_AGES_QUERY, Repositories,
+)
+from bloodbank.search import TrigramIndex
+from bloodbank.sessions import SessionStore
 
 # ====================
 # PAGE CONFIGURATION
@@ -18,32 +41,13 @@ st.set_page_config(
 )
 
 # ====================
-# PASSWORD HASHING
+# ADMINISTRATORS
 # ====================
-pwd_context = CryptContext(schemes=["sha256_crypt", "bcrypt"], deprecated="auto")
+# Usernames allowed to open the Performance page; none unless configured, since anyone can register
+ADMIN_USERS = {u.strip() for u in os.environ.get('BLOODBANK_ADMIN_USERS', '').split(',') if u.strip()}
 
-def verify_password(plain_password, hashed_password):
-    """Verify a plain password against a hashed password"""
-    try:
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception as e:
-        st.error(f"Password verification error: {e}")
-        return False
-
-def get_password_hash(password):
-    """Hash a password using the default scheme"""
-    return pwd_context.hash(password)
-
-# ====================
-# AGE CALCULATION HELPER
-# ====================
-def calculate_age(birth_date):
-    """Calculate age from date of birth"""
-    if birth_date is None:
-        return None
-    today = date.today()
-    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-    return age
+def is_admin():
+    return st.session_state.get('username') in ADMIN_USERS
 
 # ====================
 # ENHANCED CUSTOM CSS - PROFESSIONAL & POLISHED
@@ -988,6 +992,8 @@ if 'user_id' not in st.session_state:
     st.session_state.user_id = None
 if 'hospital_id' not in st.session_state:
     st.session_state.hospital_id = None
+if 'hospital_name' not in st.session_state:
+    st.session_state.hospital_name = None
 if 'delete_requested' not in st.session_state:
     st.session_state.delete_requested = False
 
@@ -995,113 +1001,578 @@ if 'delete_requested' not in st.session_state:
 # ====================
 # DATABASE CONNECTION
 # ====================
-def get_connection():
+@st.cache_resource
+def get_pool():
+    """Process-wide connection pool shared by every session"""
+    return ConnectionPool()
+
+@st.cache_resource
+def get_repos():
+    """Repositories bound to the shared pool"""
+    return Repositories(get_pool())
+
+@st.cache_resource
+def get_sessions():
+    """Login sessions shared by all browser tabs of this server process"""
+    return SessionStore()
+
+def apply_profile(profile):
+    st.session_state.logged_in = True
+    st.session_state.user_id = profile.user_id
+    st.session_state.username = profile.username
+    st.session_state.hospital_id = profile.hospital_id
+    st.session_state.hospital_name = profile.hospital_name
+
+def session_client():
+    """The browser a session token is bound to: client address and user agent"""
+    return f"{st.context.ip_address}|{st.context.headers.get('User-Agent', '')}"
+
+def start_session(profile):
+    """Log in and put a session token in the URL so a refresh keeps the login"""
+    apply_profile(profile)
+    st.query_params["session"] = get_sessions().create(profile, session_client())
+
+def restore_session():
+    """Log back in from the URL's session token, without touching the database"""
+    profile = get_sessions().get(st.query_params.get("session"), session_client())
+    if profile:
+        apply_profile(profile)
+
+def end_session():
+    get_sessions().revoke(st.query_params.get("session"))
+    if "session" in st.query_params:
+        del st.query_params["session"]
+    st.session_state.logged_in = False
+    st.session_state.user_id = None
+    st.session_state.hospital_id = None
+    st.session_state.hospital_name = None
+
+@st.cache_resource
+def get_auth():
+    """Login verification service shared by all sessions (hash pool, rate limits)"""
+    return AuthService(get_repos().users)
+
+def db_call(fn, *args):
+    """Run a repository read; None on failure, errors are reported on the page"""
     try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            database='blood_bank',
-            user='root',
-            password='Vidya@252005',  # UPDATE THIS WITH YOUR PASSWORD
-            autocommit=True,
-            charset='utf8mb4'
-        )
-        return connection
+        return fn(*args)
     except Error as e:
-        st.error(f"Error connecting to MySQL: {e}")
+        st.error(f"Database error: {e}")
         return None
 
-def execute_query(query, params=None, fetch=True):
-    conn = None
-    cursor = None
+def db_write(fn, *args):
+    """Run a repository write; True on success, errors are reported on the page"""
     try:
-        conn = get_connection()
-        if conn and conn.is_connected():
-            cursor = conn.cursor(buffered=True)
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
-            if fetch:
-                result = cursor.fetchall()
-                return result
-            else:
-                conn.commit()
-                return True
+        fn(*args)
+        return True
     except Error as e:
         st.error(f"Database error: {e}")
-        return None if fetch else False
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+        return False
+
+@st.cache_resource
+def init_schema():
+    """Apply pending schema migrations once per process"""
+    migrate(get_pool())
+    return True
+
+@st.cache_resource
+def init_stock_ledger():
+    ensure_ledger(get_pool())
+    return True
+
+def record_donation(donation_id, hospital_id, donor_id, quantity, donation_date):
+    """Insert a donation and credit the stock ledger; refused within the donation interval"""
+    try:
+        return db_write(get_repos().donations.record, donation_id, hospital_id, donor_id, quantity, donation_date)
+    except NotEligible as e:
+        st.error(f"{e}.")
+        return None
+
+# Update Status choice that takes the source from the current suggested allocation
+SUGGESTED_SOURCE = "Suggested"
+
+def update_request_status(request_id, new_status, source_group=None):
+    """Close a pending request; fulfilled requests are debited from `source_group` in the ledger.
+
+    SUGGESTED_SOURCE uses the group the allocation suggests, or the request's own group when none fits.
+    """
+    try:
+        if new_status == "Fulfilled" and source_group == SUGGESTED_SOURCE:
+            source_group = suggested_source(get_pool(), request_id)
+        updated = get_repos().requests.update_status(request_id, new_status, source_group)
+    except ValueError as e:
+        st.error(f"{e}.")
+        return None
+    except Error as e:
+        st.error(f"Database error: {e}")
+        return False
+    if updated is False:
+        st.error(f"Request {request_id} is no longer pending.")
+    return updated
 
 # ====================
 # HELPER FUNCTIONS
 # ====================
+@st.cache_resource
+def get_id_service():
+    return IdService(get_pool())
+
 def get_next_id(prefix, table, id_col):
-    """Generate next auto-incremented ID"""
+    """Allocate the next ID for a table from the shared sequence service"""
     try:
-        total_length = 5
-        prefix_len = len(prefix)
-        pad_length = total_length - prefix_len
-        
-        query = f"""
-            SELECT {id_col} 
-            FROM {table} 
-            WHERE {id_col} LIKE %s 
-            ORDER BY CAST(SUBSTRING({id_col}, {prefix_len + 1}) AS UNSIGNED) DESC 
-            LIMIT 1
-        """
-        
-        like_prefix = f"{prefix}%"
-        result = execute_query(query, (like_prefix,), fetch=True)
-        
-        next_num = 1
-        if result and result[0] and result[0][0]:
-            max_id_str = result[0][0]
-            numeric_part_str = max_id_str[prefix_len:]
-            
-            if numeric_part_str.isdigit():
-                current_num = int(numeric_part_str)
-                next_num = current_num + 1
-        
-        next_num_str = str(next_num).zfill(pad_length)
-        
-        if len(next_num_str) > pad_length:
-            st.error(f"ID Overflow Error: Cannot generate new ID for prefix '{prefix}'.")
-            return None
-            
-        return f"{prefix}{next_num_str}"
+        return get_id_service().next_id(prefix, table, id_col)
     except Exception as e:
         st.error(f"Error generating ID: {e}")
         return None
 
 @st.cache_data(ttl=60)
 def fetch_donors_list():
-    query = "SELECT Donor_ID, F_name, L_name FROM Donor ORDER BY F_name"
-    donors = execute_query(query)
+    donors = db_call(get_repos().donors.names)
     if donors:
-        return {f"{row[1]} {row[2]} (ID: {row[0]})": row[0] for row in donors}
+        return {f"{d.f_name} {d.l_name} (ID: {d.id})": d.id for d in donors}
     return {}
 
 @st.cache_data(ttl=60)
 def fetch_recipients_list():
-    query = "SELECT Recipient_ID, F_name, L_name FROM Recipient ORDER BY F_name"
-    recipients = execute_query(query)
+    recipients = db_call(get_repos().recipients.names)
     if recipients:
-        return {f"{row[1]} {row[2]} (ID: {row[0]})": row[0] for row in recipients}
+        return {f"{r.f_name} {r.l_name} (ID: {r.id})": r.id for r in recipients}
     return {}
 
 @st.cache_data(ttl=60)
 def fetch_hospitals_list():
-    query = "SELECT Hospital_ID, Name FROM Hospital ORDER BY Name"
-    hospitals = execute_query(query)
+    hospitals = db_call(get_repos().hospitals.names)
     if hospitals:
-        return {f"{row[1]} (ID: {row[0]})": row[0] for row in hospitals}
+        return {f"{h.name} (ID: {h.hospital_id})": h.hospital_id for h in hospitals}
     return {}
 
+@st.cache_resource
+def get_prefetcher():
+    return PagePrefetcher()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_row_estimate(table):
+    return estimate_row_count(get_pool(), table)
+
+# kind -> (listing the index is loaded from, ID column of imported rows)
+SEARCH_SOURCES = {'donors': (DONORS, 'Donor_ID'), 'recipients': (RECIPIENTS, 'Recipient_ID')}
+
+@st.cache_resource
+def get_search_index(kind):
+    """Trigram index over one kind of person; new people are added as they are inserted"""
+    return TrigramIndex()
+
+@st.cache_resource(show_spinner="Building the search index...")
+def load_search_index(kind):
+    """Fill the index from the database once per process; earlier adds are kept"""
+    return get_search_index(kind).load(get_pool(), SEARCH_SOURCES[kind][0])
+
+def add_to_search_index(kind, rows):
+    """Index newly inserted people given as a DataFrame of importer rows"""
+    index = get_search_index(kind)
+    id_column = SEARCH_SOURCES[kind][1]
+    people = rows[[id_column, 'F_name', 'L_name', 'Blood_Group', 'Contact']]
+    for person_id, f_name, l_name, blood_group, contact in people.itertuples(index=False):
+        index.add(person_id, f"{f_name} {l_name}", blood_group, contact)
+
+def show_person_search(kind):
+    """Search box over names and contact numbers with ranked matches"""
+    query = st.text_input("Name or phone number", key=f"{kind}_name_search",
+                          placeholder="e.g. 'kav pat' or '98765'")
+    if not query.strip():
+        return
+    try:
+        index = load_search_index(kind)
+    except Error as e:
+        st.error(f"Database error: {e}")
+        return
+    start = time.perf_counter()
+    hits = index.search(query)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    st.caption(f"{len(hits)} best matches among {len(index):,} {kind} in {elapsed_ms:.1f} ms")
+    if hits:
+        df_hits = pd.DataFrame(hits, columns=['ID', 'Name', 'Blood Group', 'Contacts', 'Match'])
+        df_hits['Match'] = (df_hits['Match'] * 100).round().astype(int).astype(str) + '%'
+        st.dataframe(df_hits, use_container_width=True, hide_index=True)
+    else:
+        st.info(f"No {kind} match this search")
+
+def invalidate_caches():
+    """Drop cached lists, widget data and listing pages after a successful write"""
+    st.cache_data.clear()
+    get_prefetcher().clear()
+
+def timed_fragment(name):
+    """st.fragment whose runs are timed under `name` (formatted with the call's arguments)"""
+    def decorate(fn):
+        @st.fragment
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with QUERY_METRICS.fragment(name.format(*args, **kwargs)):
+                return fn(*args, **kwargs)
+        return run
+    return decorate
+
+@timed_fragment("Export: {0}")
+def render_export_button(name, query, columns, params=None, transform=None):
+    """Format picker plus a download button that streams the query on click"""
+    pool = get_pool()
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox("Export format", EXPORT_FORMATS, key=f"{name}_export_format", label_visibility="collapsed")
+    with col2:
+        st.download_button(
+            f"Export {fmt}",
+            data=lambda: export_query(pool, query, columns, fmt, params, transform=transform),
+            file_name=f"{name}.{EXTENSIONS[fmt]}",
+            mime=MIME_TYPES[fmt],
+            key=f"{name}_export"
+        )
+
+@timed_fragment("Listing: {0.name}")
+def render_paginated_listing(listing, columns, empty_message):
+    """Show one page of a listing with page-size and Previous/Next controls"""
+    cursors_key = f"{listing.name}_cursors"
+    if cursors_key not in st.session_state:
+        st.session_state[cursors_key] = [None]
+    
+    def reset_cursors():
+        st.session_state[cursors_key] = [None]
+    
+    try:
+        rows, next_cursor = get_prefetcher().get_page(
+            get_pool(), listing, st.session_state[cursors_key][-1],
+            st.session_state.get(f"{listing.name}_page_size", PAGE_SIZES[1])
+        )
+    except Error as e:
+        st.error(f"Database error: {e}")
+        return
+    
+    if not rows:
+        st.info(empty_message)
+        return
+    
+    st.dataframe(pd.DataFrame(rows, columns=columns), use_container_width=True, hide_index=True)
+    
+    col1, col2, col3, col4 = st.columns([1, 1, 2, 1])
+    page_number = len(st.session_state[cursors_key])
+    with col1:
+        # Callbacks move the cursor before the fragment reruns, so only this listing is refetched
+        st.button("Previous", key=f"{listing.name}_prev", disabled=page_number == 1, use_container_width=True,
+                  on_click=lambda: st.session_state[cursors_key].pop())
+    with col2:
+        st.button("Next", key=f"{listing.name}_next", disabled=next_cursor is None, use_container_width=True,
+                  on_click=lambda: st.session_state[cursors_key].append(next_cursor))
+    with col3:
+        try:
+            estimate = fetch_row_estimate(listing.table)
+            st.caption(f"Page {page_number} · about {estimate:,} rows in total")
+        except Error:
+            st.caption(f"Page {page_number}")
+    with col4:
+        st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{listing.name}_page_size",
+                     on_change=reset_cursors, label_visibility="collapsed")
+    
+    render_export_button(listing.name, listing.export_query, columns, transform=listing.transform)
+
+def render_import_tab(kind):
+    """Upload a CSV/Excel file and bulk-insert its rows"""
+    required, optional, _ = IMPORTERS[kind]
+    st.markdown(f"#### Import {kind.title()}")
+    st.caption(f"Required columns: {', '.join(required)}"
+               + (f" | Optional: {', '.join(optional)}" if optional else "")
+               + " | Dates as YYYY-MM-DD")
+    
+    uploaded = st.file_uploader("CSV or Excel file", type=["csv", "xlsx", "xls"], key=f"{kind}_import_file")
+    if uploaded and st.button(f"Import {kind.title()}", type="primary", key=f"{kind}_import_btn", use_container_width=True):
+        try:
+            with st.spinner("Importing..."):
+                on_written = functools.partial(add_to_search_index, kind) if kind in SEARCH_SOURCES else None
+                report = import_file(get_pool(), get_id_service(), kind, uploaded, on_written=on_written)
+        except (ImportError, ValueError) as e:
+            st.error(f"Could not read file: {e}")
+            return
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Rows Read", f"{report.rows_read:,}")
+        col2.metric("Imported", f"{report.rows_written:,}")
+        col3.metric("Errors", f"{len(report.errors):,}")
+        col4.metric("Rows / sec", f"{report.rows_per_second:,.0f}")
+        
+        if report.rows_written:
+            st.success(f"Imported {report.rows_written:,} {kind} in {report.seconds:.2f}s.")
+            invalidate_caches()
+        if report.errors:
+            df_errors = report.errors_frame()
+            st.warning(f"{len(df_errors):,} problem(s) found. Rows with errors were skipped.")
+            st.dataframe(df_errors.head(1000), use_container_width=True, hide_index=True)
+            st.download_button("Download Error Report", df_errors.to_csv(index=False),
+                               file_name=f"{kind}_import_errors.csv", mime="text/csv", key=f"{kind}_import_errors")
+
+# Loaders for the Dashboard and Analytics fragments, one per widget. They are
+# cleared by invalidate_caches() whenever a write succeeds, so reruns in
+# between cost no database round-trips.
+@st.cache_data(ttl=60, show_spinner=False)
+def load_counts():
+    return get_repos().counts()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_blood_group_counts():
+    return get_repos().donors.count_by_blood_group()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_monthly_donations():
+    return get_repos().donations.monthly_counts(6)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_recent_donations():
+    return get_repos().donations.recent(5)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_recent_requests():
+    return get_repos().requests.recent(5)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_donors_in_group(blood_group):
+    return get_repos().donors.by_blood_group(blood_group)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_eligible_donors(blood_group):
+    return get_repos().donors.eligible(blood_group)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_stock_by_group():
+    return stock_by_group(get_pool())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_hospital_activity():
+    return get_repos().hospitals.activity()
+
+AGE_BIN_WIDTHS = [1, 2, 5, 10]
+DEFAULT_AGE_BIN_WIDTH = 5
+
+# No defaults: st.cache_data keys on the arguments passed, so every caller passes both
+@st.cache_data(ttl=60, show_spinner=False)
+def load_donor_ages(by, width):
+    return get_repos().donors.age_counts(by, width)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_recipient_ages(by, width):
+    return get_repos().recipients.age_counts(by, width)
+
+AGE_BREAKDOWN_LABELS = {"Nothing": None, "Gender": "Gender", "Blood group": "Blood_Group"}
+
+DASHBOARD_LOADERS = [load_counts, load_blood_group_counts, load_monthly_donations,
+                     load_recent_donations, load_recent_requests]
+
+def analytics_loaders():
+    """The Analytics loaders, with the age ones bound to what the age chart will ask for on this run"""
+    by = AGE_BREAKDOWN_LABELS[st.session_state.get("age_breakdown", "Nothing")]
+    width = st.session_state.get("age_bin_width", DEFAULT_AGE_BIN_WIDTH)
+    return [load_stock_by_group, load_hospital_activity,
+            functools.partial(load_donor_ages, by, width), functools.partial(load_recipient_ages, by, width)]
+
+@st.cache_resource
+def get_fanout():
+    return QueryFanout()
+
+def warm_loaders(loaders):
+    """Fill the loaders' caches concurrently before the page's fragments read them.
+
+    Failures are dropped here; the fragment calling the loader again reports them.
+    """
+    ctx = get_script_run_ctx()
+
+    def call(loader):
+        def run():
+            add_script_run_ctx(threading.current_thread(), ctx)
+            try:
+                return loader()
+            finally:
+                # Pool workers are shared by every session; don't keep this one's context alive
+                add_script_run_ctx(threading.current_thread(), None)
+        return run
+
+    get_fanout().gather(*[call(loader) for loader in loaders], return_exceptions=True)
+
+# ====================
+# DASHBOARD FRAGMENTS
+# ====================
+@timed_fragment("Dashboard: counts")
+def render_dashboard_counts():
+    counts = db_call(load_counts)
+    if counts is None:
+        return
+    col1, col2, col3, col4 = st.columns(4)
+    
+    col1.metric("Total Donors", counts.donors, delta="Active")
+    col2.metric("Recipients", counts.recipients)
+    col3.metric("Donations", counts.donations)
+    col4.metric("Pending", counts.pending_requests, delta=f"{counts.pending_requests} Urgent", delta_color="inverse")
+
+@timed_fragment("Dashboard: blood groups")
+def render_dashboard_blood_groups():
+    st.markdown("### Blood Group Distribution")
+    blood_data = db_call(load_blood_group_counts)
+    
+    if blood_data:
+        st.plotly_chart(FIGURE_CACHE.figure('blood_groups', blood_data), use_container_width=True)
+    else:
+        st.info("No donor data available.")
+
+@timed_fragment("Dashboard: monthly donations")
+def render_dashboard_monthly():
+    st.markdown("### Monthly Donations")
+    monthly_data = db_call(load_monthly_donations)
+    
+    if monthly_data:
+        st.plotly_chart(FIGURE_CACHE.figure('monthly_donations', monthly_data), use_container_width=True)
+    else:
+        st.info("No monthly data available.")
+
+@timed_fragment("Dashboard: recent activity")
+def render_dashboard_recent():
+    st.markdown("### Recent Activities")
+    tab1, tab2 = st.tabs(["Recent Donations", "Recent Requests"])
+    
+    with tab1:
+        recent_donations = db_call(load_recent_donations)
+        
+        if recent_donations:
+            df_donations = pd.DataFrame(recent_donations, columns=['ID', 'Donor', 'Hospital', 'Quantity (ml)', 'Date'])
+            st.dataframe(df_donations, use_container_width=True, hide_index=True)
+        else:
+            st.info("No recent donations found.")
+
+    with tab2:
+        recent_requests = db_call(load_recent_requests)
+        
+        if recent_requests:
+            df_requests = pd.DataFrame(recent_requests, columns=['ID', 'Recipient', 'Blood Group', 'Quantity (ml)', 'Status', 'Date'])
+            st.dataframe(df_requests, use_container_width=True, hide_index=True)
+        else:
+            st.info("No recent requests found.")
+
+# ====================
+# DONOR SEARCH FRAGMENT
+# ====================
+@timed_fragment("Donors: search")
+def render_donor_search():
+    st.markdown("#### Search Donor")
+    
+    search_option = st.selectbox("Search by", ["Name or Phone", "Donor ID", "Blood Group", "Eligible to Donate"],
+                                 label_visibility="collapsed")
+    
+    if search_option == "Name or Phone":
+        show_person_search("donors")
+    elif search_option == "Donor ID":
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            search_id = st.text_input("Enter Donor ID", label_visibility="collapsed", placeholder="Enter Donor ID")
+        with col2:
+            search_btn = st.button("Search", use_container_width=True)
+    
+        if search_btn and search_id:
+            r = db_call(get_repos().donors.get, search_id)
+    
+            if r:
+                st.success("Donor Found!")
+                st.markdown(f"""
+                    <div class="section-card">
+                        <h3 style='color: #b71c1c; margin-top: 0;'>{r.f_name} {r.l_name}</h3>
+                        <p><strong>ID:</strong> {r.donor_id} | <strong>Gender:</strong> {r.gender} | <strong>Age:</strong> {r.age}</p>
+                        <p><strong>Blood Group:</strong> <span style='color: #d32f2f; font-size: 20px; font-weight: 700;'>{r.blood_group}</span></p>
+                        <p><strong>Contact(s):</strong> {r.contacts if r.contacts else 'N/A'}</p>
+                        <p><strong>Address:</strong> {r.address}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.error("Donor not found")
+    else:
+        st.markdown("**Select Blood Group:**")
+        blood_group_search = st.radio(
+            "Blood Group",
+            ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"],
+            horizontal=True,
+            label_visibility="collapsed"
+        )
+    
+        if search_option == "Eligible to Donate":
+            eligible = db_call(load_eligible_donors, blood_group_search)
+            if eligible:
+                st.markdown(f"### {blood_group_search} Donors Eligible Today")
+                st.caption(f"No donation in the last {DONATION_INTERVAL_DAYS} days; longest-waiting first, up to 100 shown.")
+                df_eligible = pd.DataFrame(eligible, columns=['ID', 'First Name', 'Last Name', 'Blood Group', 'Last Donation'])
+                st.dataframe(df_eligible, use_container_width=True, hide_index=True)
+            else:
+                st.info("No donors with this blood group can donate today")
+            return
+    
+        results = db_call(load_donors_in_group, blood_group_search)
+    
+        if results:
+            st.markdown(f"### Donors with Blood Group: {blood_group_search}")
+            df_results = pd.DataFrame(results, columns=['ID', 'First Name', 'Last Name', 'Age', 'Blood Group'])
+            st.dataframe(df_results, use_container_width=True, hide_index=True)
+        else:
+            st.info("No donors found with this blood group")
+
+@timed_fragment("Recipients: search")
+def render_recipient_search():
+    st.markdown("#### Search Recipient")
+    show_person_search("recipients")
+
+# ====================
+# ANALYTICS FRAGMENTS
+# ====================
+@timed_fragment("Analytics: blood stock")
+def render_analytics_stock():
+    st.markdown("#### Blood Stock (Donated vs Fulfilled)")
+    
+    stock_data = db_call(load_stock_by_group)
+    
+    if stock_data:
+        st.plotly_chart(FIGURE_CACHE.figure('blood_stock', stock_data), use_container_width=True)
+    else:
+        st.info("No donation data for stock analysis.")
+
+@timed_fragment("Analytics: hospital activity")
+def render_analytics_activity():
+    st.markdown("#### Hospital Activity")
+    
+    activity_data = db_call(load_hospital_activity)
+    
+    if activity_data:
+        st.plotly_chart(FIGURE_CACHE.figure('hospital_activity', activity_data), use_container_width=True)
+    else:
+        st.info("No hospital activity data available.")
+
+@timed_fragment("Analytics: age distribution")
+def render_analytics_ages():
+    st.markdown("#### Age Distribution")
+    col1, col2 = st.columns(2)
+    bin_width = col1.selectbox("Bin width (years)", AGE_BIN_WIDTHS,
+                               index=AGE_BIN_WIDTHS.index(DEFAULT_AGE_BIN_WIDTH), key="age_bin_width")
+    breakdown = col2.selectbox("Break down by", list(AGE_BREAKDOWN_LABELS), key="age_breakdown")
+    by = AGE_BREAKDOWN_LABELS[breakdown]
+    # The database bins the ages, so only a few dozen rows per breakdown and width reach the app
+    donor_ages = db_call(load_donor_ages, by, bin_width) or []
+    recipient_ages = db_call(load_recipient_ages, by, bin_width) or []
+    
+    if donor_ages or recipient_ages:
+        figure = FIGURE_CACHE.figure('ages', donor_ages, recipient_ages, bin_width, breakdown if by else None)
+        st.plotly_chart(figure, use_container_width=True)
+    else:
+        st.info("No age data available for analysis.")
+
+try:
+    init_schema()
+except Error as e:
+    st.error(f"Database error: {e}")
+
+if not st.session_state.logged_in:
+    restore_session()
+
 # ==================================================================
 # ==================== LOGIN/REGISTER PAGE =========================
 # ==================================================================
@@ -1125,28 +1596,22 @@ if not st.session_state.logged_in:
                 if not username or not password:
                     st.warning("Please enter both username and password.")
                 else:
-                    result = execute_query(
-                        "SELECT User_ID, Password, Hospital_ID FROM User_Login WHERE Username = %s",
-                        (username,)
-                    )
-                    
-                    if result and len(result) > 0:
-                        user_data = result[0]
-                        user_id = user_data[0]
-                        hashed_password = user_data[1]
-                        hospital_id = user_data[2]
+                    try:
+                        with st.spinner("Verifying..."):
+                            user = get_auth().authenticate(username, password, st.context.ip_address)
                         
-                        if verify_password(password, hashed_password):
-                            st.session_state.logged_in = True
-                            st.session_state.user_id = user_id
-                            st.session_state.username = username
-                            st.session_state.hospital_id = hospital_id
+                        profile = get_repos().users.profile(user.user_id) if user else None
+                        
+                        if profile:
+                            start_session(profile)
                             st.success("Login successful!")
                             st.rerun()
                         else:
                             st.error("Invalid username or password.")
-                    else:
-                        st.error("Invalid username or password.")
+                    except (AuthBusy, LoginThrottled) as e:
+                        st.error(str(e))
+                    except Error as e:
+                        st.error(f"Database error: {e}")
     
     with tab2:
         st.markdown("### Register New Hospital & User")
@@ -1187,42 +1652,20 @@ if not st.session_state.logged_in:
                         if not hospital_id or not new_user_id:
                             st.error("Could not generate IDs. Please try again.")
                         else:
-                            hashed_pwd = get_password_hash(u_password)
+                            hashed_pwd = get_auth().hash(u_password)
                             
-                            execute_query(
-                                "INSERT INTO Hospital (Hospital_ID, Name, Address) VALUES (%s, %s, %s)",
-                                (hospital_id, h_name, h_address),
-                                fetch=False
-                            )
-                            execute_query(
-                                "INSERT INTO Hospital_Contact (Hospital_ID, Contact) VALUES (%s, %s)",
-                                (hospital_id, h_contact),
-                                fetch=False
-                            )
-                            execute_query(
-                                "INSERT INTO Hospital_Email (Hospital_ID, Email) VALUES (%s, %s)",
-                                (hospital_id, h_email),
-                                fetch=False
-                            )
-                            execute_query(
-                                "INSERT INTO User_Login (User_ID, Username, Password, Hospital_ID) VALUES (%s, %s, %s, %s)",
-                                (new_user_id, u_username, hashed_pwd, hospital_id),
-                                fetch=False
-                            )
-                            execute_query(
-                                "INSERT INTO User_Contact (User_ID, Contact) VALUES (%s, %s)",
-                                (new_user_id, u_contact),
-                                fetch=False
-                            )
-                            execute_query(
-                                "INSERT INTO User_Email (User_ID, Email) VALUES (%s, %s)",
-                                (new_user_id, u_email),
-                                fetch=False
+                            registered = db_write(
+                                get_repos().users.register, hospital_id, h_name, h_address, h_contact, h_email,
+                                new_user_id, u_username, hashed_pwd, u_contact, u_email
                             )
                             
-                            st.success(f"Hospital '{h_name}' and user '{u_username}' registered successfully!")
-                            st.info("Please use the Login tab to access your account.")
-                            st.balloons()
+                            if registered:
+                                st.success(f"Hospital '{h_name}' and user '{u_username}' registered successfully!")
+                                st.info("Please use the Login tab to access your account.")
+                                st.balloons()
+                                invalidate_caches()
+                            else:
+                                st.error("Registration failed. No changes were saved.")
             
                     except Exception as e:
                         st.error(f"Registration failed: {e}")
@@ -1232,6 +1675,11 @@ if not st.session_state.logged_in:
 # ==================================================================
 if st.session_state.logged_in:
     
+    try:
+        init_stock_ledger()
+    except Error as e:
+        st.error(f"Database error: {e}")
+    
     # ====================
     # SIDEBAR
     # ====================
@@ -1252,6 +1700,8 @@ if st.session_state.logged_in:
             "Hospitals": "Hospitals",
             "Analytics": "Analytics"
         }
+        if is_admin():
+            pages["Performance"] = "Performance"
         
         for page_key, page_name in pages.items():
             if st.button(f"{page_name}", key=page_key, use_container_width=True):
@@ -1259,12 +1709,18 @@ if st.session_state.logged_in:
                 st.rerun()
 
         st.markdown("---")
-        st.markdown(f"<p style='padding-left: 10px; color: rgba(255,255,255,0.8);'>Logged in as: <b>{st.session_state.username}</b></p>", unsafe_allow_html=True)
-        
+        st.markdown(f"<p style='padding-left: 10px; color: rgba(255,255,255,0.8);'>Logged in as: <b>{html.escape(st.session_state.username)}</b><br>{html.escape(st.session_state.hospital_name or '')}</p>", unsafe_allow_html=True)
+
+        with st.expander("Connection Pool"):
+            pool = get_pool()
+            pool_stats = pool.metrics.snapshot()
+            st.caption(f"Size: {pool.size} | In use: {pool_stats['in_use']} (peak {pool_stats['peak_in_use']})")
+            st.caption(f"Checkouts: {pool_stats['checkouts']} | Waits: {pool_stats['waits']} | Timeouts: {pool_stats['timeouts']}")
+            st.caption(f"Avg wait: {pool_stats['avg_wait_ms']:.1f} ms | Max wait: {pool_stats['max_wait_ms']:.1f} ms")
+            st.caption(f"Opened: {pool_stats['created']} | Recycled: {pool_stats['discarded']}")
+
         if st.button("Logout", use_container_width=True, key="logout"):
-            st.session_state.logged_in = False
-            st.session_state.user_id = None
-            st.session_state.hospital_id = None
+            end_session()
             st.session_state.current_page = "Dashboard"
             st.rerun()
             
@@ -1284,15 +1740,12 @@ if st.session_state.logged_in:
                         try:
                             uid = st.session_state.user_id
                             if uid:
-                                execute_query("DELETE FROM User_Contact WHERE User_ID = %s", (uid,), fetch=False)
-                                execute_query("DELETE FROM User_Email WHERE User_ID = %s", (uid,), fetch=False)
-                                success_del = execute_query("DELETE FROM User_Login WHERE User_ID = %s", (uid,), fetch=False)
+                                success_del = db_write(get_repos().users.delete, uid)
                                 
                                 if success_del:
                                     st.success("Account deleted. Logging out...")
-                                    st.session_state.logged_in = False
-                                    st.session_state.user_id = None
-                                    st.session_state.hospital_id = None
+                                    get_sessions().revoke_user(uid)
+                                    end_session()
                                     st.rerun()
                         except Exception as e:
                             st.error(f"Error: {e}")
@@ -1314,628 +1767,467 @@ if st.session_state.logged_in:
         </div>""", unsafe_allow_html=True)
 
     page = st.session_state.current_page
+    if page == "Performance" and not is_admin():
+        page = "Dashboard"
+    QUERY_METRICS.start_render(page)
 
-    # =========================================================
-    # ==================== DASHBOARD PAGE =====================
-    # =========================================================
-    if page == "Dashboard":
-        col1, col2, col3, col4 = st.columns(4)
-        
-        result = execute_query("SELECT COUNT(*) FROM Donor")
-        total_donors = result[0][0] if result else 0
-        col1.metric("Total Donors", total_donors, delta="Active")
-        
-        result = execute_query("SELECT COUNT(*) FROM Recipient")
-        total_recipients = result[0][0] if result else 0
-        col2.metric("Recipients", total_recipients)
-        
-        result = execute_query("SELECT COUNT(*) FROM Donation")
-        total_donations = result[0][0] if result else 0
-        col3.metric("Donations", total_donations)
-        
-        result = execute_query("SELECT COUNT(*) FROM Request WHERE Status = 'Pending'")
-        pending_requests = result[0][0] if result else 0
-        col4.metric("Pending", pending_requests, delta=f"{pending_requests} Urgent", delta_color="inverse")
-
-        st.markdown("<br>", unsafe_allow_html=True)
+    # Close the render even when the page stops early (st.rerun(), an exception)
+    try:
+        # =========================================================
+        # ==================== DASHBOARD PAGE =====================
+        # =========================================================
+        if page == "Dashboard":
+            warm_loaders(DASHBOARD_LOADERS)
+            render_dashboard_counts()
+
+            st.markdown("<br>", unsafe_allow_html=True)
         
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.markdown("### Blood Group Distribution")
-            blood_data = execute_query("SELECT Blood_Group, COUNT(*) as count FROM Donor GROUP BY Blood_Group")
-            
-            if blood_data:
-                df_blood = pd.DataFrame(blood_data, columns=['Blood Group', 'Count'])
-                fig = px.pie(df_blood, values='Count', names='Blood Group', 
-                            color_discrete_sequence=['#b71c1c', '#c62828', '#d32f2f', '#e53935', '#ef5350', '#e57373', '#ef9a9a', '#ffcdd2'],
-                            hole=0.5)
-                fig.update_traces(textposition='inside', textinfo='percent+label', textfont_size=14)
-                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', showlegend=True, height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("No donor data available.")
+            with col1:
+                render_dashboard_blood_groups()
 
-        with col2:
-            st.markdown("### Monthly Donations")
-            monthly_data = execute_query("""
-                SELECT DATE_FORMAT(Donation_date, '%Y-%m') as month, COUNT(*) as count 
-                FROM Donation GROUP BY month ORDER BY month DESC LIMIT 6
-            """)
-            
-            if monthly_data:
-                df_monthly = pd.DataFrame(monthly_data, columns=['Month', 'Donations'])
-                fig = px.bar(df_monthly, x='Month', y='Donations', color='Donations',
-                            color_continuous_scale=['#ffcdd2', '#d32f2f'])
-                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("No monthly data available.")
+            with col2:
+                render_dashboard_monthly()
 
-        st.markdown("### Recent Activities")
-        tab1, tab2 = st.tabs(["Recent Donations", "Recent Requests"])
-        
-        with tab1:
-            recent_donations = execute_query("""
-                SELECT d.Donation_ID, CONCAT(don.F_name, ' ', don.L_name) as Donor, 
-                    h.Name as Hospital, d.Quantity, d.Donation_date
-                FROM Donation d
-                JOIN Donor don ON d.Donor_ID = don.Donor_ID
-                JOIN Hospital h ON d.Hospital_ID = h.Hospital_ID
-                ORDER BY d.Donation_date DESC LIMIT 5
-            """)
-            
-            if recent_donations:
-                df_donations = pd.DataFrame(recent_donations, columns=['ID', 'Donor', 'Hospital', 'Quantity (ml)', 'Date'])
-                st.dataframe(df_donations, use_container_width=True, hide_index=True)
-            else:
-                st.info("No recent donations found.")
-
-        with tab2:
-            recent_requests = execute_query("""
-                SELECT r.Request_ID, CONCAT(rec.F_name, ' ', rec.L_name) as Recipient, 
-                    r.Blood_Group, r.Quantity, r.Status, r.Request_date
-                FROM Request r
-                JOIN Recipient rec ON r.Recipient_ID = rec.Recipient_ID
-                ORDER BY r.Request_date DESC LIMIT 5
-            """)
-            
-            if recent_requests:
-                df_requests = pd.DataFrame(recent_requests, columns=['ID', 'Recipient', 'Blood Group', 'Quantity (ml)', 'Status', 'Date'])
-                st.dataframe(df_requests, use_container_width=True, hide_index=True)
-            else:
-                st.info("No recent requests found.")
+            render_dashboard_recent()
 
-    # =========================================================
-    # ===================== DONORS PAGE =======================
-    # =========================================================
-    elif page == "Donors":
-        st.markdown("### Donor Management")
+        # =========================================================
+        # ===================== DONORS PAGE =======================
+        # =========================================================
+        elif page == "Donors":
+            st.markdown("### Donor Management")
         
-        tab1, tab2, tab3 = st.tabs(["View Donors", "Add Donor", "Search Donor"])
+            tab1, tab2, tab3, tab4 = st.tabs(["View Donors", "Add Donor", "Search Donor", "Import Donors"])
         
-        with tab1:
-            donors = execute_query("""
-                SELECT d.Donor_ID, CONCAT(d.F_name, ' ', d.L_name) as Name, 
-                    d.Gender, d.Age, d.Blood_Group, d.Address,
-                    GROUP_CONCAT(dc.Contact SEPARATOR ', ') as Contacts
-                FROM Donor d
-                LEFT JOIN Donor_Contact dc ON d.Donor_ID = dc.Donor_ID
-                GROUP BY d.Donor_ID
-                ORDER BY d.Donor_ID
-            """)
-            
-            if donors:
-                df_donors = pd.DataFrame(donors, columns=['ID', 'Name', 'Gender', 'Age', 'Blood Group', 'Address', 'Contacts'])
-                st.dataframe(df_donors, use_container_width=True, hide_index=True)
-            else:
-                st.info("No donors found in the database.")
+            with tab1:
+                render_paginated_listing(DONORS, ['ID', 'Name', 'Gender', 'Age', 'Blood Group', 'Address', 'Contacts'],
+                                         "No donors found in the database.")
 
-        with tab2:
-            st.markdown("#### Add New Donor")
+            with tab2:
+                st.markdown("#### Add New Donor")
             
-            with st.form("add_donor_form"):
-                col1, col2 = st.columns(2)
+                with st.form("add_donor_form"):
+                    col1, col2 = st.columns(2)
                 
-                with col1:
-                    fname = st.text_input("First Name", placeholder="John")
-                    lname = st.text_input("Last Name", placeholder="Doe")
-                    gender = st.selectbox("Gender", ["M", "F", "Other"])
+                    with col1:
+                        fname = st.text_input("First Name", placeholder="John")
+                        lname = st.text_input("Last Name", placeholder="Doe")
+                        gender = st.selectbox("Gender", ["M", "F", "Other"])
                 
-                with col2:
-                    dob = st.date_input("Date of Birth", max_value=date.today(), value=date(2000, 1, 1))
-                    blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
-                    contact = st.text_input("Contact", placeholder="9876543210")
+                    with col2:
+                        dob = st.date_input("Date of Birth", max_value=date.today(), value=date(2000, 1, 1))
+                        blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
+                        contact = st.text_input("Contact", placeholder="9876543210")
                 
-                address = st.text_area("Address", placeholder="Enter full address")
+                    address = st.text_area("Address", placeholder="Enter full address")
                 
-                submitted = st.form_submit_button("Add Donor", type="primary", use_container_width=True)
+                    submitted = st.form_submit_button("Add Donor", type="primary", use_container_width=True)
                 
-                if submitted:
-                    if not fname or not lname or not contact:
-                        st.warning("Please fill all required fields (Name, Contact).")
-                    else:
-                        donor_id = get_next_id("D", "Donor", "Donor_ID")
-                        if not donor_id:
-                            st.error("Could not generate Donor ID.")
+                    if submitted:
+                        if not fname or not lname or not contact:
+                            st.warning("Please fill all required fields (Name, Contact).")
                         else:
-                            success = execute_query("""
-                                INSERT INTO Donor (Donor_ID, F_name, L_name, Address, Gender, DOB, Age, Blood_Group)
-                                VALUES (%s, %s, %s, %s, %s, %s, Calculate_Age(%s), %s)
-                            """, (donor_id, fname, lname, address, gender, dob, dob, blood_group), fetch=False)
-                            
-                            if success:
-                                execute_query("""
-                                    INSERT INTO Donor_Contact (Donor_ID, Contact)
-                                    VALUES (%s, %s)
-                                """, (donor_id, contact), fetch=False)
-                                
-                                st.success(f"Donor added successfully! New ID: {donor_id}")
-                                st.balloons()
-                                st.cache_data.clear()
+                            donor_id = get_next_id("D", "Donor", "Donor_ID")
+                            if not donor_id:
+                                st.error("Could not generate Donor ID.")
                             else:
-                                st.error("Failed to add donor.")
+                                success = db_write(
+                                    get_repos().donors.add, donor_id, fname, lname, address, gender, dob, blood_group, contact
+                                )
+                            
+                                if success:
+                                    st.success(f"Donor added successfully! New ID: {donor_id}")
+                                    st.balloons()
+                                    get_search_index("donors").add(donor_id, f"{fname} {lname}", blood_group, contact)
+                                    invalidate_caches()
+                                else:
+                                    st.error("Failed to add donor.")
 
-        with tab3:
-            st.markdown("#### Search Donor")
-            
-            search_option = st.selectbox("Search by", ["Donor ID", "Blood Group"], label_visibility="collapsed")
-            
-            if search_option == "Donor ID":
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    search_id = st.text_input("Enter Donor ID", label_visibility="collapsed", placeholder="Enter Donor ID")
-                with col2:
-                    search_btn = st.button("Search", use_container_width=True)
-                
-                if search_btn and search_id:
-                    result = execute_query("""
-                        SELECT d.*, GROUP_CONCAT(dc.Contact SEPARATOR ', ')
-                        FROM Donor d
-                        LEFT JOIN Donor_Contact dc ON d.Donor_ID = dc.Donor_ID
-                        WHERE d.Donor_ID = %s
-                        GROUP BY d.Donor_ID
-                    """, (search_id,))
-                    
-                    if result:
-                        r = result[0]
-                        st.success("Donor Found!")
-                        st.markdown(f"""
-                            <div class="section-card">
-                                <h3 style='color: #b71c1c; margin-top: 0;'>{r[1]} {r[2]}</h3>
-                                <p><strong>ID:</strong> {r[0]} | <strong>Gender:</strong> {r[4]} | <strong>Age:</strong> {r[6]}</p>
-                                <p><strong>Blood Group:</strong> <span style='color: #d32f2f; font-size: 20px; font-weight: 700;'>{r[7]}</span></p>
-                                <p><strong>Contact(s):</strong> {r[8] if r[8] else 'N/A'}</p>
-                                <p><strong>Address:</strong> {r[3]}</p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.error("Donor not found")
-            else:
-                st.markdown("**Select Blood Group:**")
-                blood_group_search = st.radio(
-                    "Blood Group",
-                    ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"],
-                    horizontal=True,
-                    label_visibility="collapsed"
-                )
-                
-                results = execute_query("CALL GetDonorsByBloodGroup(%s)", (blood_group_search,))
-                
-                if results:
-                    st.markdown(f"### Donors with Blood Group: {blood_group_search}")
-                    df_results = pd.DataFrame(results, columns=['ID', 'First Name', 'Last Name', 'Age', 'Blood Group'])
-                    st.dataframe(df_results, use_container_width=True, hide_index=True)
-                else:
-                    st.info("No donors found with this blood group")
+            with tab3:
+                render_donor_search()
+
+            with tab4:
+                render_import_tab("donors")
 
-    # =========================================================
-    # =================== RECIPIENTS PAGE =====================
-    # =========================================================
-    elif page == "Recipients":
-        st.markdown("### Recipient Management")
+        # =========================================================
+        # =================== RECIPIENTS PAGE =====================
+        # =========================================================
+        elif page == "Recipients":
+            st.markdown("### Recipient Management")
         
-        tab1, tab2 = st.tabs(["View Recipients", "Add Recipient"])
+            tab1, tab2, tab3, tab4 = st.tabs(["View Recipients", "Add Recipient", "Search Recipient", "Import Recipients"])
         
-        with tab1:
-            recipients = execute_query("""
-                SELECT r.Recipient_ID, CONCAT(r.F_name, ' ', r.L_name) as Name, 
-                    r.Gender, r.Age, r.Blood_Group, r.Address,
-                    GROUP_CONCAT(rc.Contact SEPARATOR ', ') as Contacts
-                FROM Recipient r
-                LEFT JOIN Recipient_Contact rc ON r.Recipient_ID = rc.Recipient_ID
-                GROUP BY r.Recipient_ID
-                ORDER BY r.Recipient_ID
-            """)
-            
-            if recipients:
-                df_recipients = pd.DataFrame(recipients, columns=['ID', 'Name', 'Gender', 'Age', 'Blood Group', 'Address', 'Contacts'])
-                st.dataframe(df_recipients, use_container_width=True, hide_index=True)
-            else:
-                st.info("No recipients found in the database.")
+            with tab1:
+                render_paginated_listing(RECIPIENTS, ['ID', 'Name', 'Gender', 'Age', 'Blood Group', 'Address', 'Contacts'],
+                                         "No recipients found in the database.")
 
-        with tab2:
-            st.markdown("#### Add New Recipient")
+            with tab2:
+                st.markdown("#### Add New Recipient")
             
-            with st.form("add_recipient_form"):
-                col1, col2 = st.columns(2)
+                with st.form("add_recipient_form"):
+                    col1, col2 = st.columns(2)
                 
-                with col1:
-                    fname = st.text_input("First Name", placeholder="Jane")
-                    lname = st.text_input("Last Name", placeholder="Smith")
-                    gender = st.selectbox("Gender", ["M", "F", "Other"])
+                    with col1:
+                        fname = st.text_input("First Name", placeholder="Jane")
+                        lname = st.text_input("Last Name", placeholder="Smith")
+                        gender = st.selectbox("Gender", ["M", "F", "Other"])
                 
-                with col2:
-                    age = st.number_input("Age", min_value=1, max_value=120, value=30)
-                    blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
-                    contact = st.text_input("Contact", placeholder="9876543210")
+                    with col2:
+                        age = st.number_input("Age", min_value=1, max_value=120, value=30)
+                        blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
+                        contact = st.text_input("Contact", placeholder="9876543210")
                 
-                address = st.text_area("Address", placeholder="Enter full address")
+                    address = st.text_area("Address", placeholder="Enter full address")
                 
-                submitted = st.form_submit_button("Add Recipient", type="primary", use_container_width=True)
+                    submitted = st.form_submit_button("Add Recipient", type="primary", use_container_width=True)
                 
-                if submitted:
-                    if not fname or not lname or not contact:
-                        st.warning("Please fill all required fields.")
-                    else:
-                        recipient_id = get_next_id("R", "Recipient", "Recipient_ID")
-                        if not recipient_id:
-                            st.error("Could not generate Recipient ID.")
+                    if submitted:
+                        if not fname or not lname or not contact:
+                            st.warning("Please fill all required fields.")
                         else:
-                            success = execute_query("""
-                                INSERT INTO Recipient (Recipient_ID, F_name, L_name, Address, Gender, Age, Blood_Group)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            """, (recipient_id, fname, lname, address, gender, age, blood_group), fetch=False)
-                            
-                            if success:
-                                execute_query("""
-                                    INSERT INTO Recipient_Contact (Recipient_ID, Contact)
-                                    VALUES (%s, %s)
-                                """, (recipient_id, contact), fetch=False)
-                                
-                                st.success(f"Recipient added successfully! New ID: {recipient_id}")
-                                st.balloons()
-                                st.cache_data.clear()
+                            recipient_id = get_next_id("R", "Recipient", "Recipient_ID")
+                            if not recipient_id:
+                                st.error("Could not generate Recipient ID.")
                             else:
-                                st.error("Failed to add recipient.")
+                                success = db_write(
+                                    get_repos().recipients.add, recipient_id, fname, lname, address, gender, age, blood_group,
+                                    contact
+                                )
+                            
+                                if success:
+                                    st.success(f"Recipient added successfully! New ID: {recipient_id}")
+                                    st.balloons()
+                                    get_search_index("recipients").add(recipient_id, f"{fname} {lname}", blood_group, contact)
+                                    invalidate_caches()
+                                else:
+                                    st.error("Failed to add recipient.")
 
-    # =========================================================
-    # =================== DONATIONS PAGE ======================
-    # =========================================================
-    elif page == "Donations":
-        st.markdown("### Donation Management")
+            with tab3:
+                render_recipient_search()
+
+            with tab4:
+                render_import_tab("recipients")
+
+        # =========================================================
+        # =================== DONATIONS PAGE ======================
+        # =========================================================
+        elif page == "Donations":
+            st.markdown("### Donation Management")
         
-        tab1, tab2 = st.tabs(["View Donations", "Record Donation"])
+            tab1, tab2, tab3 = st.tabs(["View Donations", "Record Donation", "Import Donations"])
         
-        with tab1:
-            donations = execute_query("""
-                SELECT d.Donation_ID, CONCAT(don.F_name, ' ', don.L_name) as Donor, 
-                    don.Blood_Group, h.Name as Hospital, d.Quantity, d.Donation_date
-                FROM Donation d
-                JOIN Donor don ON d.Donor_ID = don.Donor_ID
-                JOIN Hospital h ON d.Hospital_ID = h.Hospital_ID
-                ORDER BY d.Donation_date DESC
-            """)
-            
-            if donations:
-                df_donations = pd.DataFrame(donations, 
-                                            columns=['ID', 'Donor', 'Blood Group', 'Hospital', 'Quantity (ml)', 'Date'])
-                st.dataframe(df_donations, use_container_width=True, hide_index=True)
-            else:
-                st.info("No donations found.")
+            with tab1:
+                render_paginated_listing(DONATIONS, ['ID', 'Donor', 'Blood Group', 'Hospital', 'Quantity (ml)', 'Date'],
+                                         "No donations found.")
 
-        with tab2:
-            st.markdown("#### Record New Donation")
+            with tab2:
+                st.markdown("#### Record New Donation")
             
-            donors_dict = fetch_donors_list()
-            hospitals_dict = fetch_hospitals_list()
+                donors_dict = fetch_donors_list()
+                hospitals_dict = fetch_hospitals_list()
             
-            if not donors_dict or not hospitals_dict:
-                st.warning("Please add at least one Donor and one Hospital.")
-            else:
-                with st.form("add_donation_form"):
-                    col1, col2 = st.columns(2)
+                if not donors_dict or not hospitals_dict:
+                    st.warning("Please add at least one Donor and one Hospital.")
+                else:
+                    with st.form("add_donation_form"):
+                        col1, col2 = st.columns(2)
                     
-                    with col1:
-                        donor_name = st.selectbox("Select Donor", options=donors_dict.keys())
-                        hospital_name = st.selectbox("Select Hospital", options=hospitals_dict.keys())
+                        with col1:
+                            donor_name = st.selectbox("Select Donor", options=donors_dict.keys())
+                            hospital_name = st.selectbox("Select Hospital", options=hospitals_dict.keys())
                     
-                    with col2:
-                        quantity = st.number_input("Quantity (ml)", min_value=100, max_value=500, value=450, step=50)
-                        donation_date = st.date_input("Donation Date", value=date.today())
+                        with col2:
+                            quantity = st.number_input("Quantity (ml)", min_value=100, max_value=500, value=450, step=50)
+                            donation_date = st.date_input("Donation Date", value=date.today())
                     
-                    submitted = st.form_submit_button("Record Donation", type="primary", use_container_width=True)
+                        submitted = st.form_submit_button("Record Donation", type="primary", use_container_width=True)
                     
-                    if submitted:
-                        if not donor_name or not hospital_name:
-                            st.warning("Please fill all required fields.")
-                        else:
-                            donation_id = get_next_id("DON", "Donation", "Donation_ID")
-                            if not donation_id:
-                                st.error("Could not generate Donation ID.")
+                        if submitted:
+                            if not donor_name or not hospital_name:
+                                st.warning("Please fill all required fields.")
                             else:
-                                donor_id = donors_dict[donor_name]
-                                hospital_id = hospitals_dict[hospital_name]
+                                donation_id = get_next_id("DON", "Donation", "Donation_ID")
+                                if not donation_id:
+                                    st.error("Could not generate Donation ID.")
+                                else:
+                                    donor_id = donors_dict[donor_name]
+                                    hospital_id = hospitals_dict[hospital_name]
                                 
-                                success = execute_query("""
-                                    INSERT INTO Donation (Donation_ID, Hospital_ID, Donor_ID, Quantity, Donation_date)
-                                    VALUES (%s, %s, %s, %s, %s)
-                                """, (donation_id, hospital_id, donor_id, quantity, donation_date), fetch=False)
+                                    success = record_donation(donation_id, hospital_id, donor_id, quantity, donation_date)
                                 
-                                if success:
-                                    st.success(f"Donation recorded successfully! New ID: {donation_id}")
-                                    st.balloons()
-                                    st.cache_data.clear()
-                                else:
-                                    st.error("Failed to record donation.")
-
-    # =========================================================
-    # ==================== REQUESTS PAGE ======================
-    # =========================================================
-    elif page == "Requests":
-        st.markdown("### Blood Request Management")
+                                    if success:
+                                        st.success(f"Donation recorded successfully! New ID: {donation_id}")
+                                        st.balloons()
+                                        invalidate_caches()
+                                    elif success is False:
+                                        st.error("Failed to record donation.")
+
+            with tab3:
+                render_import_tab("donations")
+
+        # =========================================================
+        # ==================== REQUESTS PAGE ======================
+        # =========================================================
+        elif page == "Requests":
+            st.markdown("### Blood Request Management")
         
-        tab1, tab2, tab3 = st.tabs(["View Requests", "New Request", "Update Status"])
+            tab1, tab2, tab3, tab4 = st.tabs(["View Requests", "New Request", "Update Status", "Suggest Allocations"])
         
-        with tab1:
-            requests = execute_query("""
-                SELECT r.Request_ID, CONCAT(rec.F_name, ' ', rec.L_name) as Recipient,
-                    h.Name as Hospital, r.Blood_Group, r.Quantity, r.Status, r.Request_date
-                FROM Request r
-                JOIN Recipient rec ON r.Recipient_ID = rec.Recipient_ID
-                JOIN Hospital h ON r.Hospital_ID = h.Hospital_ID
-                ORDER BY r.Request_date DESC
-            """)
-            
-            if requests:
-                df_requests = pd.DataFrame(requests, 
-                                        columns=['ID', 'Recipient', 'Hospital', 'Blood Group', 'Quantity (ml)', 'Status', 'Date'])
-                st.dataframe(df_requests, use_container_width=True, hide_index=True)
-            else:
-                st.info("No requests found.")
+            with tab1:
+                render_paginated_listing(REQUESTS, ['ID', 'Recipient', 'Hospital', 'Blood Group', 'Quantity (ml)', 'Status', 'Date'],
+                                         "No requests found.")
 
-        with tab2:
-            st.markdown("#### Create New Blood Request")
+            with tab2:
+                st.markdown("#### Create New Blood Request")
             
-            recipients_dict = fetch_recipients_list()
-            hospitals_dict = fetch_hospitals_list()
+                recipients_dict = fetch_recipients_list()
+                hospitals_dict = fetch_hospitals_list()
             
-            if not recipients_dict or not hospitals_dict:
-                st.warning("Please add at least one Recipient and one Hospital.")
-            else:
-                with st.form("add_request_form"):
-                    col1, col2 = st.columns(2)
+                if not recipients_dict or not hospitals_dict:
+                    st.warning("Please add at least one Recipient and one Hospital.")
+                else:
+                    with st.form("add_request_form"):
+                        col1, col2 = st.columns(2)
                     
-                    with col1:
-                        recipient_name = st.selectbox("Select Recipient", options=recipients_dict.keys())
-                        hospital_name = st.selectbox("Select Hospital", options=hospitals_dict.keys())
+                        with col1:
+                            recipient_name = st.selectbox("Select Recipient", options=recipients_dict.keys())
+                            hospital_name = st.selectbox("Select Hospital", options=hospitals_dict.keys())
                     
-                    with col2:
-                        blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
-                        quantity = st.number_input("Quantity (ml)", min_value=100, max_value=2000, value=500, step=100)
-                        request_date = st.date_input("Request Date", value=date.today())
+                        with col2:
+                            blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"])
+                            quantity = st.number_input("Quantity (ml)", min_value=100, max_value=2000, value=500, step=100)
+                            request_date = st.date_input("Request Date", value=date.today())
                     
-                    submitted = st.form_submit_button("Submit Request", type="primary", use_container_width=True)
+                        submitted = st.form_submit_button("Submit Request", type="primary", use_container_width=True)
                     
-                    if submitted:
-                        if not recipient_name or not hospital_name:
-                            st.warning("Please fill all required fields.")
-                        else:
-                            request_id = get_next_id("REQ", "Request", "Request_ID")
-                            if not request_id:
-                                st.error("Could not generate Request ID.")
+                        if submitted:
+                            if not recipient_name or not hospital_name:
+                                st.warning("Please fill all required fields.")
                             else:
-                                recipient_id = recipients_dict[recipient_name]
-                                hospital_id = hospitals_dict[hospital_name]
+                                request_id = get_next_id("REQ", "Request", "Request_ID")
+                                if not request_id:
+                                    st.error("Could not generate Request ID.")
+                                else:
+                                    recipient_id = recipients_dict[recipient_name]
+                                    hospital_id = hospitals_dict[hospital_name]
                                 
-                                success = execute_query("""
-                                    INSERT INTO Request (Request_ID, Hospital_ID, Recipient_ID, Status, Quantity, Blood_Group, Request_date)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                                """, (request_id, hospital_id, recipient_id, 'Pending', quantity, blood_group, request_date), fetch=False)
+                                    success = db_write(
+                                        get_repos().requests.create, request_id, hospital_id, recipient_id, quantity,
+                                        blood_group, request_date
+                                    )
                                 
-                                if success:
-                                    st.success(f"Request submitted successfully! New ID: {request_id}")
-                                    st.balloons()
-                                    st.cache_data.clear()
-                                else:
-                                    st.error("Failed to submit request.")
+                                    if success:
+                                        st.success(f"Request submitted successfully! New ID: {request_id}")
+                                        st.balloons()
+                                        invalidate_caches()
+                                    else:
+                                        st.error("Failed to submit request.")
                                 
-        with tab3:
-            st.markdown("#### Update Request Status")
+            with tab3:
+                st.markdown("#### Update Request Status")
             
-            pending_requests = execute_query("SELECT Request_ID FROM Request WHERE Status = 'Pending' ORDER BY Request_ID")
+                pending_request_ids = db_call(get_repos().requests.pending_ids)
             
-            if pending_requests:
-                pending_request_ids = [req[0] for req in pending_requests]
+                if pending_request_ids:
                 
-                with st.form("update_request_form"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        request_to_update = st.selectbox("Select Pending Request ID", pending_request_ids)
-                    with col2:
-                        new_status = st.selectbox("New Status", ["Fulfilled", "Cancelled"])
+                    with st.form("update_request_form"):
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            request_to_update = st.selectbox("Select Pending Request ID", pending_request_ids)
+                        with col2:
+                            new_status = st.selectbox("New Status", ["Fulfilled", "Cancelled"])
+                        with col3:
+                            source_choice = st.selectbox("Take stock from", [SUGGESTED_SOURCE] + BLOOD_GROUPS,
+                                                         help="Blood group debited when the request is fulfilled. "
+                                                              "Suggested follows the Suggest Allocations tab, "
+                                                              "falling back to the requested group.")
                     
-                    update_btn = st.form_submit_button("Update Status", type="primary", use_container_width=True)
+                        update_btn = st.form_submit_button("Update Status", type="primary", use_container_width=True)
                     
-                    if update_btn:
-                        success = execute_query("UPDATE Request SET Status = %s WHERE Request_ID = %s", (new_status, request_to_update), fetch=False)
-                        if success:
-                            st.success(f"Request {request_to_update} status updated to {new_status}.")
-                            st.rerun()
-                        else:
-                            st.error("Failed to update status.")
-            else:
-                st.info("No pending requests to update.")
+                        if update_btn:
+                            success = update_request_status(request_to_update, new_status, source_choice)
+                            if success:
+                                st.success(f"Request {request_to_update} status updated to {new_status}.")
+                                invalidate_caches()
+                                st.rerun()
+                            elif success is False:
+                                st.error("Failed to update status.")
+                else:
+                    st.info("No pending requests to update.")
 
-    # =========================================================
-    # =================== HOSPITALS PAGE ======================
-    # =========================================================
-    elif page == "Hospitals":
-        st.markdown("### Hospital Management")
+            with tab4:
+                st.markdown("#### Suggested Allocations")
+                st.caption("Pending requests are matched oldest first against current net stock using ABO/Rh compatibility. "
+                           "Exact matches are preferred and O- is only used when nothing else fits.")
+            
+                try:
+                    suggestions, leftover, match_ms = suggest_allocations(get_pool())
+                except Error as e:
+                    st.error(f"Database error: {e}")
+                    suggestions = None
+            
+                if suggestions is None:
+                    pass
+                elif suggestions.empty:
+                    st.info("No pending requests to match.")
+                else:
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("Pending", len(suggestions))
+                    col2.metric("Fulfillable", int(suggestions['Fulfillable'].sum()))
+                    col3.metric("Allocated (ml)", f"{int(leftover['Allocated (ml)'].sum()):,}")
+                    col4.metric("Match Time", f"{match_ms:.1f} ms")
+                
+                    st.dataframe(suggestions, use_container_width=True, hide_index=True)
+                    st.markdown("#### Stock After Suggested Allocations")
+                    st.dataframe(leftover, use_container_width=True, hide_index=True)
+
+        # =========================================================
+        # =================== HOSPITALS PAGE ======================
+        # =========================================================
+        elif page == "Hospitals":
+            st.markdown("### Hospital Management")
         
-        st.info("To add a new hospital, please log out and use the 'Register New Hospital' tab on the login page.")
+            st.info("To add a new hospital, please log out and use the 'Register New Hospital' tab on the login page.")
         
-        hospitals = execute_query("""
-            SELECT h.Hospital_ID, h.Name, h.Address,
-                   GROUP_CONCAT(DISTINCT hc.Contact SEPARATOR ', ') as Contacts,
-                   GROUP_CONCAT(DISTINCT he.Email SEPARATOR ', ') as Emails
-            FROM Hospital h
-            LEFT JOIN Hospital_Contact hc ON h.Hospital_ID = hc.Hospital_ID
-            LEFT JOIN Hospital_Email he ON h.Hospital_ID = he.Hospital_ID
-            GROUP BY h.Hospital_ID
-            ORDER BY h.Name
-        """)
+            hospitals = db_call(get_repos().hospitals.directory)
         
-        if hospitals:
-            df_hospitals = pd.DataFrame(hospitals, columns=['ID', 'Name', 'Address', 'Contacts', 'Emails'])
-            st.dataframe(df_hospitals, use_container_width=True, hide_index=True)
-        else:
-            st.info("No hospitals found in the database.")
-
-    # =========================================================
-    # =================== ANALYTICS PAGE ======================
-    # =========================================================
-    elif page == "Analytics":
-        st.markdown("### Advanced Analytics")
+            if hospitals:
+                df_hospitals = pd.DataFrame(hospitals, columns=['ID', 'Name', 'Address', 'Contacts', 'Emails'])
+                st.dataframe(df_hospitals, use_container_width=True, hide_index=True)
+                render_export_button("hospitals", HOSPITAL_DIRECTORY_QUERY, ['ID', 'Name', 'Address', 'Contacts', 'Emails'])
+            else:
+                st.info("No hospitals found in the database.")
+
+        # =========================================================
+        # =================== ANALYTICS PAGE ======================
+        # =========================================================
+        elif page == "Analytics":
+            st.markdown("### Advanced Analytics")
+            warm_loaders(analytics_loaders())
         
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.markdown("#### Blood Stock (Donated vs Fulfilled)")
-            
-            donated_q = """
-                SELECT d.Blood_Group, SUM(don.Quantity) as TotalDonated
-                FROM Donor d
-                JOIN Donation don ON d.Donor_ID = don.Donor_ID
-                GROUP BY d.Blood_Group
-            """
-            donated_data = execute_query(donated_q)
-            
-            fulfilled_q = """
-                SELECT Blood_Group, SUM(Quantity) as TotalFulfilled
-                FROM Request
-                WHERE Status = 'Fulfilled'
-                GROUP BY Blood_Group
-            """
-            fulfilled_data = execute_query(fulfilled_q)
-            
-            if donated_data:
-                df_donated = pd.DataFrame(donated_data, columns=['Blood Group', 'Donated'])
-                
-                if fulfilled_data:
-                    df_fulfilled = pd.DataFrame(fulfilled_data, columns=['Blood Group', 'Fulfilled'])
-                    df_stock = pd.merge(df_donated, df_fulfilled, on='Blood Group', how='outer').fillna(0)
-                else:
-                    df_stock = df_donated.copy()
-                    df_stock['Fulfilled'] = 0
-                    
-                df_stock['Net Stock'] = df_stock['Donated'] - df_stock['Fulfilled']
-                
-                fig = go.Figure()
-                fig.add_trace(go.Bar(
-                    x=df_stock['Blood Group'],
-                    y=df_stock['Donated'],
-                    name='Total Donated',
-                    marker_color='#c62828'
-                ))
-                fig.add_trace(go.Bar(
-                    x=df_stock['Blood Group'],
-                    y=df_stock['Fulfilled'],
-                    name='Total Fulfilled',
-                    marker_color='#ef9a9a'
-                ))
-                
-                fig.update_layout(
-                    barmode='group',
-                    title='Donations vs Fulfilled Requests',
-                    xaxis_title='Blood Group',
-                    yaxis_title='Quantity (ml)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    height=400,
-                    legend_title_text='Metric'
+            with col1:
+                render_analytics_stock()
+
+            with col2:
+                render_analytics_activity()
+
+            st.markdown("<hr>", unsafe_allow_html=True)
+        
+            render_analytics_ages()
+
+            with st.expander("Export Analytics Data"):
+                st.markdown("**Blood Stock by Group**")
+                render_export_button("blood_stock", STOCK_BY_GROUP_QUERY, ['Blood Group', 'Donated', 'Fulfilled', 'Net Stock'])
+                st.markdown("**Hospital Activity**")
+                render_export_button("hospital_activity", HOSPITAL_ACTIVITY_QUERY, ['Hospital', 'Donations', 'Requests'])
+                st.markdown("**Donor Ages**")
+                render_export_button("donor_ages", DONOR_AGES_QUERY, ['Age'])
+                st.markdown("**Recipient Ages**")
+                render_export_button("recipient_ages", RECIPIENT_AGES_QUERY, ['Age'])
+
+        # =========================================================
+        # ================== PERFORMANCE PAGE =====================
+        # =========================================================
+        elif page == "Performance":
+            st.markdown("### Query Performance")
+            st.caption("Statements are grouped by fingerprint: literals and parameters are replaced by `?`.")
+
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                order_by = st.selectbox("Order by", ["p95_ms", "p99_ms", "total_ms", "avg_ms", "max_ms", "calls", "avg_acquire_ms"])
+            with col2:
+                top_n = st.number_input("Top N", min_value=5, max_value=100, value=15, step=5)
+
+            all_queries = QUERY_METRICS.top(None, by=order_by)
+            top_queries = all_queries[:int(top_n)]
+            pool_stats = get_pool().metrics.snapshot()
+
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Fingerprints", len(all_queries))
+            col2.metric("Statements Run", sum(q['calls'] for q in all_queries))
+            col3.metric("Avg Connection Wait", f"{pool_stats['avg_wait_ms']:.1f} ms")
+            col4.metric("Pool Timeouts", pool_stats['timeouts'])
+
+            if top_queries:
+                df_queries = pd.DataFrame(top_queries)
+                st.dataframe(
+                    df_queries[['fingerprint', 'calls', 'errors', 'avg_rows', 'p50_ms', 'p95_ms', 'p99_ms',
+                                'max_ms', 'total_ms', 'avg_acquire_ms']].round(2),
+                    use_container_width=True, hide_index=True
                 )
+
+                st.markdown("#### Statement Detail")
+                selected = st.selectbox("Statement", range(len(top_queries)),
+                                        format_func=lambda i: top_queries[i]['fingerprint'][:120])
+                detail = top_queries[selected]
+                st.code(detail['fingerprint'], language="sql")
+                df_hist = pd.DataFrame({
+                    'Latency (ms)': [f"<= {b:g}" if b != float('inf') else f"> {LATENCY_BUCKETS_MS[-2]:g}" for b in LATENCY_BUCKETS_MS],
+                    'Calls': list(detail['histogram'].values()),
+                })
+                fig = px.bar(df_hist, x='Latency (ms)', y='Calls', color_discrete_sequence=['#d32f2f'])
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', height=300)
                 st.plotly_chart(fig, use_container_width=True)
+
+                if st.button("Run EXPLAIN on slowest call", key="perf_explain"):
+                    sample = QUERY_METRICS.sample(detail['fingerprint'])
+                    try:
+                        plan_columns, plan_rows = explain(get_pool(), *sample)
+                        st.dataframe(pd.DataFrame(plan_rows, columns=plan_columns), use_container_width=True, hide_index=True)
+                    except ValueError as e:
+                        st.warning(str(e))
+                    except Error as e:
+                        st.error(f"Database error: {e}")
             else:
-                st.info("No donation data for stock analysis.")
+                st.info("No queries recorded yet.")
 
-        with col2:
-            st.markdown("#### Hospital Activity")
-            
-            activity_q = """
-                SELECT 
-                    h.Name,
-                    COUNT(DISTINCT d.Donation_ID) as TotalDonations,
-                    COUNT(DISTINCT r.Request_ID) as TotalRequests
-                FROM Hospital h
-                LEFT JOIN Donation d ON h.Hospital_ID = d.Hospital_ID
-                LEFT JOIN Request r ON h.Hospital_ID = r.Hospital_ID
-                GROUP BY h.Name
-                ORDER BY TotalDonations DESC, TotalRequests DESC
-            """
-            activity_data = execute_query(activity_q)
-            
-            if activity_data:
-                df_activity = pd.DataFrame(activity_data, columns=['Hospital', 'Donations', 'Requests'])
-                
-                fig = px.bar(df_activity.melt(id_vars='Hospital'), 
-                            x='Hospital', y='value', color='variable',
-                            title='Donations and Requests by Hospital',
-                            color_discrete_map={'Donations': '#d32f2f', 'Requests': '#ffcdd2'},
-                            barmode='group')
-                
-                fig.update_layout(
-                    xaxis_title='Hospital',
-                    yaxis_title='Count',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    height=400,
-                    legend_title_text='Activity'
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            st.markdown("#### Queries per Page Render")
+            renders = QUERY_METRICS.renders()
+            if renders:
+                st.dataframe(pd.DataFrame(renders).round(2), use_container_width=True, hide_index=True)
             else:
-                st.info("No hospital activity data available.")
+                st.info("No page renders recorded yet.")
+
+            st.markdown("#### Fragment Runs")
+            st.caption("A fragment reruns on its own when one of its widgets changes; runs with the full page count too.")
+            fragments = QUERY_METRICS.fragments()
+            if fragments:
+                st.dataframe(pd.DataFrame(fragments).rename(columns={'page': 'fragment'}).round(2),
+                             use_container_width=True, hide_index=True)
+            else:
+                st.info("No fragment runs recorded yet.")
+
+            st.markdown("#### Chart Figures")
+            chart_stats = FIGURE_CACHE.stats()
+            st.caption(f"{chart_stats['entries']} cached figures ({chart_stats['json_bytes'] / 1024:.0f} KiB JSON), "
+                       f"{chart_stats['hits']} hits, {chart_stats['misses']} builds averaging {chart_stats['avg_build_ms']:.1f} ms. "
+                       "A figure is rebuilt only when its chart data changes.")
+
+            st.markdown("#### Index Check")
+            st.caption("EXPLAINs every hot query and lists tables read without an index.")
+            if st.button("Check Indexes"):
+                try:
+                    index_report = pd.DataFrame(
+                        [(name, ", ".join(scans) or "-", "Full scan" if scans else "Indexed") for name, scans in check_indexes(get_pool())],
+                        columns=['Query', 'Scanned Tables', 'Result']
+                    )
+                    st.dataframe(index_report, use_container_width=True, hide_index=True)
+                except Error as e:
+                    st.error(f"Database error: {e}")
 
-        st.markdown("<hr>", unsafe_allow_html=True)
-        
-        st.markdown("#### Age Distribution")
-        donor_ages = execute_query("SELECT Age FROM Donor")
-        recipient_ages = execute_query("SELECT Age FROM Recipient")
-        
-        if donor_ages or recipient_ages:
-            fig = go.Figure()
-            
-            if donor_ages:
-                df_donor_age = pd.DataFrame(donor_ages, columns=['Age'])
-                fig.add_trace(go.Histogram(
-                    x=df_donor_age['Age'],
-                    name='Donors',
-                    marker_color='#b71c1c',
-                    opacity=0.75
-                ))
-            
-            if recipient_ages:
-                df_recipient_age = pd.DataFrame(recipient_ages, columns=['Age'])
-                fig.add_trace(go.Histogram(
-                    x=df_recipient_age['Age'],
-                    name='Recipients',
-                    marker_color='#ffcdd2',
-                    opacity=0.75
-                ))
-            
-            fig.update_layout(
-                barmode='overlay',
-                title='Donor and Recipient Age Distribution',
-                xaxis_title='Age',
-                yaxis_title='Count',
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                height=400  
-            )
-            fig.update_traces(opacity=0.75)
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No age data available for analysis.")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("Download Metrics (JSON)", QUERY_METRICS.to_json,
+                                   file_name="query_metrics.json", mime="application/json")
+            with col2:
+                if st.button("Reset Metrics"):
+                    QUERY_METRICS.reset()
+                    st.rerun()
+    finally:
+        QUERY_METRICS.finish_render()
 
     # ====================
     # FOOTER
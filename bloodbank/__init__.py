@@ -0,0 +1,3 @@
+"""Shared, Streamlit-free building blocks for the Community Blood Bank app."""
+
+BLOOD_GROUPS = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
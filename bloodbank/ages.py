@@ -0,0 +1,79 @@
+"""Donor ages derived from date of birth.
+
+Donor.Age is filled from DOB when a donor is added and goes stale on every
+birthday. Result sets that carry DOB get their ages computed at read time
+by with_ages(), which does the date arithmetic for the whole page in NumPy.
+Aggregates and the stored procedure still read the Age column, so
+refresh_ages() walks Donor in keyset chunks and rewrites only the ages
+that changed, one bulk UPDATE per chunk. Run it nightly:
+
+    python -m bloodbank.ages refresh
+"""
+import argparse
+import os
+import time
+from datetime import date
+
+import numpy as np
+
+from bloodbank.db import ConnectionPool, fetch_all, transaction, update_by_key
+
+AGE_REFRESH_CHUNK = int(os.environ.get('BLOODBANK_AGE_REFRESH_CHUNK', '5000'))
+
+
+def ages_on(dobs, today=None):
+    """Whole-year ages on `today` for a sequence or Series of dates, as an int array"""
+    today = today or date.today()
+    dob = np.asarray(dobs, dtype='datetime64[D]')
+    months = dob.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]').astype(int) + 1970
+    month = months.astype(int) % 12 + 1
+    day = (dob - months).astype(int) + 1
+    birthday_pending = (month > today.month) | ((month == today.month) & (day > today.day))
+    return today.year - years - birthday_pending
+
+
+def with_ages(rows, dob_index, today=None):
+    """Rows with the DOB at `dob_index` replaced by the age it gives on `today` (None without a DOB)"""
+    if not rows:
+        return rows
+    ages = ages_on([row[dob_index] for row in rows], today).tolist()
+    return [row[:dob_index] + (None if row[dob_index] is None else age,) + row[dob_index + 1:]
+            for row, age in zip(rows, ages)]
+
+
+def refresh_ages(pool, today=None, chunk_size=AGE_REFRESH_CHUNK):
+    """Rewrite stale Donor.Age values in chunks; returns the number of donors updated"""
+    today = today or date.today()
+    updated = 0
+    last_id = ''
+    while True:
+        rows = fetch_all(pool, """
+            SELECT Donor_ID, DOB, Age FROM Donor
+            WHERE Donor_ID > %s AND DOB IS NOT NULL
+            ORDER BY Donor_ID LIMIT %s
+        """, (last_id, chunk_size))
+        if not rows:
+            return updated
+        last_id = rows[-1][0]
+        ages = ages_on([row[1] for row in rows], today)
+        stale = [(row[0], int(age)) for row, age in zip(rows, ages) if row[2] != age]
+        if stale:
+            with transaction(pool) as cursor:
+                update_by_key(cursor, 'Donor', 'Donor_ID', 'Age', stale)
+            updated += len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Donor age maintenance")
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--chunk-size", type=int, default=AGE_REFRESH_CHUNK)
+    args = parser.parse_args()
+    pool = ConnectionPool(size=1)
+    start = time.perf_counter()
+    updated = refresh_ages(pool, chunk_size=args.chunk_size)
+    print(f"Updated {updated} donor ages in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
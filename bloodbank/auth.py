@@ -0,0 +1,193 @@
+"""Login verification off the script thread, with hash upgrades and throttling.
+
+Password hashing is deliberately slow, so AuthService runs every hash and
+verify on a small shared thread pool. At most AUTH_WORKERS hashes run at
+once and at most AUTH_QUEUE_DEPTH more wait; beyond that logins are
+refused with AuthBusy instead of queueing without bound. A burst of
+logins therefore cannot occupy every core.
+
+New hashes use pbkdf2_sha256 (hashlib, GIL released). The older
+sha256_crypt and bcrypt hashes are still accepted but are deprecated, so
+passlib's needs_update flags them and a successful login stores a new
+hash. Failed logins are counted per username and per client address by
+RateLimiter; once either key has too many failures in the window, logins
+for it are refused with LoginThrottled until the window passes.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from passlib.context import CryptContext
+
+AUTH_WORKERS = int(os.environ.get('BLOODBANK_AUTH_WORKERS', '2'))
+AUTH_QUEUE_DEPTH = int(os.environ.get('BLOODBANK_AUTH_QUEUE_DEPTH', '16'))
+AUTH_TIMEOUT = float(os.environ.get('BLOODBANK_AUTH_TIMEOUT', '10'))
+PBKDF2_ROUNDS = int(os.environ.get('BLOODBANK_PBKDF2_ROUNDS', '200000'))
+MAX_USER_FAILURES = int(os.environ.get('BLOODBANK_LOGIN_MAX_USER_FAILURES', '5'))
+MAX_ADDRESS_FAILURES = int(os.environ.get('BLOODBANK_LOGIN_MAX_ADDRESS_FAILURES', '20'))
+FAILURE_WINDOW = float(os.environ.get('BLOODBANK_LOGIN_FAILURE_WINDOW', '300'))
+# Successful verifications remembered so a repeat login skips the slow hash
+VERIFIED_TTL = float(os.environ.get('BLOODBANK_AUTH_VERIFIED_TTL', '300'))
+
+PASSWORD_CONTEXT = CryptContext(
+    schemes=["pbkdf2_sha256", "sha256_crypt", "bcrypt"],
+    deprecated=["sha256_crypt", "bcrypt"],
+    pbkdf2_sha256__rounds=PBKDF2_ROUNDS,
+)
+
+
+class AuthBusy(Exception):
+    """Too many password hashes are already running or queued"""
+
+
+class LoginThrottled(Exception):
+    """Too many recent failures for this username or address"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed logins; try again in {int(retry_after) + 1} s")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Sliding-window failure counter per key, holding at most `max_keys` keys"""
+
+    def __init__(self, max_failures, window=FAILURE_WINDOW, max_keys=10000):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and now - failures[0] >= self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, key):
+        """Seconds until `key` may try again; 0 when it is not blocked"""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(key, now)
+            if failures is None or len(failures) < self.max_failures:
+                return 0
+            return failures[-self.max_failures] + self.window - now
+
+    def failure(self, key):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(key, now)
+            if failures is None:
+                failures = self._failures[key] = deque(maxlen=self.max_failures)
+            failures.append(now)
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+class AuthService:
+    """Authenticates users against UserRepo credentials"""
+
+    def __init__(self, users, context=PASSWORD_CONTEXT, workers=AUTH_WORKERS,
+                 queue_depth=AUTH_QUEUE_DEPTH, timeout=AUTH_TIMEOUT):
+        self.users = users
+        self.context = context
+        self.timeout = timeout
+        self.user_limiter = RateLimiter(MAX_USER_FAILURES)
+        self.address_limiter = RateLimiter(MAX_ADDRESS_FAILURES)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth")
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._key = secrets.token_bytes(32)
+        self._verified = OrderedDict()
+        self._verified_lock = threading.Lock()
+        # Verified for unknown usernames so they cost the same as wrong passwords
+        self._dummy_hash = context.hash(secrets.token_hex(16))
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy("The server is busy verifying other logins; please retry")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the job ends, not until the caller gives up waiting,
+        # so timed-out hashes still count against the queue depth
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise AuthBusy("Password verification timed out; please retry")
+
+    def hash(self, password):
+        """Hash a new password with the default scheme"""
+        return self._run(self.context.hash, password)
+
+    def _fingerprint(self, password, hashed):
+        return hmac.new(self._key, f"{hashed}\0{password}".encode(), hashlib.sha256).digest()
+
+    def _recently_verified(self, fingerprint):
+        with self._verified_lock:
+            expires = self._verified.get(fingerprint)
+            if expires is None or expires < time.monotonic():
+                self._verified.pop(fingerprint, None)
+                return False
+            return True
+
+    def _remember(self, fingerprint):
+        with self._verified_lock:
+            self._verified[fingerprint] = time.monotonic() + VERIFIED_TTL
+            self._verified.move_to_end(fingerprint)
+            while len(self._verified) > 1024:
+                self._verified.popitem(last=False)
+
+    def _verify(self, password, hashed):
+        """(valid, replacement hash or None); malformed hashes count as invalid"""
+        try:
+            return self.context.verify_and_update(password, hashed)
+        except (ValueError, TypeError):
+            return False, None
+
+    def authenticate(self, username, password, address=None):
+        """The user's Credentials, or None for a wrong username or password.
+
+        Raises LoginThrottled, AuthBusy, or the database Error from UserRepo.
+        """
+        keys = [(self.user_limiter, username)] + ([(self.address_limiter, address)] if address else [])
+        retry_after = max(limiter.retry_after(key) for limiter, key in keys)
+        if retry_after:
+            raise LoginThrottled(retry_after)
+
+        user = self.users.credentials(username)
+        hashed = user.password_hash if user else self._dummy_hash
+        fingerprint = self._fingerprint(password, hashed)
+        if user and self._recently_verified(fingerprint):
+            return user
+
+        valid, new_hash = self._run(self._verify, password, hashed)
+        if not (user and valid):
+            for limiter, key in keys:
+                limiter.failure(key)
+            return None
+
+        self.user_limiter.reset(username)
+        if new_hash:
+            self.users.update_password(user.user_id, new_hash)
+            user = user._replace(password_hash=new_hash)
+            fingerprint = self._fingerprint(password, new_hash)
+        self._remember(fingerprint)
+        return user
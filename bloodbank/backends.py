@@ -0,0 +1,287 @@
+"""Storage backends: MySQL (the default) and embedded SQLite.
+
+SQL throughout the package is written in MySQL syntax with `%s`
+placeholders. A backend knows how to open connections and cursors for its
+driver, and its dialect turns that SQL into what the engine understands.
+MySQL statements pass through untouched. For SQLite, placeholders,
+GROUP_CONCAT ... SEPARATOR, CONCAT, DATE_FORMAT, INSERT IGNORE,
+ON DUPLICATE KEY UPDATE and FOR UPDATE are rewritten once per statement
+text. Calculate_Age and GetDonorsByBloodGroup are replaced by a Python
+function and an equivalent SELECT.
+"""
+import re
+import sqlite3
+from datetime import date, datetime
+from functools import lru_cache
+
+try:
+    import mysql.connector
+    from mysql.connector import InterfaceError, OperationalError
+except ImportError:  # only needed for the MySQL backend
+    mysql = None
+
+MYSQL_ERRORS = (mysql.connector.Error,) if mysql else ()
+
+
+# ====================
+# DIALECTS
+# ====================
+class MySQLDialect:
+    name = 'mysql'
+    explain_prefix = "EXPLAIN"
+    has_routines = True
+
+    def sql(self, query):
+        return query
+
+    def row_estimate(self, table):
+        """(query, params) returning an approximate row count without a table scan"""
+        return """
+            SELECT TABLE_ROWS FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,)
+
+    def table_exists(self, table):
+        return """
+            SELECT 1 FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,)
+
+    def column_exists(self, table, column):
+        return """
+            SELECT 1 FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """, (table, column)
+
+    def routine_exists(self, kind, name):
+        """(query, params) finding a FUNCTION or PROCEDURE of the current database"""
+        return """
+            SELECT 1 FROM information_schema.ROUTINES
+            WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_TYPE = %s AND ROUTINE_NAME = %s
+        """, (kind, name)
+
+    def index_columns(self, table):
+        """(query, params) returning (index, non_unique, position, column) rows"""
+        return """
+            SELECT INDEX_NAME, NON_UNIQUE, SEQ_IN_INDEX, COLUMN_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX
+        """, (table,)
+
+    def full_scans(self, columns, rows):
+        """Tables an EXPLAIN result reads without any index"""
+        plan = [dict(zip(columns, row)) for row in rows]
+        # <derivedN> tables are already-limited subquery results
+        return [step['table'] for step in plan
+                if step['type'] == 'ALL' and step['table'] and not step['table'].startswith('<')]
+
+
+def _split_args(text):
+    """Split a SQL argument list on top-level commas, respecting quotes"""
+    args, depth, quote, current = [], 0, None, ''
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(current.strip())
+            current = ''
+            continue
+        current += char
+    args.append(current.strip())
+    return args
+
+
+def _sqlite_group_concat(match):
+    distinct, expr, separator = match.group(1), match.group(2), match.group(3)
+    if not distinct:
+        return f"GROUP_CONCAT({expr}, {separator})"
+    # SQLite only allows DISTINCT with the default ',' separator
+    return f"REPLACE(GROUP_CONCAT(DISTINCT {expr}), ',', {separator})"
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+    explain_prefix = "EXPLAIN QUERY PLAN"
+    has_routines = False
+
+    # Stored procedures, as the SELECT they run
+    PROCEDURES = {
+        'GetDonorsByBloodGroup': """
+            SELECT Donor_ID, F_name, L_name, Age, Blood_Group
+            FROM Donor
+            WHERE Blood_Group = %s
+            ORDER BY Donor_ID
+        """,
+    }
+
+    _CALL = re.compile(r"^\s*CALL\s+(\w+)\s*\(.*\)\s*$", re.S | re.I)
+    _GROUP_CONCAT = re.compile(r"GROUP_CONCAT\(\s*(DISTINCT\s+)?([^()]+?)\s+SEPARATOR\s+('[^']*')\s*\)", re.I)
+    _CONCAT = re.compile(r"\bCONCAT\(([^()]*)\)", re.I)
+    _DATE_FORMAT = re.compile(r"\bDATE_FORMAT\(\s*([^(),]+?)\s*,\s*('[^']*')\s*\)", re.I)
+    _ON_DUPLICATE = re.compile(r"\bON DUPLICATE KEY UPDATE\b", re.I)
+    _VALUES_REF = re.compile(r"\bVALUES\((\w+)\)", re.I)
+    _FOR_UPDATE = re.compile(r"\s+FOR UPDATE\b", re.I)
+    _INSERT_IGNORE = re.compile(r"\bINSERT IGNORE\b", re.I)
+    _PLACEHOLDER = re.compile(r"(?<!%)%s")
+    _FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+    @lru_cache(maxsize=512)
+    def sql(self, query):
+        call = self._CALL.match(query)
+        if call:
+            query = self.PROCEDURES[call.group(1)]
+        query = self._GROUP_CONCAT.sub(_sqlite_group_concat, query)
+        query = self._CONCAT.sub(lambda m: "(" + " || ".join(_split_args(m.group(1))) + ")", query)
+        query = self._DATE_FORMAT.sub(r"strftime(\2, \1)", query)
+        if self._ON_DUPLICATE.search(query):
+            head, tail = self._ON_DUPLICATE.split(query, 1)
+            query = head + "ON CONFLICT DO UPDATE SET" + self._VALUES_REF.sub(r"excluded.\1", tail)
+        query = self._FOR_UPDATE.sub("", query)
+        query = self._INSERT_IGNORE.sub("INSERT OR IGNORE", query)
+        return self._PLACEHOLDER.sub("?", query)
+
+    def row_estimate(self, table):
+        # Rowids only grow, so the largest one approximates the row count in O(log n)
+        return f"SELECT MAX(rowid) FROM {table}", ()
+
+    def table_exists(self, table):
+        return "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (table,)
+
+    def column_exists(self, table, column):
+        return "SELECT 1 FROM pragma_table_info(%s) WHERE name = %s", (table, column)
+
+    def index_columns(self, table):
+        return """
+            SELECT il.name, NOT il."unique", ii.seqno + 1, ii.name
+            FROM pragma_index_list(%s) il JOIN pragma_index_info(il.name) ii
+            ORDER BY il.name, ii.seqno
+        """, (table,)
+
+    def full_scans(self, columns, rows):
+        # "SCAN t USING [COVERING] INDEX ..." walks an index; a bare "SCAN t" reads the table,
+        # unless t is a subquery (CO-ROUTINE / MATERIALIZE) whose own steps are listed too
+        details = [row[columns.index('detail')] for row in rows]
+        subqueries = {detail.split()[-1] for detail in details if detail.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+        return [match.group(1) for match in map(self._FULL_SCAN.match, details)
+                if match and match.group(1) not in subqueries]
+
+
+# ====================
+# SQLITE DRIVER GLUE
+# ====================
+def calculate_age(dob):
+    """Python stand-in for the Calculate_Age stored function"""
+    if dob is None:
+        return None
+    born = date.fromisoformat(str(dob)[:10])
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts the package's MySQL-flavoured SQL"""
+
+    def __init__(self, raw, dialect):
+        self.raw = raw
+        self.dialect = dialect
+
+    def execute(self, query, params=None):
+        self.raw.execute(self.dialect.sql(query), tuple(params) if params else ())
+
+    def executemany(self, query, seq_params):
+        self.raw.executemany(self.dialect.sql(query), seq_params)
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self.raw.description or ())
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+# ====================
+# BACKENDS
+# ====================
+class MySQLBackend:
+    dialect = MySQLDialect()
+    errors = MYSQL_ERRORS
+    disconnect_errors = (InterfaceError, OperationalError) if mysql else ()
+
+    def __init__(self, config):
+        if mysql is None:
+            raise RuntimeError("The MySQL backend needs mysql-connector-python")
+        self.config = dict(config)
+
+    def connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def cursor(self, raw, kind='buffered'):
+        """kind is 'buffered', 'stream' (unbuffered) or 'prepared' (server-side)"""
+        if kind == 'prepared':
+            return raw.cursor(prepared=True)
+        return raw.cursor(buffered=kind == 'buffered')
+
+    def begin(self, raw):
+        raw.start_transaction()
+
+    def ping(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except self.disconnect_errors:
+            return False
+
+    def finish_stream(self, raw):
+        # An abandoned unbuffered result must be drained before reuse
+        raw.consume_results()
+
+
+class SQLiteBackend:
+    """Embedded SQLite in WAL mode: readers never block the single writer"""
+
+    dialect = SQLiteDialect()
+    errors = (sqlite3.Error,)
+    disconnect_errors = ()
+
+    def __init__(self, path, busy_timeout=30):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    def connect(self):
+        raw = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES, uri=self.path.startswith('file:'),
+        )
+        raw.execute("PRAGMA journal_mode = WAL")
+        raw.execute("PRAGMA synchronous = NORMAL")
+        raw.execute("PRAGMA foreign_keys = ON")
+        raw.create_function("Calculate_Age", 1, calculate_age)
+        return raw
+
+    def cursor(self, raw, kind='buffered'):
+        # sqlite3 already caches compiled statements per connection
+        return SQLiteCursor(raw.cursor(), self.dialect)
+
+    def begin(self, raw):
+        # Take the write lock up front, which also stands in for SELECT ... FOR UPDATE
+        raw.execute("BEGIN IMMEDIATE")
+
+    def ping(self, raw):
+        return True
+
+    def finish_stream(self, raw):
+        pass
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
@@ -0,0 +1,390 @@
+"""Headless benchmark of the queries the app issues per page.
+
+    python -m bloodbank.bench generate --scale small --reset
+    python -m bloodbank.bench run --output bench_before.json
+    python -m bloodbank.bench compare bench_before.json bench_after.json
+
+`generate` fills a separate database (blood_bank_bench by default) with
+synthetic hospitals, donors, recipients, donations and requests. Blood
+groups follow a typical population distribution. `run` times every query
+in the suite, each on its own new connection pool. The first call is the
+cold timing: new connection, nothing prepared. It then repeats the query
+on that pool for warm timings and writes a JSON report. `compare` diffs two reports and exits
+non-zero when a warm median regressed past the threshold.
+"""
+import argparse
+import functools
+import json
+import platform
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from bloodbank import BLOOD_GROUPS
+from bloodbank.ages import ages_on
+from bloodbank.auth import PASSWORD_CONTEXT
+from bloodbank.backends import BACKENDS
+from bloodbank.db import DB_BACKEND, DB_CONFIG, ConnectionPool, fetch_all, transaction
+from bloodbank.eligibility import rebuild as rebuild_eligibility
+from bloodbank.ids import SEQUENCES, IdService, format_id
+from bloodbank.ledger import ensure_ledger, stock_by_group
+from bloodbank.matching import suggest_allocations
+from bloodbank.migrations import migrate
+from bloodbank.pagination import DONATIONS, DONORS, RECIPIENTS, REQUESTS, estimate_row_count
+from bloodbank.repositories import Repositories
+from bloodbank.rollups import rebuild as rebuild_rollups
+from bloodbank.schema import drop_schema
+
+BENCH_DATABASE = 'blood_bank_bench'
+INSERT_CHUNK = 10000
+
+# hospitals, donors, recipients, donations, requests
+SCALES = {
+    'tiny': (20, 1000, 500, 5000, 1000),
+    'small': (100, 10000, 5000, 50000, 10000),
+    'medium': (1000, 100000, 50000, 500000, 100000),
+    'full': (10000, 1000000, 500000, 5000000, 1000000),
+}
+
+# Share of each group in BLOOD_GROUPS order (A+, A-, B+, B-, AB+, AB-, O+, O-)
+BLOOD_GROUP_SHARES = [0.357, 0.063, 0.085, 0.015, 0.034, 0.006, 0.374, 0.066]
+REQUEST_STATUSES = (['Pending', 'Fulfilled', 'Cancelled'], [0.2, 0.65, 0.15])
+FIRST_NAMES = ['Aarav', 'Priya', 'Rahul', 'Ananya', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Meera',
+               'John', 'Mary', 'David', 'Sarah', 'James', 'Linda', 'Omar', 'Fatima', 'Chen', 'Yuki']
+LAST_NAMES = ['Sharma', 'Patel', 'Reddy', 'Iyer', 'Khan', 'Singh', 'Gupta', 'Nair', 'Das', 'Rao',
+              'Smith', 'Jones', 'Brown', 'Garcia', 'Miller', 'Wilson', 'Lee', 'Kim', 'Ali', 'Wang']
+HISTORY_DAYS = 5 * 365
+WARM_REPEATS = 5
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def bench_backend(backend, database):
+    """A MySQL database name, or for SQLite a file path ('.db' is appended to bare names)"""
+    if backend == 'sqlite':
+        return BACKENDS['sqlite'](database if database.endswith('.db') else f"{database}.db")
+    return BACKENDS['mysql'](dict(DB_CONFIG, database=database))
+
+
+def create_database(database):
+    server_config = {k: v for k, v in DB_CONFIG.items() if k != 'database'}
+    conn = BACKENDS['mysql'](server_config).connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+        cursor.close()
+    finally:
+        conn.close()
+
+
+# ====================
+# SYNTHETIC DATA
+# ====================
+def _ids(prefix, count):
+    return [format_id(prefix, n) for n in range(1, count + 1)]
+
+
+def _names(rng, count):
+    return (np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=count)],
+            np.array(LAST_NAMES, dtype=object)[rng.integers(len(LAST_NAMES), size=count)])
+
+
+def _blood_groups(rng, count):
+    return np.array(BLOOD_GROUPS, dtype=object)[rng.choice(len(BLOOD_GROUPS), size=count, p=BLOOD_GROUP_SHARES)]
+
+
+def _dates(rng, count, today, days):
+    return pd.Series(pd.Timestamp(today) - pd.to_timedelta(rng.integers(days, size=count), unit='D'))
+
+
+def _contacts(rng, count):
+    return [str(n) for n in rng.integers(6_000_000_000, 9_999_999_999, size=count)]
+
+
+def _insert(pool, query, columns, label):
+    """executemany `columns` (equal-length sequences) in INSERT_CHUNK batches"""
+    total = len(columns[0])
+    for start in range(0, total, INSERT_CHUNK):
+        stop = min(start + INSERT_CHUNK, total)
+        rows = list(zip(*(column[start:stop] for column in columns)))
+        with transaction(pool) as cursor:
+            cursor.executemany(query, rows)
+        log(f"  {label}: {stop}/{total}")
+
+
+def generate(pool, hospitals, donors, recipients, donations, requests, seed=42):
+    rng = np.random.default_rng(seed)
+    today = date.today()
+
+    hospital_ids = _ids('H', hospitals)
+    _insert(pool, "INSERT INTO Hospital (Hospital_ID, Name, Address) VALUES (%s, %s, %s)",
+            [hospital_ids, [f"Hospital {n}" for n in range(1, hospitals + 1)],
+             [f"{n} Main Road" for n in range(1, hospitals + 1)]], "hospitals")
+    _insert(pool, "INSERT INTO Hospital_Contact (Hospital_ID, Contact) VALUES (%s, %s)",
+            [hospital_ids, _contacts(rng, hospitals)], "hospital contacts")
+    _insert(pool, "INSERT INTO Hospital_Email (Hospital_ID, Email) VALUES (%s, %s)",
+            [hospital_ids, [f"{h.lower()}@hospital.example" for h in hospital_ids]], "hospital emails")
+
+    # One login per hospital; hashing is slow, so every user shares one hash
+    password_hash = PASSWORD_CONTEXT.hash("benchmark-password")
+    user_ids = _ids('U', hospitals)
+    _insert(pool, "INSERT INTO User_Login (User_ID, Username, Password, Hospital_ID) VALUES (%s, %s, %s, %s)",
+            [user_ids, [f"user{n}" for n in range(1, hospitals + 1)], [password_hash] * hospitals, hospital_ids],
+            "users")
+
+    donor_ids = _ids('D', donors)
+    first, last = _names(rng, donors)
+    dob = _dates(rng, donors, today, 47 * 365) - pd.Timedelta(days=18 * 365)
+    donor_groups = _blood_groups(rng, donors)
+    _insert(pool, """
+        INSERT INTO Donor (Donor_ID, F_name, L_name, Address, Gender, DOB, Age, Blood_Group)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, [donor_ids, first, last, [f"{n} Park Street" for n in range(donors)],
+          rng.choice(['M', 'F', 'Other'], size=donors, p=[0.49, 0.49, 0.02]).tolist(),
+          list(dob.dt.date), ages_on(dob, today).tolist(), donor_groups], "donors")
+    _insert(pool, "INSERT INTO Donor_Contact (Donor_ID, Contact) VALUES (%s, %s)",
+            [donor_ids, _contacts(rng, donors)], "donor contacts")
+
+    recipient_ids = _ids('R', recipients)
+    first, last = _names(rng, recipients)
+    recipient_groups = _blood_groups(rng, recipients)
+    _insert(pool, """
+        INSERT INTO Recipient (Recipient_ID, F_name, L_name, Address, Gender, Age, Blood_Group)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, [recipient_ids, first, last, [f"{n} Lake View" for n in range(recipients)],
+          rng.choice(['M', 'F', 'Other'], size=recipients, p=[0.49, 0.49, 0.02]).tolist(),
+          rng.integers(1, 91, size=recipients).tolist(), recipient_groups], "recipients")
+    _insert(pool, "INSERT INTO Recipient_Contact (Recipient_ID, Contact) VALUES (%s, %s)",
+            [recipient_ids, _contacts(rng, recipients)], "recipient contacts")
+
+    _insert(pool, """
+        INSERT INTO Donation (Donation_ID, Hospital_ID, Donor_ID, Quantity, Donation_date)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [_ids('DON', donations),
+          np.array(hospital_ids, dtype=object)[rng.integers(hospitals, size=donations)],
+          np.array(donor_ids, dtype=object)[rng.integers(donors, size=donations)],
+          rng.choice([350, 450], size=donations, p=[0.3, 0.7]).tolist(),
+          list(_dates(rng, donations, today, HISTORY_DAYS).dt.date)], "donations")
+
+    request_recipients = rng.integers(recipients, size=requests)
+    _insert(pool, """
+        INSERT INTO Request (Request_ID, Hospital_ID, Recipient_ID, Status, Quantity, Blood_Group, Request_date)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, [_ids('REQ', requests),
+          np.array(hospital_ids, dtype=object)[rng.integers(hospitals, size=requests)],
+          np.array(recipient_ids, dtype=object)[request_recipients],
+          rng.choice(REQUEST_STATUSES[0], size=requests, p=REQUEST_STATUSES[1]).tolist(),
+          (rng.integers(1, 11, size=requests) * 100).tolist(),
+          recipient_groups[request_recipients],
+          list(_dates(rng, requests, today, HISTORY_DAYS).dt.date)], "requests")
+
+    log("  rebuilding stock ledger")
+    ensure_ledger(pool)
+    log("  rebuilding donation and request rollups")
+    rebuild_rollups(pool)
+    log("  rebuilding donor eligibility")
+    rebuild_eligibility(pool)
+
+
+# ====================
+# BENCHMARK SUITE
+# ====================
+# listing -> (columns, ORDER BY, row -> keyset cursor) used to find a mid-listing page
+MIDDLE_CURSORS = {
+    'donors': ("Donor_ID", "Donor_ID", lambda row: (row[0],)),
+    'recipients': ("Recipient_ID", "Recipient_ID", lambda row: (row[0],)),
+    'donations': ("Donation_date, Donation_ID", "Donation_date DESC, Donation_ID DESC",
+                  lambda row: (row[0], row[0], row[1])),
+    'requests': ("Request_date, Request_ID", "Request_date DESC, Request_ID DESC",
+                 lambda row: (row[0], row[0], row[1])),
+}
+
+
+def _middle_cursor(pool, listing):
+    """Keyset cursor for the page in the middle of a listing"""
+    columns, order_by, to_cursor = MIDDLE_CURSORS[listing.name]
+    total = fetch_all(pool, f"SELECT COUNT(*) FROM {listing.table}")[0][0]
+    rows = fetch_all(pool, f"SELECT {columns} FROM {listing.table} ORDER BY {order_by} LIMIT 1 OFFSET %s",
+                     (total // 2,))
+    return to_cursor(rows[0]) if rows else None
+
+
+def middle_cursors(pool):
+    """Keyset cursor halfway through each listing, so middle-page cases need no setup queries"""
+    return {listing.name: _middle_cursor(pool, listing) for listing in (DONORS, RECIPIENTS, DONATIONS, REQUESTS)}
+
+
+def suite(pool, middles, page_size=50):
+    """(page, name, callable) for every query the app issues; nothing touches `pool` until a call"""
+    repos = Repositories(pool)
+    # IdService creates its table on construction, so it is built by the first ID call
+    ids = functools.lru_cache(maxsize=None)(lambda: IdService(pool))
+    cases = [
+        ('Dashboard', 'counts', repos.counts),
+        ('Dashboard', 'donors_by_blood_group', repos.donors.count_by_blood_group),
+        ('Dashboard', 'monthly_donations', lambda: repos.donations.monthly_counts(6)),
+        ('Dashboard', 'recent_donations', lambda: repos.donations.recent(5)),
+        ('Dashboard', 'recent_requests', lambda: repos.requests.recent(5)),
+        ('Donors', 'donor_by_id', lambda: repos.donors.get(format_id('D', 1))),
+        ('Donors', 'GetDonorsByBloodGroup', lambda: repos.donors.by_blood_group('AB-')),
+        ('Donations', 'donor_options', repos.donors.names),
+        ('Donations', 'hospital_options', repos.hospitals.names),
+        ('Requests', 'recipient_options', repos.recipients.names),
+        ('Requests', 'pending_ids', repos.requests.pending_ids),
+        ('Requests', 'suggest_allocations', lambda: suggest_allocations(pool)[0]),
+        ('Hospitals', 'directory', repos.hospitals.directory),
+        ('Analytics', 'stock_by_group', lambda: stock_by_group(pool)),
+        ('Analytics', 'hospital_activity', repos.hospitals.activity),
+        ('Analytics', 'donor_age_counts', lambda: repos.donors.age_counts(width=5)),
+        ('Analytics', 'recipient_age_counts', lambda: repos.recipients.age_counts(width=5)),
+        ('Analytics', 'donor_age_counts_by_group', lambda: repos.donors.age_counts('Blood_Group', 5)),
+        ('Login', 'credentials', lambda: repos.users.credentials('user1')),
+    ]
+    for prefix in SEQUENCES:
+        cases.append(('IDs', f'next_id_{prefix}', lambda prefix=prefix: ids().next_id(prefix)))
+
+    for listing in (DONORS, RECIPIENTS, DONATIONS, REQUESTS):
+        middle = middles[listing.name]
+        cases.append(('Listings', f'{listing.name}_first_page',
+                      lambda listing=listing: listing.fetch_page(pool, None, page_size)[0]))
+        cases.append(('Listings', f'{listing.name}_middle_page',
+                      lambda listing=listing, middle=middle: listing.fetch_page(pool, middle, page_size)[0]))
+        cases.append(('Listings', f'{listing.name}_row_estimate',
+                      lambda listing=listing: estimate_row_count(pool, listing.table)))
+    return cases
+
+
+def _time(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(backend, repeats=WARM_REPEATS):
+    setup = ConnectionPool(backend)
+    middles = middle_cursors(setup)
+    cases = len(suite(setup, middles))
+    setup.close_all()
+    results = []
+    for case in range(cases):
+        pool = ConnectionPool(backend)
+        page, name, fn = suite(pool, middles)[case]
+        cold_ms, result = _time(fn)
+        warm = sorted(_time(fn)[0] for _ in range(repeats))
+        pool.close_all()
+        rows = len(result) if isinstance(result, (list, pd.DataFrame)) else 1
+        results.append({
+            'page': page,
+            'name': name,
+            'rows': rows,
+            'cold_ms': round(cold_ms, 3),
+            'warm_min_ms': round(warm[0], 3),
+            'warm_median_ms': round(float(np.median(warm)), 3),
+            'warm_max_ms': round(warm[-1], 3),
+        })
+        log(f"  {page:<10} {name:<28} cold {cold_ms:9.2f} ms  warm {results[-1]['warm_median_ms']:9.2f} ms")
+    return results
+
+
+def table_counts(pool):
+    return {table: fetch_all(pool, f"SELECT COUNT(*) FROM {table}")[0][0]
+            for table in ('Hospital', 'Donor', 'Recipient', 'Donation', 'Request')}
+
+
+def compare(base, current, threshold):
+    """Print warm-median ratios; returns the names that regressed past `threshold`"""
+    before = {(r['page'], r['name']): r for r in base['results']}
+    regressions = []
+    print(f"{'query':<40} {'before':>10} {'after':>10} {'ratio':>7}")
+    for r in current['results']:
+        key = (r['page'], r['name'])
+        if key not in before:
+            print(f"{'/'.join(key):<40} {'-':>10} {r['warm_median_ms']:>10.2f}     new")
+            continue
+        old = before[key]['warm_median_ms']
+        ratio = r['warm_median_ms'] / old if old else float('inf')
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{'/'.join(key):<40} {old:>10.2f} {r['warm_median_ms']:>10.2f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append('/'.join(key))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blood bank query benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="fill the benchmark database with synthetic data")
+    gen.add_argument("--backend", choices=BACKENDS, default=DB_BACKEND)
+    gen.add_argument("--database", default=BENCH_DATABASE)
+    gen.add_argument("--scale", choices=SCALES, default="small")
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--reset", action="store_true", help="drop existing tables first")
+
+    bench = commands.add_parser("run", help="time every query and write a JSON report")
+    bench.add_argument("--backend", choices=BACKENDS, default=DB_BACKEND)
+    bench.add_argument("--database", default=BENCH_DATABASE)
+    bench.add_argument("--repeats", type=int, default=WARM_REPEATS)
+    bench.add_argument("--output", help="report path (default: stdout)")
+
+    cmp = commands.add_parser("compare", help="compare two reports")
+    cmp.add_argument("base")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=1.25, help="warm-median ratio counted as a regression")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(base, current, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if args.command == "generate":
+        if args.backend == 'mysql':
+            create_database(args.database)
+        pool = ConnectionPool(bench_backend(args.backend, args.database), size=2)
+        if args.reset:
+            drop_schema(pool, extra_tables=['Schema_Version', 'Blood_Stock', 'Blood_Stock_Total', 'Id_Sequence',
+                                                   'Donation_Monthly', 'Request_Monthly', 'Hospital_Activity',
+                                                   'Donor_Eligibility'])
+        migrate(pool)
+        if fetch_all(pool, "SELECT 1 FROM Donor LIMIT 1"):
+            parser.error(f"database {args.database} already has data; pass --reset to replace it")
+        log(f"Generating '{args.scale}' dataset into {args.database}")
+        start = time.perf_counter()
+        generate(pool, *SCALES[args.scale], seed=args.seed)
+        log(f"Done in {time.perf_counter() - start:.1f}s")
+        return
+
+    backend = bench_backend(args.backend, args.database)
+    pool = ConnectionPool(backend)
+    log(f"Benchmarking {args.database}")
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'backend': args.backend,
+            'database': args.database,
+            'repeats': args.repeats,
+            'python': platform.python_version(),
+            'rows': table_counts(pool),
+        },
+        'results': run(backend, args.repeats),
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Plotly figures for the Dashboard and Analytics charts, cached by their data.
+
+Building a figure with plotly express costs tens of milliseconds, mostly
+in validation, while the aggregates behind these charts rarely change
+between reruns. FigureCache keys each figure by chart kind plus a digest of
+its input rows. It stores the figure JSON together with a Figure parsed
+from it once, and hands out that parsed Figure while the data is unchanged.
+st.plotly_chart re-validates a dict on every call but only re-serializes
+a Figure, so serving the parsed object is what makes a hit cheap.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+BLOOD_GROUP_COLORS = ['#b71c1c', '#c62828', '#d32f2f', '#e53935', '#ef5350', '#e57373', '#ef9a9a', '#ffcdd2']
+TRANSPARENT = dict(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+
+
+# ====================
+# BUILDERS
+# ====================
+def blood_group_pie(rows):
+    """(blood group, count) rows"""
+    df_blood = pd.DataFrame(rows, columns=['Blood Group', 'Count'])
+    fig = px.pie(df_blood, values='Count', names='Blood Group',
+                 color_discrete_sequence=BLOOD_GROUP_COLORS, hole=0.5)
+    fig.update_traces(textposition='inside', textinfo='percent+label', textfont_size=14)
+    fig.update_layout(**TRANSPARENT, showlegend=True, height=400)
+    return fig
+
+
+def monthly_donations_bar(rows):
+    """(month, donations) rows"""
+    df_monthly = pd.DataFrame(rows, columns=['Month', 'Donations'])
+    fig = px.bar(df_monthly, x='Month', y='Donations', color='Donations',
+                 color_continuous_scale=['#ffcdd2', '#d32f2f'])
+    fig.update_layout(**TRANSPARENT, height=400)
+    return fig
+
+
+def blood_stock_bars(rows):
+    """(blood group, donated, fulfilled, net) rows"""
+    df_stock = pd.DataFrame(rows, columns=['Blood Group', 'Donated', 'Fulfilled', 'Net Stock'])
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=df_stock['Blood Group'], y=df_stock['Donated'], name='Total Donated', marker_color='#c62828'))
+    fig.add_trace(go.Bar(x=df_stock['Blood Group'], y=df_stock['Fulfilled'], name='Total Fulfilled', marker_color='#ef9a9a'))
+    fig.update_layout(
+        **TRANSPARENT,
+        barmode='group',
+        title='Donations vs Fulfilled Requests',
+        xaxis_title='Blood Group',
+        yaxis_title='Quantity (ml)',
+        height=400,
+        legend_title_text='Metric'
+    )
+    return fig
+
+
+def hospital_activity_bars(rows):
+    """(hospital, donations, requests) rows"""
+    df_activity = pd.DataFrame(rows, columns=['Hospital', 'Donations', 'Requests'])
+    fig = px.bar(df_activity.melt(id_vars='Hospital'),
+                 x='Hospital', y='value', color='variable',
+                 title='Donations and Requests by Hospital',
+                 color_discrete_map={'Donations': '#d32f2f', 'Requests': '#ffcdd2'},
+                 barmode='group')
+    fig.update_layout(
+        **TRANSPARENT,
+        xaxis_title='Hospital',
+        yaxis_title='Count',
+        height=400,
+        legend_title_text='Activity'
+    )
+    return fig
+
+
+def age_bins(donor_counts, recipient_counts, width):
+    """(Population, Age, Group, Count) frame of (age, group, count) rows binned to `width` years.
+
+    Rows already binned by the query at the same width pass through unchanged.
+    """
+    frames = [
+        pd.DataFrame(counts, columns=['Age', 'Group', 'Count']).assign(Population=population)
+        for population, counts in (('Donors', donor_counts), ('Recipients', recipient_counts)) if counts
+    ]
+    if not frames:
+        return pd.DataFrame(columns=['Population', 'Age', 'Group', 'Count'])
+    bins = pd.concat(frames, ignore_index=True)
+    bins['Age'] = bins['Age'].astype(int) // width * width
+    return bins.groupby(['Population', 'Age', 'Group'], as_index=False)['Count'].sum()
+
+
+def age_histogram(donor_counts, recipient_counts, width=5, breakdown=None):
+    """Donor and recipient age histograms from per-age counts, optionally stacked by `breakdown`"""
+    bins = age_bins(donor_counts, recipient_counts, width)
+    if breakdown is None:
+        fig = go.Figure()
+        for population, color in (('Donors', '#b71c1c'), ('Recipients', '#ffcdd2')):
+            counts = bins[bins['Population'] == population].groupby('Age')['Count'].sum()
+            if not counts.empty:
+                fig.add_trace(go.Bar(x=counts.index, y=counts.values, name=population,
+                                     marker_color=color, opacity=0.75))
+        barmode, height = 'overlay', 400
+    else:
+        fig = px.bar(bins.rename(columns={'Group': breakdown}), x='Age', y='Count', color=breakdown,
+                     facet_row='Population', color_discrete_sequence=BLOOD_GROUP_COLORS)
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split('=')[-1]))
+        barmode, height = 'stack', 600
+    # Bars start at their bin's lower bound and span the whole bin
+    fig.update_traces(offset=0, width=width)
+    fig.update_layout(
+        **TRANSPARENT,
+        barmode=barmode,
+        bargap=0,
+        title='Donor and Recipient Age Distribution',
+        xaxis_title='Age',
+        yaxis_title='Count',
+        height=height
+    )
+    return fig
+
+
+BUILDERS = {
+    'blood_groups': blood_group_pie,
+    'monthly_donations': monthly_donations_bar,
+    'blood_stock': blood_stock_bars,
+    'hospital_activity': hospital_activity_bars,
+    'ages': age_histogram,
+}
+
+
+# ====================
+# FIGURE CACHE
+# ====================
+def data_digest(kind, data):
+    """Stable digest of a chart kind and its input rows"""
+    digest = hashlib.blake2b(kind.encode(), digest_size=16)
+    digest.update(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """Thread-safe LRU of built figures keyed by data_digest()"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def figure(self, kind, *data):
+        """The figure BUILDERS[kind] makes from `data`, built only when the data changed"""
+        key = data_digest(kind, data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        start = time.perf_counter()
+        figure_json = BUILDERS[kind](*data).to_json()
+        figure = pio.from_json(figure_json)
+        with self._lock:
+            self.misses += 1
+            self.build_seconds += time.perf_counter() - start
+            self._entries[key] = (figure_json, figure)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return figure
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'json_bytes': sum(len(figure_json) for figure_json, _ in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'avg_build_ms': self.build_seconds / self.misses * 1000 if self.misses else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+FIGURE_CACHE = FigureCache()
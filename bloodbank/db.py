@@ -0,0 +1,422 @@
+"""Connection pooling shared by the Streamlit app and headless scripts."""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import sqlite3
+
+from bloodbank.backends import BACKENDS, MYSQL_ERRORS
+from bloodbank.metrics import QUERY_METRICS
+
+# ====================
+# CONFIGURATION
+# ====================
+DB_CONFIG = {
+    'host': os.environ.get('BLOODBANK_DB_HOST', 'localhost'),
+    'database': os.environ.get('BLOODBANK_DB_NAME', 'blood_bank'),
+    'user': os.environ.get('BLOODBANK_DB_USER', 'root'),
+    'password': os.environ.get('BLOODBANK_DB_PASSWORD', 'Vidya@252005'),  # UPDATE THIS WITH YOUR PASSWORD
+    'autocommit': True,
+    'charset': 'utf8mb4',
+}
+
+# 'mysql' or 'sqlite'; SQLite keeps the whole database in BLOODBANK_SQLITE_PATH
+DB_BACKEND = os.environ.get('BLOODBANK_DB_BACKEND', 'mysql')
+SQLITE_PATH = os.environ.get('BLOODBANK_SQLITE_PATH', 'blood_bank.db')
+
+POOL_SIZE = int(os.environ.get('BLOODBANK_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('BLOODBANK_POOL_TIMEOUT', '10'))
+PING_INTERVAL = float(os.environ.get('BLOODBANK_POOL_PING_INTERVAL', '30'))
+MAX_LIFETIME = float(os.environ.get('BLOODBANK_POOL_MAX_LIFETIME', '3600'))
+MAX_PREPARED = int(os.environ.get('BLOODBANK_POOL_MAX_PREPARED', '64'))
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the timeout"""
+
+
+# Everything a database call can raise, whichever backend is in use
+Error = (PoolTimeoutError, sqlite3.Error) + MYSQL_ERRORS
+
+
+def default_backend():
+    """The backend selected by BLOODBANK_DB_BACKEND"""
+    if DB_BACKEND == 'sqlite':
+        return BACKENDS['sqlite'](SQLITE_PATH)
+    return BACKENDS['mysql'](DB_CONFIG)
+
+
+# ====================
+# POOL METRICS
+# ====================
+class PoolMetrics:
+    """Thread-safe counters describing how the pool is being used"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def record_checkout(self, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def record_checkin(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def record_wait(self):
+        with self._lock:
+            self.waits += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_created(self):
+        with self._lock:
+            self.created += 1
+
+    def record_discarded(self):
+        with self._lock:
+            self.discarded += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'created': self.created,
+                'discarded': self.discarded,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'avg_wait_ms': (self.wait_seconds / self.checkouts * 1000) if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait_seconds * 1000,
+            }
+
+
+# ====================
+# CONNECTION POOL
+# ====================
+class PooledConnection:
+    """A raw connection plus the bookkeeping the pool needs to recycle it.
+
+    It also keeps one server-side prepared cursor per statement text, so a
+    hot query is parsed and planned once per connection instead of once per
+    call. The least recently used statements are closed past
+    `max_prepared`.
+    """
+
+    def __init__(self, raw, backend, max_prepared=MAX_PREPARED):
+        self.raw = raw
+        self.backend = backend
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.generation = 0
+        self.max_prepared = max_prepared
+        self._prepared = OrderedDict()
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self, kind='buffered'):
+        """A cursor of the given kind ('buffered' or 'stream') for this backend"""
+        return self.backend.cursor(self.raw, kind)
+
+    def start_transaction(self):
+        self.backend.begin(self.raw)
+
+    def consume_results(self):
+        self.backend.finish_stream(self.raw)
+
+    def prepared_cursor(self, query):
+        """(statement, cursor) for `query`, preparing it on first use.
+
+        Execute the returned statement object rather than `query`: the
+        connector only skips re-preparing when it is handed the very same
+        string it prepared.
+        """
+        entry = self._prepared.get(query)
+        if entry is not None:
+            self._prepared.move_to_end(query)
+            return entry
+        entry = self._prepared[query] = (query, self.backend.cursor(self.raw, 'prepared'))
+        while len(self._prepared) > self.max_prepared:
+            self._close_cursor(self._prepared.popitem(last=False)[1][1])
+        return entry
+
+    def forget_prepared(self, query):
+        entry = self._prepared.pop(query, None)
+        if entry is not None:
+            self._close_cursor(entry[1])
+
+    def _close_cursor(self, cursor):
+        try:
+            cursor.close()
+        except Error:
+            pass
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of database connections with pre-ping on checkout.
+
+    At most `size` connections exist at once; borrowers block for up to
+    `timeout` seconds when all of them are checked out. Idle connections
+    older than `ping_interval` are pinged before being handed out, and any
+    connection older than `max_lifetime` is closed and replaced.
+    """
+
+    def __init__(self, backend=None, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 ping_interval=PING_INTERVAL, max_lifetime=MAX_LIFETIME):
+        self.backend = backend or default_backend()
+        self.dialect = self.backend.dialect
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.max_lifetime = max_lifetime
+        self.metrics = PoolMetrics()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        # Bumped by close_all(); connections opened before it are closed on release
+        self._generation = 0
+
+    def _open(self):
+        conn = PooledConnection(self.backend.connect(), self.backend)
+        conn.generation = self._generation
+        self.metrics.record_created()
+        return conn
+
+    def _close(self, conn):
+        self.metrics.record_discarded()
+        try:
+            conn.raw.close()
+        except Error:
+            pass
+
+    def _is_alive(self, conn):
+        return self.backend.ping(conn.raw)
+
+    def _take_idle(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            now = time.monotonic()
+            if now - conn.created_at > self.max_lifetime:
+                self._close(conn)
+            elif now - conn.last_used > self.ping_interval and not self._is_alive(conn):
+                self._close(conn)
+            else:
+                return conn
+
+    def acquire(self, timeout=None):
+        """Borrow a connection; pair every call with release()"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            self.metrics.record_wait()
+            if not self._slots.acquire(timeout=timeout):
+                self.metrics.record_timeout()
+                raise PoolTimeoutError(f"No database connection available after {timeout:.1f}s")
+        try:
+            conn = self._take_idle() or self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a borrowed connection, closing it if it is no longer usable"""
+        try:
+            if conn.raw.in_transaction:
+                conn.raw.rollback()
+        except Error:
+            discard = True
+        if discard or conn.generation != self._generation:
+            self._close(conn)
+        else:
+            conn.last_used = time.monotonic()
+            self._idle.put(conn)
+        self.metrics.record_checkin()
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a `with` block"""
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except self.backend.disconnect_errors:
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones close on release)"""
+        self._generation += 1
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+# ====================
+# HEADLESS QUERY HELPERS
+# ====================
+class TimedCursor:
+    """Cursor wrapper that records every statement in QUERY_METRICS"""
+
+    def __init__(self, cursor, acquire_seconds=0.0):
+        self.cursor = cursor
+        # Connection wait is charged to the first statement only
+        self._acquire_seconds = acquire_seconds
+
+    def _timed(self, query, params):
+        acquire_seconds, self._acquire_seconds = self._acquire_seconds, 0.0
+        return QUERY_METRICS.timed(query, params, acquire_seconds)
+
+    def execute(self, query, params=None):
+        with self._timed(query, params) as timing:
+            if params:
+                self.cursor.execute(query, params)
+            else:
+                self.cursor.execute(query)
+            timing['rows'] = self.cursor.rowcount
+
+    def executemany(self, query, seq_params):
+        with self._timed(query, None) as timing:
+            self.cursor.executemany(query, seq_params)
+            timing['rows'] = self.cursor.rowcount
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+@contextmanager
+def timed_connection(pool):
+    """Borrow a connection; yields (connection, seconds spent waiting for it)"""
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        yield conn, time.perf_counter() - start
+
+
+def fetch_all(pool, query, params=None):
+    """Run a read query on a pooled connection and return all rows; raises on error"""
+    with timed_connection(pool) as (conn, acquire_seconds):
+        cursor = conn.cursor()
+        try:
+            with QUERY_METRICS.timed(query, params, acquire_seconds) as timing:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                rows = cursor.fetchall()
+                timing['rows'] = len(rows)
+            return rows
+        finally:
+            cursor.close()
+
+
+def fetch_prepared(pool, query, params=()):
+    """Like fetch_all, but through the connection's cached prepared statement"""
+    with timed_connection(pool) as (conn, acquire_seconds):
+        statement, cursor = conn.prepared_cursor(query)
+        try:
+            with QUERY_METRICS.timed(query, params, acquire_seconds) as timing:
+                cursor.execute(statement, tuple(params))
+                rows = cursor.fetchall()
+                timing['rows'] = len(rows)
+            return rows
+        except Error:
+            conn.forget_prepared(query)
+            raise
+
+
+@contextmanager
+def transaction(pool):
+    """Unit of work: one pooled connection, one transaction, one commit.
+
+    Yields a cursor; everything executed on it is committed together when
+    the block exits, or rolled back if it raises.
+    """
+    with timed_connection(pool) as (conn, acquire_seconds):
+        conn.start_transaction()
+        cursor = conn.cursor()
+        try:
+            yield TimedCursor(cursor, acquire_seconds)
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Error:
+                pass
+            raise
+        finally:
+            cursor.close()
+
+
+def execute_statements(pool, statements):
+    """Execute (query, params) pairs atomically in a single transaction"""
+    with transaction(pool) as cursor:
+        for query, params in statements:
+            cursor.execute(query, params)
+
+
+def update_by_key(cursor, table, key, column, values, batch_size=5000):
+    """Set `column` from (key, value) pairs with one CASE UPDATE per `batch_size` rows.
+
+    executemany() only batches INSERTs, so per-row UPDATEs cost a round trip
+    each. Three parameters per row keep a full batch under SQLite's 32766.
+    """
+    values = list(values)
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+        keys = ", ".join(["%s"] * len(batch))
+        cursor.execute(f"UPDATE {table} SET {column} = CASE {key} {cases} END WHERE {key} IN ({keys})",
+                       [param for pair in batch for param in pair] + [pair[0] for pair in batch])
+
+
+def stream_rows(pool, query, params=None, chunk_size=5000):
+    """Yield lists of rows from an unbuffered server-side cursor.
+
+    Only `chunk_size` rows are held in memory at a time. The connection stays
+    checked out until the generator is exhausted or closed.
+    """
+    with timed_connection(pool) as (conn, acquire_seconds):
+        cursor = conn.cursor('stream')
+        try:
+            # Only the time to the first row is recorded; the rest is paced by the consumer
+            with QUERY_METRICS.timed(query, params, acquire_seconds):
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.consume_results()
+            cursor.close()
@@ -0,0 +1,156 @@
+"""Per-donor donation eligibility.
+
+Donor_Eligibility holds one row per donor with the date of their latest
+donation and the first date they may give again, DONATION_INTERVAL_DAYS
+later. Donors who have never given are eligible from the day their row was
+written. The (Blood_Group, Next_Eligible) index makes "donors of a group
+who may give today" a range scan, and checking a new donation is a
+primary-key read instead of a scan of Donation.
+
+Writers call add_donors() when donors are inserted and check_donation()
+and record_donations() in the transaction that inserts donations.
+rebuild() recomputes the table from Donor and Donation.
+
+Run `python -m bloodbank.eligibility rebuild` to rebuild from the command line.
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+from bloodbank.db import ConnectionPool, fetch_all, transaction, update_by_key
+
+DONATION_INTERVAL_DAYS = int(os.environ.get('BLOODBANK_DONATION_INTERVAL_DAYS', '56'))
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Donor_Eligibility (
+        Donor_ID VARCHAR(12) PRIMARY KEY,
+        Blood_Group VARCHAR(3) NOT NULL,
+        Last_Donation DATE,
+        Next_Eligible DATE NOT NULL
+    )
+    """,
+]
+
+# (table, index name, columns, unique) for migrations.ensure_index
+INDEXES = [
+    ('Donor_Eligibility', 'idx_eligibility_group_next', ('Blood_Group', 'Next_Eligible', 'Donor_ID'), False),
+]
+
+ELIGIBLE_DONORS_QUERY = """
+    SELECT d.Donor_ID, d.F_name, d.L_name, e.Blood_Group, e.Last_Donation
+    FROM Donor_Eligibility e
+    JOIN Donor d ON d.Donor_ID = e.Donor_ID
+    WHERE e.Blood_Group = %s AND e.Next_Eligible <= %s
+    ORDER BY e.Next_Eligible, e.Donor_ID
+    LIMIT %s
+"""
+
+ELIGIBILITY_QUERY = "SELECT Last_Donation, Next_Eligible FROM Donor_Eligibility WHERE Donor_ID = %s"
+
+
+class NotEligible(Exception):
+    """The donor gave blood less than DONATION_INTERVAL_DAYS from this donation"""
+
+    def __init__(self, donor_id, last_donation, next_eligible):
+        super().__init__(f"Donor {donor_id} last donated on {last_donation} "
+                         f"and cannot donate again until {next_eligible}")
+        self.donor_id = donor_id
+        self.last_donation = last_donation
+        self.next_eligible = next_eligible
+
+
+def too_close(donation_date, last_donation):
+    """Whether two donation dates are less than DONATION_INTERVAL_DAYS apart"""
+    return last_donation is not None and abs((donation_date - last_donation).days) < DONATION_INTERVAL_DAYS
+
+
+def add_donors(cursor, entries, today=None):
+    """Add (donor_id, blood_group) donors who have never donated"""
+    if entries:
+        cursor.executemany("""
+            INSERT INTO Donor_Eligibility (Donor_ID, Blood_Group, Last_Donation, Next_Eligible)
+            VALUES (%s, %s, NULL, %s)
+        """, [(donor_id, blood_group, today or date.today()) for donor_id, blood_group in entries])
+
+
+def check_donation(cursor, donor_id, donation_date):
+    """Raise NotEligible unless `donor_id` may give on `donation_date`; locks the donor's row"""
+    cursor.execute(ELIGIBILITY_QUERY + " FOR UPDATE", (donor_id,))
+    row = cursor.fetchone()
+    if row and too_close(donation_date, row[0]):
+        raise NotEligible(donor_id, row[0], row[1])
+
+
+def record_donations(cursor, entries):
+    """Move each donor's last donation forward for (donor_id, blood_group, donation_date) donations"""
+    latest = {}
+    for donor_id, blood_group, donation_date in entries:
+        if donor_id not in latest or donation_date > latest[donor_id][1]:
+            latest[donor_id] = (blood_group, donation_date)
+    if not latest:
+        return
+    interval = timedelta(days=DONATION_INTERVAL_DAYS)
+    cursor.executemany("""
+        INSERT INTO Donor_Eligibility (Donor_ID, Blood_Group, Last_Donation, Next_Eligible)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            Next_Eligible = CASE WHEN Last_Donation IS NULL OR Last_Donation < VALUES(Last_Donation)
+                THEN VALUES(Next_Eligible) ELSE Next_Eligible END,
+            Last_Donation = CASE WHEN Last_Donation IS NULL OR Last_Donation < VALUES(Last_Donation)
+                THEN VALUES(Last_Donation) ELSE Last_Donation END
+    """, [(donor_id, blood_group, donation_date, donation_date + interval)
+          for donor_id, (blood_group, donation_date) in latest.items()])
+
+
+def last_donations(pool, donor_ids):
+    """{donor_id: last donation date} for the given donors that have donated"""
+    if not donor_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(donor_ids))
+    return dict(fetch_all(pool, f"""
+        SELECT Donor_ID, Last_Donation FROM Donor_Eligibility
+        WHERE Donor_ID IN ({placeholders}) AND Last_Donation IS NOT NULL
+    """, list(donor_ids)))
+
+
+def backfill(cursor, today=None):
+    """Recompute Donor_Eligibility from Donor and Donation on an open transaction's cursor"""
+    cursor.execute("DELETE FROM Donor_Eligibility")
+    cursor.execute("""
+        INSERT INTO Donor_Eligibility (Donor_ID, Blood_Group, Last_Donation, Next_Eligible)
+        SELECT d.Donor_ID, d.Blood_Group, l.Last_Donation, %s
+        FROM Donor d
+        LEFT JOIN (
+            SELECT Donor_ID, MAX(Donation_date) as Last_Donation
+            FROM Donation GROUP BY Donor_ID
+        ) l ON l.Donor_ID = d.Donor_ID
+    """, (today or date.today(),))
+    # Dates are added in Python because MySQL and SQLite spell date arithmetic differently
+    cursor.execute("SELECT Donor_ID, Last_Donation FROM Donor_Eligibility WHERE Last_Donation IS NOT NULL")
+    interval = timedelta(days=DONATION_INTERVAL_DAYS)
+    update_by_key(cursor, 'Donor_Eligibility', 'Donor_ID', 'Next_Eligible',
+                  [(donor_id, last_donation + interval) for donor_id, last_donation in cursor.fetchall()])
+
+
+def rebuild(pool):
+    """Recompute the table from scratch in one transaction"""
+    with transaction(pool) as cursor:
+        backfill(cursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Donor eligibility maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    pool = ConnectionPool(size=1)
+    with transaction(pool) as cursor:
+        for statement in CREATE_TABLES:
+            cursor.execute(statement)
+    rebuild(pool)
+    rows = fetch_all(pool, "SELECT COUNT(*) FROM Donor_Eligibility WHERE Next_Eligible <= %s", (date.today(),))
+    print(f"{rows[0][0]} donors may donate today")
+
+
+if __name__ == "__main__":
+    main()
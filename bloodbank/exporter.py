@@ -0,0 +1,75 @@
+"""Streaming CSV/Parquet export of listings and analytics queries."""
+import csv
+import io
+import tempfile
+
+import pandas as pd
+
+from bloodbank.db import stream_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_FORMATS = ["CSV", "Parquet"] if pq else ["CSV"]
+EXTENSIONS = {"CSV": "csv", "Parquet": "parquet"}
+MIME_TYPES = {"CSV": "text/csv", "Parquet": "application/vnd.apache.parquet"}
+CHUNK_SIZE = 10000
+
+
+def write_csv(chunks, columns, out):
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+    text.detach()
+
+
+def _arrow_table(rows, columns, schema=None):
+    table = pa.Table.from_pandas(pd.DataFrame(rows, columns=columns), preserve_index=False)
+    if schema is None:
+        return table
+    return table.cast(schema)
+
+
+def write_parquet(chunks, columns, out):
+    writer = None
+    try:
+        for rows in chunks:
+            if writer is None:
+                table = _arrow_table(rows, columns)
+                # Columns that are entirely NULL in the first chunk have no type yet
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                writer = pq.ParquetWriter(out, schema)
+                table = table.cast(schema)
+            else:
+                table = _arrow_table(rows, columns, writer.schema)
+            writer.write_table(table)
+        if writer is None:
+            pq.write_table(pa.table({column: pa.array([], pa.string()) for column in columns}), out)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_query(pool, query, columns, fmt="CSV", params=None, chunk_size=CHUNK_SIZE, transform=None):
+    """Stream a query into a temporary file and return it rewound for download.
+
+    `transform`, when given, maps each chunk of rows before it is written.
+    """
+    out = tempfile.TemporaryFile()
+    chunks = stream_rows(pool, query, params, chunk_size)
+    if transform is not None:
+        chunks = map(transform, chunks)
+    if fmt == "Parquet":
+        write_parquet(chunks, columns, out)
+    else:
+        write_csv(chunks, columns, out)
+    out.seek(0)
+    return out
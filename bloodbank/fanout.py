@@ -0,0 +1,50 @@
+"""Concurrent execution of a page's independent reads.
+
+The Dashboard and Analytics widgets each need their own query, and run one
+after another they make a page as slow as the sum of them. QueryFanout
+runs such calls on a small thread pool; each worker checks a connection
+out of the shared ConnectionPool, so the page waits roughly as long as its
+slowest query. Both database drivers release the GIL while waiting on the
+server or on SQLite.
+
+Keep BLOODBANK_FANOUT_WORKERS below BLOODBANK_POOL_SIZE, or fanned-out
+reads can hold every connection while other sessions wait for one. Queries
+a worker runs are counted towards the caller's page render and fragments
+in QUERY_METRICS.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from bloodbank.metrics import QUERY_METRICS
+
+FANOUT_WORKERS = int(os.environ.get('BLOODBANK_FANOUT_WORKERS', '4'))
+
+
+class QueryFanout:
+    """Runs independent calls concurrently and collects their results in order"""
+
+    def __init__(self, workers=FANOUT_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fanout")
+
+    def gather(self, *calls, return_exceptions=False):
+        """Run each zero-argument callable on the pool; their results in call order.
+
+        With return_exceptions a failed call yields its exception instead of
+        raising, so one broken widget does not hide the others.
+        """
+        renders = QUERY_METRICS.current()
+
+        def run(call):
+            with QUERY_METRICS.attach(renders):
+                return call()
+
+        futures = [self._executor.submit(run, call) for call in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
@@ -0,0 +1,124 @@
+"""Block-allocating ID service backed by a sequence table.
+
+Each prefix ("H", "D", "DON", ...) has one row in Id_Sequence holding the
+next free number. A process reserves a block of numbers with one short
+UPDATE-then-SELECT transaction (the UPDATE's row lock keeps concurrent
+reservations apart) and then hands IDs out of that block in memory, so
+inserts never scan the target table and concurrent sessions never collide.
+"""
+import os
+import threading
+
+from bloodbank.db import transaction
+
+ID_BLOCK_SIZE = int(os.environ.get('BLOODBANK_ID_BLOCK_SIZE', '10'))
+
+# Legacy IDs are five characters long (H0001, DON01); numbers past that
+# width simply grow (DON100) instead of failing.
+LEGACY_ID_LENGTH = 5
+
+# prefix -> (table, id column)
+SEQUENCES = {
+    'H': ('Hospital', 'Hospital_ID'),
+    'U': ('User_Login', 'User_ID'),
+    'D': ('Donor', 'Donor_ID'),
+    'R': ('Recipient', 'Recipient_ID'),
+    'DON': ('Donation', 'Donation_ID'),
+    'REQ': ('Request', 'Request_ID'),
+}
+
+CREATE_SEQUENCE_TABLE = """
+    CREATE TABLE IF NOT EXISTS Id_Sequence (
+        Prefix VARCHAR(10) PRIMARY KEY,
+        Next_Value BIGINT UNSIGNED NOT NULL
+    )
+"""
+
+
+def format_id(prefix, number, width=None):
+    """Render a number as a prefixed, zero-padded ID"""
+    if width is None:
+        width = LEGACY_ID_LENGTH - len(prefix)
+    return f"{prefix}{number:0{width}d}"
+
+
+class IdAllocator:
+    """Hands out IDs for one prefix from an in-process reserved block"""
+
+    def __init__(self, pool, prefix, table, id_col, block_size=ID_BLOCK_SIZE, width=None):
+        self.pool = pool
+        self.prefix = prefix
+        self.table = table
+        self.id_col = id_col
+        self.block_size = block_size
+        self.width = width
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._seeded = False
+
+    def _seed(self, cursor):
+        # One-off scan that starts the sequence after the highest legacy ID;
+        # INSERT IGNORE keeps whichever process seeded first.
+        cursor.execute(f"""
+            INSERT IGNORE INTO Id_Sequence (Prefix, Next_Value)
+            SELECT %s, COALESCE(MAX(CAST(SUBSTRING({self.id_col}, {len(self.prefix) + 1}) AS UNSIGNED)), 0) + 1
+            FROM {self.table}
+            WHERE {self.id_col} LIKE %s
+        """, (self.prefix, f"{self.prefix}%"))
+
+    def _reserve(self, count):
+        with transaction(self.pool) as cursor:
+            if not self._seeded:
+                self._seed(cursor)
+            cursor.execute(
+                "UPDATE Id_Sequence SET Next_Value = Next_Value + %s WHERE Prefix = %s",
+                (count, self.prefix)
+            )
+            cursor.execute("SELECT Next_Value FROM Id_Sequence WHERE Prefix = %s", (self.prefix,))
+            end = cursor.fetchone()[0]
+        self._seeded = True
+        return end - count, end
+
+    def allocate(self, count=1):
+        """Return `count` new IDs"""
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    wanted = max(self.block_size, count - len(numbers))
+                    self._next, self._end = self._reserve(wanted)
+                take = min(self._end - self._next, count - len(numbers))
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return [format_id(self.prefix, n, self.width) for n in numbers]
+
+    def next_id(self):
+        return self.allocate(1)[0]
+
+
+class IdService:
+    """Process-wide registry of allocators, one per prefix"""
+
+    def __init__(self, pool, block_size=ID_BLOCK_SIZE):
+        self.pool = pool
+        self.block_size = block_size
+        self._allocators = {}
+        self._lock = threading.Lock()
+        with transaction(pool) as cursor:
+            cursor.execute(CREATE_SEQUENCE_TABLE)
+
+    def allocator(self, prefix, table=None, id_col=None):
+        with self._lock:
+            if prefix not in self._allocators:
+                if table is None:
+                    table, id_col = SEQUENCES[prefix]
+                self._allocators[prefix] = IdAllocator(self.pool, prefix, table, id_col, self.block_size)
+            return self._allocators[prefix]
+
+    def next_id(self, prefix, table=None, id_col=None):
+        return self.allocator(prefix, table, id_col).next_id()
+
+    def allocate(self, prefix, count, table=None, id_col=None):
+        return self.allocator(prefix, table, id_col).allocate(count)
+
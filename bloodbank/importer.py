@@ -0,0 +1,247 @@
+"""Bulk CSV/Excel import of donors, recipients and donations.
+
+Files are read in chunks; every chunk is validated with vectorized pandas
+checks, gets its IDs from the ID service in one block, and is written with
+executemany inside a single transaction. A failed chunk is rolled back and
+reported without affecting the chunks that were already committed.
+"""
+import time
+from datetime import date
+
+import pandas as pd
+
+from bloodbank import BLOOD_GROUPS
+from bloodbank.ages import ages_on
+from bloodbank.db import Error, fetch_all, transaction
+from bloodbank.eligibility import DONATION_INTERVAL_DAYS, add_donors, last_donations, record_donations, too_close
+from bloodbank.ledger import apply_donations
+from bloodbank.rollups import roll_up_donations
+
+CHUNK_SIZE = 5000
+GENDERS = {"M": "M", "F": "F", "OTHER": "Other"}
+
+
+class ImportReport:
+    """Outcome of one import run"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_written = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows_read / self.seconds if self.seconds else 0.0
+
+    def add_errors(self, rows, message):
+        self.errors.extend({'Row': int(row), 'Error': message} for row in rows)
+
+    def errors_frame(self):
+        return pd.DataFrame(self.errors, columns=['Row', 'Error']).sort_values('Row', kind='stable')
+
+
+def read_chunks(file, chunk_size=CHUNK_SIZE):
+    """Yield DataFrame chunks of string columns from an uploaded CSV or Excel file"""
+    name = getattr(file, 'name', '') or ''
+    if name.lower().endswith(('.xlsx', '.xls')):
+        # pandas cannot stream workbooks, so slice the sheet after reading it
+        frame = pd.read_excel(file, dtype=str)
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+    else:
+        yield from pd.read_csv(file, dtype=str, chunksize=chunk_size, skipinitialspace=True)
+
+
+def _records(frame):
+    """Rows as tuples of plain Python values, ready for executemany"""
+    return list(frame.astype(object).itertuples(index=False, name=None))
+
+
+def _check(report, frame, checks):
+    """Record failed checks and return the mask of rows that passed them all"""
+    valid = pd.Series(True, index=frame.index)
+    for message, passed in checks.items():
+        passed = passed.fillna(False)
+        report.add_errors(frame.index[~passed] + 2, message)
+        valid &= passed
+    return valid
+
+
+def _person_checks(frame):
+    gender = frame['Gender'].str.upper().map(GENDERS)
+    blood_group = frame['Blood_Group'].str.upper().str.replace(' ', '', regex=False)
+    frame['Gender'] = gender
+    frame['Blood_Group'] = blood_group
+    return {
+        'First name is required': frame['F_name'] != '',
+        'Last name is required': frame['L_name'] != '',
+        'Gender must be M, F or Other': gender.notna(),
+        f"Blood group must be one of {', '.join(BLOOD_GROUPS)}": blood_group.isin(BLOOD_GROUPS),
+    }
+
+
+# ====================
+# DONORS
+# ====================
+def _import_donors(pool, id_service, frame, report, today):
+    dob = pd.to_datetime(frame['DOB'], errors='coerce', format='ISO8601')
+    checks = _person_checks(frame)
+    checks['DOB must be a valid date that is not in the future'] = dob.notna() & (dob <= pd.Timestamp(today))
+    valid = _check(report, frame, checks)
+
+    rows = frame[valid].copy()
+    if rows.empty:
+        return rows
+    rows['DOB'] = dob[valid].dt.date
+    rows['Age'] = ages_on(dob[valid], today)
+    rows['Donor_ID'] = id_service.allocate('D', len(rows))
+
+    donors = rows[['Donor_ID', 'F_name', 'L_name', 'Address', 'Gender', 'DOB', 'Age', 'Blood_Group']]
+    contacts = rows.loc[rows['Contact'] != '', ['Donor_ID', 'Contact']]
+    with transaction(pool) as cursor:
+        cursor.executemany("""
+            INSERT INTO Donor (Donor_ID, F_name, L_name, Address, Gender, DOB, Age, Blood_Group)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, _records(donors))
+        if not contacts.empty:
+            cursor.executemany(
+                "INSERT INTO Donor_Contact (Donor_ID, Contact) VALUES (%s, %s)",
+                _records(contacts)
+            )
+        add_donors(cursor, _records(rows[['Donor_ID', 'Blood_Group']]), today)
+    return rows
+
+
+# ====================
+# RECIPIENTS
+# ====================
+def _import_recipients(pool, id_service, frame, report, today):
+    age = pd.to_numeric(frame['Age'], errors='coerce')
+    checks = _person_checks(frame)
+    checks['Age must be a whole number between 1 and 120'] = age.between(1, 120) & (age % 1 == 0)
+    valid = _check(report, frame, checks)
+
+    rows = frame[valid].copy()
+    if rows.empty:
+        return rows
+    rows['Age'] = age[valid].astype(int)
+    rows['Recipient_ID'] = id_service.allocate('R', len(rows))
+
+    recipients = rows[['Recipient_ID', 'F_name', 'L_name', 'Address', 'Gender', 'Age', 'Blood_Group']]
+    contacts = rows.loc[rows['Contact'] != '', ['Recipient_ID', 'Contact']]
+    with transaction(pool) as cursor:
+        cursor.executemany("""
+            INSERT INTO Recipient (Recipient_ID, F_name, L_name, Address, Gender, Age, Blood_Group)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, _records(recipients))
+        if not contacts.empty:
+            cursor.executemany(
+                "INSERT INTO Recipient_Contact (Recipient_ID, Contact) VALUES (%s, %s)",
+                _records(contacts)
+            )
+    return rows
+
+
+# ====================
+# DONATIONS
+# ====================
+def _lookup(pool, table, id_col, value_col, ids):
+    """Map each existing ID in `ids` to `value_col` with one IN query"""
+    ids = list(ids)
+    if not ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(ids))
+    rows = fetch_all(pool, f"SELECT {id_col}, {value_col} FROM {table} WHERE {id_col} IN ({placeholders})", ids)
+    return dict(rows)
+
+
+def _eligible_donations(pool, rows, report):
+    """Drop and report donations too close to the donor's previous one, here or in the database"""
+    given = {donor_id: [last] for donor_id, last in last_donations(pool, rows['Donor_ID'].unique().tolist()).items()}
+    keep = pd.Series(True, index=rows.index)
+    for index, donor_id, donation_date in rows.sort_values('Donation_date')[['Donor_ID', 'Donation_date']].itertuples():
+        dates = given.setdefault(donor_id, [])
+        if any(too_close(donation_date, other) for other in dates):
+            keep[index] = False
+        else:
+            dates.append(donation_date)
+    report.add_errors(rows.index[~keep] + 2,
+                      f"Donor already gave blood within {DONATION_INTERVAL_DAYS} days of this donation")
+    return rows[keep]
+
+
+def _import_donations(pool, id_service, frame, report, today):
+    quantity = pd.to_numeric(frame['Quantity'], errors='coerce')
+    donation_date = pd.to_datetime(frame['Donation_date'], errors='coerce', format='ISO8601')
+    donor_groups = _lookup(pool, 'Donor', 'Donor_ID', 'Blood_Group', frame['Donor_ID'].unique())
+    hospitals = _lookup(pool, 'Hospital', 'Hospital_ID', 'Hospital_ID', frame['Hospital_ID'].unique())
+    valid = _check(report, frame, {
+        'Unknown Donor_ID': frame['Donor_ID'].isin(donor_groups.keys()),
+        'Unknown Hospital_ID': frame['Hospital_ID'].isin(hospitals.keys()),
+        'Quantity must be between 100 and 500 ml': quantity.between(100, 500),
+        'Donation date must be a valid date that is not in the future':
+            donation_date.notna() & (donation_date <= pd.Timestamp(today)),
+    })
+
+    rows = frame[valid].copy()
+    if rows.empty:
+        return rows
+    rows['Quantity'] = quantity[valid].astype(int)
+    rows['Donation_date'] = donation_date[valid].dt.date
+    rows = _eligible_donations(pool, rows, report)
+    if rows.empty:
+        return rows
+    rows['Donation_ID'] = id_service.allocate('DON', len(rows))
+
+    rows['Blood_Group'] = rows['Donor_ID'].map(donor_groups)
+
+    donations = rows[['Donation_ID', 'Hospital_ID', 'Donor_ID', 'Quantity', 'Donation_date']]
+    stock = rows.groupby(['Hospital_ID', 'Blood_Group'], as_index=False)['Quantity'].sum()
+    with transaction(pool) as cursor:
+        cursor.executemany("""
+            INSERT INTO Donation (Donation_ID, Hospital_ID, Donor_ID, Quantity, Donation_date)
+            VALUES (%s, %s, %s, %s, %s)
+        """, _records(donations))
+        apply_donations(cursor, _records(stock))
+        roll_up_donations(cursor, _records(rows[['Donation_date', 'Hospital_ID', 'Blood_Group', 'Quantity']]))
+        record_donations(cursor, _records(rows[['Donor_ID', 'Blood_Group', 'Donation_date']]))
+    return rows
+
+
+# kind -> (required columns, optional columns, chunk writer returning the rows it inserted)
+IMPORTERS = {
+    'donors': (['F_name', 'L_name', 'Gender', 'DOB', 'Blood_Group'], ['Address', 'Contact'], _import_donors),
+    'recipients': (['F_name', 'L_name', 'Gender', 'Age', 'Blood_Group'], ['Address', 'Contact'], _import_recipients),
+    'donations': (['Donor_ID', 'Hospital_ID', 'Quantity', 'Donation_date'], [], _import_donations),
+}
+
+
+def import_file(pool, id_service, kind, file, chunk_size=CHUNK_SIZE, on_written=None):
+    """Validate and insert every row of `file`; returns an ImportReport.
+
+    `on_written`, when given, is called with each chunk's committed rows as a DataFrame.
+    """
+    required, optional, write_chunk = IMPORTERS[kind]
+    report = ImportReport()
+    today = date.today()
+    start = time.perf_counter()
+    for chunk in read_chunks(file, chunk_size):
+        chunk = chunk.rename(columns=lambda c: str(c).strip())
+        missing = [c for c in required if c not in chunk.columns]
+        if missing:
+            report.add_errors([1], f"Missing column(s): {', '.join(missing)}")
+            break
+        chunk = chunk.reindex(columns=required + optional).fillna('')
+        chunk = chunk.apply(lambda column: column.str.strip())
+        report.rows_read += len(chunk)
+        try:
+            written = write_chunk(pool, id_service, chunk, report, today)
+            report.rows_written += len(written)
+            if on_written is not None and not written.empty:
+                on_written(written)
+        except Error as e:
+            first, last = chunk.index[0] + 2, chunk.index[-1] + 2
+            report.add_errors([first], f"Rows {first}-{last} were rolled back: {e}")
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,145 @@
+"""Incrementally maintained blood-stock ledger.
+
+Blood_Stock holds units donated and fulfilled per (hospital, blood group)
+and Blood_Stock_Total the same per blood group, so stock lookups are
+primary-key reads instead of Donor x Donation joins. Writers call
+apply_donations()/apply_fulfilment() on the cursor of the transaction that
+records the donation or status change; rebuild() recomputes both tables
+from Donation and Request. A fulfilled request is debited from the group
+it was supplied from (Request.Source_Group), which may differ from the
+group it asked for; requests closed before sources were recorded count
+against their own group.
+
+Run `python -m bloodbank.ledger reconcile` to rebuild from the command line.
+"""
+import argparse
+from collections import defaultdict
+
+from bloodbank.db import ConnectionPool, fetch_all, transaction
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Blood_Stock (
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Blood_Group VARCHAR(3) NOT NULL,
+        Donated BIGINT NOT NULL DEFAULT 0,
+        Fulfilled BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (Hospital_ID, Blood_Group)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Blood_Stock_Total (
+        Blood_Group VARCHAR(3) PRIMARY KEY,
+        Donated BIGINT NOT NULL DEFAULT 0,
+        Fulfilled BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+STOCK_BY_GROUP_QUERY = """
+    SELECT Blood_Group, Donated, Fulfilled, Donated - Fulfilled as Net
+    FROM Blood_Stock_Total
+    ORDER BY Blood_Group
+"""
+
+
+def _apply(cursor, column, entries):
+    by_hospital = defaultdict(int)
+    by_group = defaultdict(int)
+    for hospital_id, blood_group, quantity in entries:
+        by_hospital[(hospital_id, blood_group)] += int(quantity)
+        by_group[blood_group] += int(quantity)
+    if not by_group:
+        return
+    cursor.executemany(f"""
+        INSERT INTO Blood_Stock (Hospital_ID, Blood_Group, {column})
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE {column} = {column} + VALUES({column})
+    """, [(h, g, q) for (h, g), q in by_hospital.items()])
+    cursor.executemany(f"""
+        INSERT INTO Blood_Stock_Total (Blood_Group, {column})
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE {column} = {column} + VALUES({column})
+    """, list(by_group.items()))
+
+
+def apply_donations(cursor, entries):
+    """Add (hospital_id, blood_group, quantity) donations to the ledger"""
+    _apply(cursor, 'Donated', entries)
+
+
+def apply_fulfilment(cursor, entries):
+    """Add (hospital_id, blood_group, quantity) fulfilled requests to the ledger"""
+    _apply(cursor, 'Fulfilled', entries)
+
+
+def stock_by_group(pool):
+    """(Blood_Group, Donated, Fulfilled, Net) for every group with activity"""
+    return fetch_all(pool, STOCK_BY_GROUP_QUERY)
+
+
+def stock_for(pool, hospital_id, blood_group):
+    """(Donated, Fulfilled, Net) for one hospital and blood group"""
+    rows = fetch_all(pool, """
+        SELECT Donated, Fulfilled, Donated - Fulfilled
+        FROM Blood_Stock
+        WHERE Hospital_ID = %s AND Blood_Group = %s
+    """, (hospital_id, blood_group))
+    return rows[0] if rows else (0, 0, 0)
+
+
+def rebuild(pool):
+    """Recompute the ledger from scratch in one transaction"""
+    with transaction(pool) as cursor:
+        cursor.execute("DELETE FROM Blood_Stock")
+        cursor.execute("DELETE FROM Blood_Stock_Total")
+        cursor.execute("""
+            INSERT INTO Blood_Stock (Hospital_ID, Blood_Group, Donated, Fulfilled)
+            SELECT Hospital_ID, Blood_Group, SUM(Donated), SUM(Fulfilled)
+            FROM (
+                SELECT don.Hospital_ID, d.Blood_Group, SUM(don.Quantity) as Donated, 0 as Fulfilled
+                FROM Donation don
+                JOIN Donor d ON d.Donor_ID = don.Donor_ID
+                GROUP BY don.Hospital_ID, d.Blood_Group
+                UNION ALL
+                SELECT Hospital_ID, COALESCE(Source_Group, Blood_Group), 0, SUM(Quantity)
+                FROM Request
+                WHERE Status = 'Fulfilled'
+                GROUP BY Hospital_ID, COALESCE(Source_Group, Blood_Group)
+            ) s
+            GROUP BY Hospital_ID, Blood_Group
+        """)
+        cursor.execute("""
+            INSERT INTO Blood_Stock_Total (Blood_Group, Donated, Fulfilled)
+            SELECT Blood_Group, SUM(Donated), SUM(Fulfilled)
+            FROM Blood_Stock
+            GROUP BY Blood_Group
+        """)
+
+
+def create_tables(pool):
+    with transaction(pool) as cursor:
+        for statement in CREATE_TABLES:
+            cursor.execute(statement)
+
+
+def ensure_ledger(pool):
+    """Create the ledger tables, populating them if they are empty"""
+    create_tables(pool)
+    if not fetch_all(pool, "SELECT 1 FROM Blood_Stock_Total LIMIT 1"):
+        rebuild(pool)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blood stock ledger maintenance")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.parse_args()
+    pool = ConnectionPool(size=1)
+    create_tables(pool)
+    rebuild(pool)
+    for blood_group, donated, fulfilled, net in stock_by_group(pool):
+        print(f"{blood_group:>4}  donated={donated}  fulfilled={fulfilled}  net={net}")
+
+
+if __name__ == "__main__":
+    main()
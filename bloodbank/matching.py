@@ -0,0 +1,141 @@
+"""Blood-compatibility matching of pending requests against current stock.
+
+Compatibility follows ABO/Rh antigen rules: a donor group can supply a
+recipient when the donor's antigens are a subset of the recipient's. The
+rules are precomputed into a compatibility matrix and a preference table
+per recipient group. The exact group comes first, then the least widely usable donor
+groups, and O- is always used last.
+
+Allocation is greedy in request priority order (oldest first). Each step
+handles one preference rank and donor group for every request at once with
+cumulative sums, so thousands of requests are matched with a few dozen
+array operations.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from bloodbank import BLOOD_GROUPS
+from bloodbank.db import fetch_all
+from bloodbank.ledger import stock_by_group
+
+PENDING_REQUESTS_QUERY = """
+    SELECT Request_ID, Blood_Group, Quantity, Request_date
+    FROM Request
+    WHERE Status = 'Pending'
+    ORDER BY Request_date, Request_ID
+"""
+
+_ANTIGEN_A, _ANTIGEN_B, _RH = 1, 2, 4
+
+
+def _antigens(group):
+    bits = _RH if group.endswith("+") else 0
+    if "A" in group:
+        bits |= _ANTIGEN_A
+    if "B" in group:
+        bits |= _ANTIGEN_B
+    return bits
+
+
+_GROUP_ANTIGENS = [_antigens(g) for g in BLOOD_GROUPS]
+
+# COMPATIBLE[r, d] is True when donor group d can supply recipient group r
+COMPATIBLE = np.array([
+    [(donor & ~recipient) == 0 for donor in _GROUP_ANTIGENS]
+    for recipient in _GROUP_ANTIGENS
+])
+
+# How many recipient groups each donor group can serve; wider = more precious
+_REACH = COMPATIBLE.sum(axis=0)
+
+
+def _preference(recipient):
+    others = [d for d in range(len(BLOOD_GROUPS)) if COMPATIBLE[recipient, d] and d != recipient]
+    # Least reusable donors first; on ties keep Rh- units for Rh- patients
+    others.sort(key=lambda d: (_REACH[d], not BLOOD_GROUPS[d].endswith("+"), d))
+    order = [recipient] + others
+    return order + [-1] * (len(BLOOD_GROUPS) - len(order))
+
+
+# PREFERENCE[r, k] is the k-th donor group to draw from for recipient r (-1 = none)
+PREFERENCE = np.array([_preference(r) for r in range(len(BLOOD_GROUPS))])
+
+
+def can_supply(donor_group, recipient_group):
+    """Whether blood of `donor_group` may be given to a `recipient_group` patient"""
+    if donor_group not in BLOOD_GROUPS or recipient_group not in BLOOD_GROUPS:
+        return donor_group == recipient_group
+    return bool(COMPATIBLE[BLOOD_GROUPS.index(recipient_group), BLOOD_GROUPS.index(donor_group)])
+
+
+def allocate(groups, quantities, stock):
+    """Greedy allocation of stock to requests listed in priority order.
+
+    `groups` holds each request's blood-group index and `quantities` its
+    size; `stock` holds available units per group. Each request is served
+    in full from a single donor group or not at all. Returns (allocation,
+    fulfillable) where allocation[i, d] is the amount request i takes from
+    donor group d.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    quantities = np.asarray(quantities, dtype=np.int64)
+    available = np.clip(np.asarray(stock, dtype=np.int64), 0, None).copy()
+    n = len(groups)
+    choices = PREFERENCE[groups] if n else np.empty((0, len(BLOOD_GROUPS)), dtype=np.int64)
+    served_by = np.full(n, -1, dtype=np.int64)
+
+    for rank in range(len(BLOOD_GROUPS)):
+        for donor in range(len(BLOOD_GROUPS)):
+            while available[donor] > 0:
+                idx = np.flatnonzero(
+                    (served_by < 0) & (choices[:, rank] == donor) & (quantities <= available[donor])
+                )
+                if idx.size == 0:
+                    break
+                # Oldest requests first: serve the longest prefix that fits
+                chosen = idx[np.cumsum(quantities[idx]) <= available[donor]]
+                served_by[chosen] = donor
+                available[donor] -= quantities[chosen].sum()
+
+    fulfillable = served_by >= 0
+    allocation = np.zeros((n, len(BLOOD_GROUPS)), dtype=np.int64)
+    allocation[np.flatnonzero(fulfillable), served_by[fulfillable]] = quantities[fulfillable]
+    return allocation, fulfillable
+
+
+def suggest_allocations(pool):
+    """Match every pending request against current net stock.
+
+    Returns (suggestions DataFrame, leftover stock DataFrame, elapsed ms).
+    """
+    pending = fetch_all(pool, PENDING_REQUESTS_QUERY)
+    net = {group: int(net) for group, _, _, net in stock_by_group(pool)}
+    stock = np.array([max(net.get(g, 0), 0) for g in BLOOD_GROUPS], dtype=np.int64)
+
+    start = time.perf_counter()
+    requests = pd.DataFrame(pending, columns=['Request ID', 'Blood Group', 'Quantity (ml)', 'Date'])
+    requests = requests[requests['Blood Group'].isin(BLOOD_GROUPS)].reset_index(drop=True)
+    groups = requests['Blood Group'].map({g: i for i, g in enumerate(BLOOD_GROUPS)}).to_numpy()
+    allocation, fulfillable = allocate(groups, requests['Quantity (ml)'].to_numpy(), stock)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    source = np.array(BLOOD_GROUPS + [""], dtype=object)[np.where(fulfillable, allocation.argmax(axis=1), -1)]
+    requests['Fulfillable'] = fulfillable
+    requests['Suggested Source'] = source
+
+    leftover = pd.DataFrame({
+        'Blood Group': BLOOD_GROUPS,
+        'Available (ml)': stock,
+        'Allocated (ml)': allocation.sum(axis=0),
+    })
+    leftover['Left (ml)'] = leftover['Available (ml)'] - leftover['Allocated (ml)']
+    return requests, leftover, elapsed_ms
+
+
+def suggested_source(pool, request_id):
+    """The blood group the current allocation would supply `request_id` from, or None"""
+    requests, _, _ = suggest_allocations(pool)
+    match = requests[(requests['Request ID'] == request_id) & requests['Fulfillable']]
+    return match['Suggested Source'].iloc[0] if len(match) else None
@@ -0,0 +1,269 @@
+"""Per-statement query instrumentation.
+
+Every statement run through the db helpers is recorded under a normalized
+fingerprint (literals and placeholders replaced by `?`), with its latency
+histogram, a latency reservoir for percentiles, row counts and connection
+acquisition time. Queries issued while a page renders are also counted per
+page, so a page that suddenly issues many more queries shows up. Fragments
+(parts of a page that can rerun on their own) are timed the same way,
+whether they run with their page or alone.
+"""
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf')]
+RESERVOIR_SIZE = 1024
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query):
+    """Normalize a statement so that calls differing only in values group together"""
+    text = _STRING.sub("?", query)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _IN_LIST.sub("(?+)", text)
+
+
+class QueryStats:
+    """Running statistics for one fingerprint"""
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS_MS)
+        self.sample = None
+        self._reservoir = []
+
+    def add(self, seconds, rows, acquire_seconds, failed, query, params):
+        self.calls += 1
+        self.errors += int(failed)
+        self.rows += rows
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.acquire_seconds += acquire_seconds
+        ms = seconds * 1000
+        self.histogram[next(i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound)] += 1
+        # Reservoir sampling keeps percentiles representative at constant memory
+        if len(self._reservoir) < RESERVOIR_SIZE:
+            self._reservoir.append(seconds)
+        else:
+            slot = random.randrange(self.calls)
+            if slot < RESERVOIR_SIZE:
+                self._reservoir[slot] = seconds
+        if self.sample is None or seconds >= self.max_seconds:
+            self.sample = (query, params)
+
+    def summary(self):
+        p50, p95, p99 = (np.percentile(self._reservoir, [50, 95, 99]) * 1000) if self._reservoir else (0.0, 0.0, 0.0)
+        return {
+            'fingerprint': self.fingerprint,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'avg_rows': self.rows / self.calls if self.calls else 0.0,
+            'total_ms': self.total_seconds * 1000,
+            'avg_ms': self.total_seconds / self.calls * 1000 if self.calls else 0.0,
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': self.max_seconds * 1000,
+            'avg_acquire_ms': self.acquire_seconds / self.calls * 1000 if self.calls else 0.0,
+            'histogram': dict(zip([str(b) for b in LATENCY_BUCKETS_MS], self.histogram)),
+        }
+
+
+class RenderStats:
+    """Queries issued and time spent per render of one page or fragment"""
+
+    def __init__(self, page):
+        self.page = page
+        self.renders = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_seconds = 0.0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, queries, db_seconds, seconds):
+        self.renders += 1
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.db_seconds += db_seconds
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def summary(self):
+        return {
+            'page': self.page,
+            'renders': self.renders,
+            'avg_queries': self.queries / self.renders if self.renders else 0.0,
+            'max_queries': self.max_queries,
+            'avg_db_ms': self.db_seconds / self.renders * 1000 if self.renders else 0.0,
+            'avg_ms': self.seconds / self.renders * 1000 if self.renders else 0.0,
+            'max_ms': self.max_seconds * 1000,
+        }
+
+
+class QueryMetrics:
+    """Thread-safe registry of QueryStats and RenderStats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._renders = {}
+        self._fragments = {}
+        self._local = threading.local()
+        self.started_at = time.time()
+
+    def record(self, query, seconds, rows=0, acquire_seconds=0.0, failed=False, params=None):
+        key = fingerprint(query)
+        with self._lock:
+            stats = self._queries.get(key)
+            if stats is None:
+                stats = self._queries[key] = QueryStats(key)
+            stats.add(seconds, max(rows, 0), acquire_seconds, failed, query, params)
+            # The page render and every fragment running inside it all see the
+            # query; fan-out workers share these lists, hence the lock
+            for render in getattr(self._local, 'renders', ()):
+                render[1] += 1
+                render[2] += seconds
+
+    @contextmanager
+    def timed(self, query, params=None, acquire_seconds=0.0):
+        """Time one statement; the caller sets `result['rows']` when it knows it"""
+        result = {'rows': 0}
+        start = time.perf_counter()
+        try:
+            yield result
+        except BaseException:
+            self.record(query, time.perf_counter() - start, 0, acquire_seconds, True, params)
+            raise
+        self.record(query, time.perf_counter() - start, result['rows'], acquire_seconds, False, params)
+
+    def _add_render(self, registry, render):
+        name, queries, db_seconds, started = render
+        with self._lock:
+            stats = registry.get(name)
+            if stats is None:
+                stats = registry[name] = RenderStats(name)
+            stats.add(queries, db_seconds, time.perf_counter() - started)
+
+    def start_render(self, page):
+        """Begin counting the queries this thread issues for `page`"""
+        self.finish_render()
+        self._local.renders = [[page, 0, 0.0, time.perf_counter()]]
+
+    def finish_render(self):
+        renders = getattr(self._local, 'renders', None)
+        if not renders:
+            return
+        self._local.renders = []
+        self._add_render(self._renders, renders[0])
+
+    @contextmanager
+    def fragment(self, name):
+        """Time one run of a fragment, inside its page render or on its own"""
+        renders = getattr(self._local, 'renders', None)
+        if renders is None:
+            renders = self._local.renders = []
+        render = [name, 0, 0.0, time.perf_counter()]
+        renders.append(render)
+        try:
+            yield
+        finally:
+            renders.remove(render)
+            self._add_render(self._fragments, render)
+
+    def current(self):
+        """This thread's open page render and fragments, for attach() in a worker"""
+        return list(getattr(self._local, 'renders', ()))
+
+    @contextmanager
+    def attach(self, renders):
+        """Count this thread's queries towards renders taken from current()"""
+        previous = getattr(self._local, 'renders', None)
+        self._local.renders = renders
+        try:
+            yield
+        finally:
+            self._local.renders = previous
+
+    def top(self, n=10, by='p95_ms'):
+        """Summaries of the `n` worst fingerprints ordered by `by`"""
+        with self._lock:
+            summaries = [stats.summary() for stats in self._queries.values()]
+        return sorted(summaries, key=lambda s: s[by], reverse=True)[:n]
+
+    def renders(self):
+        with self._lock:
+            return sorted((stats.summary() for stats in self._renders.values()), key=lambda s: s['page'])
+
+    def fragments(self):
+        with self._lock:
+            return sorted((stats.summary() for stats in self._fragments.values()), key=lambda s: s['page'])
+
+    def sample(self, fingerprint):
+        """The (query, params) of the slowest recorded call of a fingerprint"""
+        with self._lock:
+            stats = self._queries.get(fingerprint)
+            return stats.sample if stats else None
+
+    def snapshot(self):
+        return {
+            'started_at': self.started_at,
+            'taken_at': time.time(),
+            'queries': self.top(n=None, by='total_ms'),
+            'renders': self.renders(),
+            'fragments': self.fragments(),
+        }
+
+    def to_json(self):
+        """The snapshot as JSON; sampled parameters are never included"""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._renders.clear()
+            self._fragments.clear()
+            self.started_at = time.time()
+
+
+QUERY_METRICS = QueryMetrics()
+
+
+def explain(pool, query, params=None):
+    """Run the backend's EXPLAIN for a SELECT and return (columns, rows)"""
+    if not query.lstrip().upper().startswith(("SELECT", "WITH")):
+        raise ValueError("Only SELECT statements can be explained")
+    statement = f"{pool.dialect.explain_prefix} {query}"
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(statement, params)
+            else:
+                cursor.execute(statement)
+            return list(cursor.column_names), cursor.fetchall()
+        finally:
+            cursor.close()
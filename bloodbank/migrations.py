@@ -0,0 +1,227 @@
+"""Versioned schema migrations and an index check for the hot queries.
+
+Schema_Version records every migration applied to a database. migrate()
+runs the pending ones in order, each in its own transaction together with
+its Schema_Version row. MySQL commits DDL implicitly, so every step is
+written to be safe to re-run after a partial failure. Indexes are only
+created when no existing index already starts with the same columns,
+which keeps databases that were set up by hand from getting duplicates.
+
+check_indexes() EXPLAINs each statement in HOT_QUERIES and reports the
+tables it reads without an index. Optimizers happily scan tiny tables,
+so run it against realistic data (see `python -m bloodbank.bench generate`).
+
+    python -m bloodbank.migrations status
+    python -m bloodbank.migrations migrate
+    python -m bloodbank.migrations check
+"""
+import argparse
+import sys
+
+from bloodbank.backends import SQLiteDialect
+from bloodbank.db import ConnectionPool, fetch_all, transaction
+from bloodbank.eligibility import (
+    CREATE_TABLES as ELIGIBILITY_TABLES, ELIGIBILITY_QUERY, ELIGIBLE_DONORS_QUERY, INDEXES as ELIGIBILITY_INDEXES,
+    backfill as backfill_eligibility,
+)
+from bloodbank.ids import CREATE_SEQUENCE_TABLE
+from bloodbank.ledger import CREATE_TABLES as LEDGER_TABLES
+from bloodbank.matching import PENDING_REQUESTS_QUERY
+from bloodbank.metrics import explain
+from bloodbank.pagination import DONATIONS, DONORS, RECIPIENTS, REQUESTS
+from bloodbank.repositories import (
+    BLOOD_GROUP_COUNTS_QUERY, CREDENTIALS_QUERY, DONOR_QUERY, HOSPITAL_ACTIVITY_QUERY, PENDING_IDS_QUERY,
+    RECENT_DONATIONS_QUERY, RECENT_REQUESTS_QUERY,
+)
+from bloodbank.rollups import (
+    ACTIVITY_TABLES, MONTHLY_TABLES, MONTHLY_TOTALS_QUERY, backfill_activity, backfill_monthly,
+)
+from bloodbank.schema import ROUTINES, TABLES
+
+CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS Schema_Version (
+        Version INT PRIMARY KEY,
+        Description VARCHAR(100) NOT NULL,
+        Applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# (table, index name, columns, unique), one per access path the app uses
+INDEXES = [
+    # Donors page by blood group and the Dashboard GROUP BY Blood_Group
+    ('Donor', 'idx_donor_blood_group', ('Blood_Group', 'Donor_ID'), False),
+    # Recent donations, the Donations listing and the monthly chart
+    ('Donation', 'idx_donation_date', ('Donation_date', 'Donation_ID'), False),
+    ('Donation', 'idx_donation_donor', ('Donor_ID',), False),
+    ('Donation', 'idx_donation_hospital', ('Hospital_ID',), False),
+    # Pending requests (matching, status updates, dashboard count)
+    ('Request', 'idx_request_status_date', ('Status', 'Request_date', 'Request_ID'), False),
+    # Recent requests and the Requests listing
+    ('Request', 'idx_request_date', ('Request_date', 'Request_ID'), False),
+    ('Request', 'idx_request_recipient', ('Recipient_ID',), False),
+    ('Request', 'idx_request_hospital', ('Hospital_ID',), False),
+    ('Hospital', 'idx_hospital_name', ('Name',), False),
+    # Login
+    ('User_Login', 'ux_user_login_username', ('Username',), True),
+]
+
+# (name, query, params) for every statement that must not scan a table
+HOT_QUERIES = [
+    ('login credentials', CREDENTIALS_QUERY, ('admin',)),
+    ('donor by id', DONOR_QUERY, ('D0001',)),
+    ('donors by blood group', SQLiteDialect.PROCEDURES['GetDonorsByBloodGroup'], ('AB-',)),
+    ('donor count by blood group', BLOOD_GROUP_COUNTS_QUERY, ()),
+    ('recent donations', RECENT_DONATIONS_QUERY, (5,)),
+    ('monthly donations', MONTHLY_TOTALS_QUERY, (6,)),
+    ('recent requests', RECENT_REQUESTS_QUERY, (5,)),
+    ('pending request ids', PENDING_IDS_QUERY, ()),
+    ('pending requests for matching', PENDING_REQUESTS_QUERY, ()),
+    ('hospital activity', HOSPITAL_ACTIVITY_QUERY, ()),
+    ('donor eligibility', ELIGIBILITY_QUERY, ('D0001',)),
+    ('eligible donors by blood group', ELIGIBLE_DONORS_QUERY, ('O-', '2000-01-01', 100)),
+] + [
+    (f"{listing.name} first page", listing.query.format(seek=""), (51,))
+    for listing in (DONORS, RECIPIENTS, DONATIONS, REQUESTS)
+]
+
+
+def _indexes(cursor, dialect, table):
+    """{index name: (unique, columns)} for one table"""
+    cursor.execute(*dialect.index_columns(table))
+    indexes = {}
+    for name, non_unique, _, column in cursor.fetchall():
+        unique, columns = indexes.get(name, (not non_unique, ()))
+        indexes[name] = (unique, columns + (column,))
+    return indexes
+
+
+def ensure_index(cursor, dialect, table, name, columns, unique=False):
+    """Create an index unless one already leads with `columns`; returns True if created"""
+    for existing_unique, existing in _indexes(cursor, dialect, table).values():
+        if tuple(existing[:len(columns)]) == tuple(columns) and (existing_unique or not unique):
+            return False
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cursor.execute(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+    return True
+
+
+# ====================
+# MIGRATIONS
+# ====================
+def _core_tables(cursor, dialect):
+    for statement in TABLES:
+        cursor.execute(statement)
+    if not dialect.has_routines:
+        return
+    for kind, name, statement in ROUTINES:
+        cursor.execute(*dialect.routine_exists(kind, name))
+        if not cursor.fetchall():
+            cursor.execute(statement)
+
+
+def _support_tables(cursor, dialect):
+    for statement in LEDGER_TABLES + [CREATE_SEQUENCE_TABLE]:
+        cursor.execute(statement)
+
+
+def _access_path_indexes(cursor, dialect):
+    for table, name, columns, unique in INDEXES:
+        ensure_index(cursor, dialect, table, name, columns, unique)
+
+
+def _monthly_rollup(cursor, dialect):
+    for statement in MONTHLY_TABLES:
+        cursor.execute(statement)
+    backfill_monthly(cursor)
+
+
+def _activity_rollups(cursor, dialect):
+    for statement in ACTIVITY_TABLES:
+        cursor.execute(statement)
+    backfill_activity(cursor)
+
+
+def _donor_eligibility(cursor, dialect):
+    for statement in ELIGIBILITY_TABLES:
+        cursor.execute(statement)
+    for table, name, columns, unique in ELIGIBILITY_INDEXES:
+        ensure_index(cursor, dialect, table, name, columns, unique)
+    backfill_eligibility(cursor)
+
+
+def _request_source_group(cursor, dialect):
+    # Databases created after Source_Group joined schema.TABLES already have it
+    cursor.execute(*dialect.column_exists('Request', 'Source_Group'))
+    if not cursor.fetchall():
+        cursor.execute("ALTER TABLE Request ADD COLUMN Source_Group VARCHAR(3)")
+
+
+# (version, description, step); append only, never renumber
+MIGRATIONS = [
+    (1, "core tables and routines", _core_tables),
+    (2, "stock ledger and id sequence tables", _support_tables),
+    (3, "indexes for the app's access paths", _access_path_indexes),
+    (4, "monthly donation rollup", _monthly_rollup),
+    (5, "request and hospital activity rollups", _activity_rollups),
+    (6, "donor eligibility", _donor_eligibility),
+    (7, "blood group that fulfilled each request", _request_source_group),
+]
+
+
+def current_version(pool):
+    """The highest applied migration, 0 for an unversioned database"""
+    with transaction(pool) as cursor:
+        cursor.execute(CREATE_VERSION_TABLE)
+    return fetch_all(pool, "SELECT COALESCE(MAX(Version), 0) FROM Schema_Version")[0][0]
+
+
+def migrate(pool, target=None):
+    """Apply pending migrations up to `target` (default: all); returns the versions applied"""
+    version = current_version(pool)
+    applied = []
+    for number, description, step in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with transaction(pool) as cursor:
+            step(cursor, pool.dialect)
+            cursor.execute("INSERT INTO Schema_Version (Version, Description) VALUES (%s, %s)",
+                           (number, description))
+        applied.append(number)
+    return applied
+
+
+def check_indexes(pool):
+    """(name, full-scanned tables) for every hot query; an empty list means indexed"""
+    results = []
+    for name, query, params in HOT_QUERIES:
+        columns, rows = explain(pool, query, params)
+        results.append((name, pool.dialect.full_scans(columns, rows)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blood bank schema migrations")
+    parser.add_argument("command", choices=["status", "migrate", "check"])
+    args = parser.parse_args()
+    pool = ConnectionPool(size=1)
+
+    if args.command == "status":
+        version = current_version(pool)
+        for number, description, _ in MIGRATIONS:
+            print(f"{'applied' if number <= version else 'pending':>8}  {number:>3}  {description}")
+        return
+
+    if args.command == "migrate":
+        applied = migrate(pool)
+        print(f"Applied {applied}" if applied else "Schema is up to date")
+        return
+
+    failed = False
+    for name, scans in check_indexes(pool):
+        failed = failed or bool(scans)
+        print(f"{'SCAN' if scans else 'ok':>4}  {name}" + (f"  ({', '.join(scans)})" if scans else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Keyset (seek) pagination for the View listings, with next-page prefetch."""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from bloodbank.ages import with_ages
+from bloodbank.db import fetch_all, fetch_prepared
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+class Listing:
+    """A paginated listing.
+
+    `query` must contain a `{seek}` placeholder where the keyset condition
+    goes (empty on the first page) and end with `LIMIT %s`. `seek` is the
+    condition used after the first page and `seek_params` turns the last
+    row of a page into the parameters for that condition. `export_query`
+    returns the whole listing in the same order, for streaming exports.
+    `transform`, when given, maps each fetched page of rows before it is
+    served, and each exported chunk before it is written.
+    """
+
+    def __init__(self, name, table, query, seek, seek_params, export_query, transform=None):
+        self.name = name
+        self.table = table
+        self.query = query
+        self.seek = seek
+        self.seek_params = seek_params
+        self.export_query = export_query
+        self.transform = transform
+
+    def fetch_page(self, pool, cursor, page_size):
+        """Return (rows, next_cursor) for the page that starts after `cursor`"""
+        if cursor is None:
+            query = self.query.format(seek="")
+            params = (page_size + 1,)
+        else:
+            query = self.query.format(seek=self.seek)
+            params = tuple(cursor) + (page_size + 1,)
+        rows = fetch_prepared(pool, query, params)
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = tuple(self.seek_params(rows[-1]))
+        if self.transform is not None:
+            rows = self.transform(rows)
+        return rows, next_cursor
+
+
+DONORS = Listing(
+    name="donors",
+    table="Donor",
+    query="""
+        SELECT d.Donor_ID, CONCAT(d.F_name, ' ', d.L_name) as Name,
+            d.Gender, d.DOB, d.Blood_Group, d.Address,
+            GROUP_CONCAT(dc.Contact SEPARATOR ', ') as Contacts
+        FROM (SELECT * FROM Donor {seek} ORDER BY Donor_ID LIMIT %s) d
+        LEFT JOIN Donor_Contact dc ON d.Donor_ID = dc.Donor_ID
+        GROUP BY d.Donor_ID
+        ORDER BY d.Donor_ID
+    """,
+    seek="WHERE Donor_ID > %s",
+    seek_params=lambda row: (row[0],),
+    export_query="""
+        SELECT d.Donor_ID, CONCAT(d.F_name, ' ', d.L_name) as Name,
+            d.Gender, d.DOB, d.Blood_Group, d.Address,
+            GROUP_CONCAT(dc.Contact SEPARATOR ', ') as Contacts
+        FROM Donor d
+        LEFT JOIN Donor_Contact dc ON d.Donor_ID = dc.Donor_ID
+        GROUP BY d.Donor_ID
+        ORDER BY d.Donor_ID
+    """,
+    # Ages are worked out from DOB for each page and export chunk, so they never go stale
+    transform=lambda rows: with_ages(rows, 3),
+)
+
+RECIPIENTS = Listing(
+    name="recipients",
+    table="Recipient",
+    query="""
+        SELECT r.Recipient_ID, CONCAT(r.F_name, ' ', r.L_name) as Name,
+            r.Gender, r.Age, r.Blood_Group, r.Address,
+            GROUP_CONCAT(rc.Contact SEPARATOR ', ') as Contacts
+        FROM (SELECT * FROM Recipient {seek} ORDER BY Recipient_ID LIMIT %s) r
+        LEFT JOIN Recipient_Contact rc ON r.Recipient_ID = rc.Recipient_ID
+        GROUP BY r.Recipient_ID
+        ORDER BY r.Recipient_ID
+    """,
+    seek="WHERE Recipient_ID > %s",
+    seek_params=lambda row: (row[0],),
+    export_query="""
+        SELECT r.Recipient_ID, CONCAT(r.F_name, ' ', r.L_name) as Name,
+            r.Gender, r.Age, r.Blood_Group, r.Address,
+            GROUP_CONCAT(rc.Contact SEPARATOR ', ') as Contacts
+        FROM Recipient r
+        LEFT JOIN Recipient_Contact rc ON r.Recipient_ID = rc.Recipient_ID
+        GROUP BY r.Recipient_ID
+        ORDER BY r.Recipient_ID
+    """,
+)
+
+DONATIONS = Listing(
+    name="donations",
+    table="Donation",
+    query="""
+        SELECT d.Donation_ID, CONCAT(don.F_name, ' ', don.L_name) as Donor,
+            don.Blood_Group, h.Name as Hospital, d.Quantity, d.Donation_date
+        FROM Donation d
+        JOIN Donor don ON d.Donor_ID = don.Donor_ID
+        JOIN Hospital h ON d.Hospital_ID = h.Hospital_ID
+        {seek}
+        ORDER BY d.Donation_date DESC, d.Donation_ID DESC
+        LIMIT %s
+    """,
+    seek="WHERE d.Donation_date < %s OR (d.Donation_date = %s AND d.Donation_ID < %s)",
+    seek_params=lambda row: (row[5], row[5], row[0]),
+    export_query="""
+        SELECT d.Donation_ID, CONCAT(don.F_name, ' ', don.L_name) as Donor,
+            don.Blood_Group, h.Name as Hospital, d.Quantity, d.Donation_date
+        FROM Donation d
+        JOIN Donor don ON d.Donor_ID = don.Donor_ID
+        JOIN Hospital h ON d.Hospital_ID = h.Hospital_ID
+        ORDER BY d.Donation_date DESC, d.Donation_ID DESC
+    """,
+)
+
+REQUESTS = Listing(
+    name="requests",
+    table="Request",
+    query="""
+        SELECT r.Request_ID, CONCAT(rec.F_name, ' ', rec.L_name) as Recipient,
+            h.Name as Hospital, r.Blood_Group, r.Quantity, r.Status, r.Request_date
+        FROM Request r
+        JOIN Recipient rec ON r.Recipient_ID = rec.Recipient_ID
+        JOIN Hospital h ON r.Hospital_ID = h.Hospital_ID
+        {seek}
+        ORDER BY r.Request_date DESC, r.Request_ID DESC
+        LIMIT %s
+    """,
+    seek="WHERE r.Request_date < %s OR (r.Request_date = %s AND r.Request_ID < %s)",
+    seek_params=lambda row: (row[6], row[6], row[0]),
+    export_query="""
+        SELECT r.Request_ID, CONCAT(rec.F_name, ' ', rec.L_name) as Recipient,
+            h.Name as Hospital, r.Blood_Group, r.Quantity, r.Status, r.Request_date
+        FROM Request r
+        JOIN Recipient rec ON r.Recipient_ID = rec.Recipient_ID
+        JOIN Hospital h ON r.Hospital_ID = h.Hospital_ID
+        ORDER BY r.Request_date DESC, r.Request_ID DESC
+    """,
+)
+
+
+def estimate_row_count(pool, table):
+    """Cheap row-count estimate from engine statistics (no table scan)"""
+    rows = fetch_all(pool, *pool.dialect.row_estimate(table))
+    return int(rows[0][0] or 0) if rows else 0
+
+
+class PagePrefetcher:
+    """Serves listing pages and loads the following page in the background.
+
+    Pages are kept in a small LRU for `ttl` seconds so that clicking "Next"
+    usually finds the page already fetched. Call clear() after writes.
+    """
+
+    def __init__(self, max_pages=32, ttl=30, workers=2):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def _submit(self, pool, listing, cursor, page_size):
+        key = (listing.name, cursor, page_size)
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._pages.move_to_end(key)
+                return entry[1]
+            future = self._executor.submit(listing.fetch_page, pool, cursor, page_size)
+            self._pages[key] = (time.monotonic(), future)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+            return future
+
+    def get_page(self, pool, listing, cursor, page_size):
+        """Return (rows, next_cursor), prefetching the page after it"""
+        future = self._submit(pool, listing, cursor, page_size)
+        try:
+            rows, next_cursor = future.result()
+        except Exception:
+            with self._lock:
+                self._pages.pop((listing.name, cursor, page_size), None)
+            raise
+        if next_cursor is not None:
+            self._submit(pool, listing, next_cursor, page_size)
+        return rows, next_cursor
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -0,0 +1,352 @@
+"""Data-access layer: one repository per aggregate, usable without Streamlit.
+
+Reads go through server-side prepared statements that are cached per
+pooled connection (see fetch_prepared), so a hot query is parsed once per
+connection. Writes run in a single transaction each. Rows come back as
+namedtuples. Every method raises the connector's Error on failure and
+leaves reporting to the caller.
+
+    repos = Repositories(ConnectionPool())
+    repos.donors.get("D0001")
+"""
+from collections import namedtuple
+from datetime import date
+
+from bloodbank.ages import ages_on
+from bloodbank.db import fetch_all, fetch_prepared, transaction
+from bloodbank.eligibility import ELIGIBLE_DONORS_QUERY, add_donors, check_donation, record_donations
+from bloodbank.ledger import apply_donations, apply_fulfilment
+from bloodbank.matching import can_supply
+from bloodbank.rollups import MONTHLY_TOTALS_QUERY, restatus_request, roll_up_donations, roll_up_requests
+
+Counts = namedtuple('Counts', 'donors recipients donations pending_requests')
+NameOption = namedtuple('NameOption', 'id f_name l_name')
+GroupCount = namedtuple('GroupCount', 'blood_group count')
+MonthCount = namedtuple('MonthCount', 'month count')
+Donor = namedtuple('Donor', 'donor_id f_name l_name address gender dob age blood_group contacts')
+DonorSummary = namedtuple('DonorSummary', 'donor_id f_name l_name age blood_group')
+EligibleDonor = namedtuple('EligibleDonor', 'donor_id f_name l_name blood_group last_donation')
+RecentDonation = namedtuple('RecentDonation', 'donation_id donor hospital quantity donation_date')
+RecentRequest = namedtuple('RecentRequest', 'request_id recipient blood_group quantity status request_date')
+Hospital = namedtuple('Hospital', 'hospital_id name address contacts emails')
+HospitalOption = namedtuple('HospitalOption', 'hospital_id name')
+HospitalActivity = namedtuple('HospitalActivity', 'name donations requests')
+Credentials = namedtuple('Credentials', 'user_id password_hash hospital_id')
+UserProfile = namedtuple('UserProfile', 'user_id username hospital_id hospital_name')
+AgeCount = namedtuple('AgeCount', 'age group count')
+
+COUNTS_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM Donor),
+        (SELECT COUNT(*) FROM Recipient),
+        (SELECT COUNT(*) FROM Donation),
+        (SELECT COUNT(*) FROM Request WHERE Status = 'Pending')
+"""
+
+DONOR_QUERY = """
+    SELECT d.Donor_ID, d.F_name, d.L_name, d.Address, d.Gender, d.DOB, d.Age, d.Blood_Group,
+        GROUP_CONCAT(dc.Contact SEPARATOR ', ')
+    FROM Donor d
+    LEFT JOIN Donor_Contact dc ON d.Donor_ID = dc.Donor_ID
+    WHERE d.Donor_ID = %s
+    GROUP BY d.Donor_ID
+"""
+
+BLOOD_GROUP_COUNTS_QUERY = "SELECT Blood_Group, COUNT(*) as count FROM Donor GROUP BY Blood_Group"
+
+RECENT_DONATIONS_QUERY = """
+    SELECT d.Donation_ID, CONCAT(don.F_name, ' ', don.L_name) as Donor,
+        h.Name as Hospital, d.Quantity, d.Donation_date
+    FROM Donation d
+    JOIN Donor don ON d.Donor_ID = don.Donor_ID
+    JOIN Hospital h ON d.Hospital_ID = h.Hospital_ID
+    ORDER BY d.Donation_date DESC LIMIT %s
+"""
+
+RECENT_REQUESTS_QUERY = """
+    SELECT r.Request_ID, CONCAT(rec.F_name, ' ', rec.L_name) as Recipient,
+        r.Blood_Group, r.Quantity, r.Status, r.Request_date
+    FROM Request r
+    JOIN Recipient rec ON r.Recipient_ID = rec.Recipient_ID
+    ORDER BY r.Request_date DESC LIMIT %s
+"""
+
+PENDING_IDS_QUERY = "SELECT Request_ID FROM Request WHERE Status = 'Pending' ORDER BY Request_ID"
+
+CREDENTIALS_QUERY = "SELECT User_ID, Password, Hospital_ID FROM User_Login WHERE Username = %s"
+
+PROFILE_QUERY = """
+    SELECT u.User_ID, u.Username, u.Hospital_ID, h.Name
+    FROM User_Login u
+    LEFT JOIN Hospital h ON u.Hospital_ID = h.Hospital_ID
+    WHERE u.User_ID = %s
+"""
+
+DONOR_AGES_QUERY = "SELECT Age FROM Donor"
+RECIPIENT_AGES_QUERY = "SELECT Age FROM Recipient"
+
+# Columns the age distribution can be broken down by, for Donor and Recipient alike
+AGE_BREAKDOWNS = ('Gender', 'Blood_Group')
+
+# People per age bin (and breakdown value); a bin is labelled by its lower bound
+AGE_COUNTS_QUERY = """
+    SELECT Age - Age % %s as Age_Bin, {group}, COUNT(*)
+    FROM {table}
+    WHERE Age IS NOT NULL
+    GROUP BY Age_Bin{group_by}
+    ORDER BY Age_Bin
+"""
+
+HOSPITAL_DIRECTORY_QUERY = """
+    SELECT h.Hospital_ID, h.Name, h.Address,
+           GROUP_CONCAT(DISTINCT hc.Contact SEPARATOR ', ') as Contacts,
+           GROUP_CONCAT(DISTINCT he.Email SEPARATOR ', ') as Emails
+    FROM Hospital h
+    LEFT JOIN Hospital_Contact hc ON h.Hospital_ID = hc.Hospital_ID
+    LEFT JOIN Hospital_Email he ON h.Hospital_ID = he.Hospital_ID
+    GROUP BY h.Hospital_ID
+    ORDER BY h.Name
+"""
+
+HOSPITAL_ACTIVITY_QUERY = """
+    SELECT
+        h.Name,
+        COALESCE(SUM(a.Donations), 0) as TotalDonations,
+        COALESCE(SUM(a.Requests), 0) as TotalRequests
+    FROM Hospital h
+    LEFT JOIN Hospital_Activity a ON h.Hospital_ID = a.Hospital_ID
+    GROUP BY h.Name
+    ORDER BY TotalDonations DESC, TotalRequests DESC
+"""
+
+
+def age_counts_query(table, by=None):
+    """AGE_COUNTS_QUERY for `table`, grouped by one of AGE_BREAKDOWNS or not at all"""
+    if by is None:
+        return AGE_COUNTS_QUERY.format(table=table, group="''", group_by="")
+    if by not in AGE_BREAKDOWNS:
+        raise ValueError(f"Unknown age breakdown: {by}")
+    return AGE_COUNTS_QUERY.format(table=table, group=by, group_by=f", {by}")
+
+
+class Repository:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _fetch(self, query, params=(), record=None):
+        rows = fetch_prepared(self.pool, query, params)
+        return [record._make(row) for row in rows] if record else rows
+
+    def _fetch_one(self, query, params=(), record=None):
+        rows = self._fetch(query, params, record)
+        return rows[0] if rows else None
+
+
+# ====================
+# DONORS
+# ====================
+class DonorRepo(Repository):
+    def names(self):
+        return self._fetch("SELECT Donor_ID, F_name, L_name FROM Donor ORDER BY F_name", record=NameOption)
+
+    def get(self, donor_id):
+        """The donor with all contacts joined, or None; the age is worked out from DOB"""
+        donor = self._fetch_one(DONOR_QUERY, (donor_id,), Donor)
+        if donor is None or donor.dob is None:
+            return donor
+        return donor._replace(age=int(ages_on([donor.dob])[0]))
+
+    def by_blood_group(self, blood_group):
+        # Stored procedures return extra result sets, so this one is not prepared
+        rows = fetch_all(self.pool, "CALL GetDonorsByBloodGroup(%s)", (blood_group,))
+        return [DonorSummary._make(row) for row in rows]
+
+    def count_by_blood_group(self):
+        return self._fetch(BLOOD_GROUP_COUNTS_QUERY, record=GroupCount)
+
+    def eligible(self, blood_group, today=None, limit=100):
+        """Donors of `blood_group` who may donate on `today`, longest-eligible first"""
+        return self._fetch(ELIGIBLE_DONORS_QUERY, (blood_group, today or date.today(), limit), EligibleDonor)
+
+    def age_counts(self, by=None, width=1):
+        """AgeCount rows per `width`-year age bin, and per `by` column value when given"""
+        return self._fetch(age_counts_query('Donor', by), (width,), AgeCount)
+
+    def add(self, donor_id, f_name, l_name, address, gender, dob, blood_group, contact):
+        with transaction(self.pool) as cursor:
+            cursor.execute("""
+                INSERT INTO Donor (Donor_ID, F_name, L_name, Address, Gender, DOB, Age, Blood_Group)
+                VALUES (%s, %s, %s, %s, %s, %s, Calculate_Age(%s), %s)
+            """, (donor_id, f_name, l_name, address, gender, dob, dob, blood_group))
+            add_donors(cursor, [(donor_id, blood_group)])
+            cursor.execute("""
+                INSERT INTO Donor_Contact (Donor_ID, Contact)
+                VALUES (%s, %s)
+            """, (donor_id, contact))
+
+
+# ====================
+# RECIPIENTS
+# ====================
+class RecipientRepo(Repository):
+    def names(self):
+        return self._fetch("SELECT Recipient_ID, F_name, L_name FROM Recipient ORDER BY F_name", record=NameOption)
+
+    def age_counts(self, by=None, width=1):
+        """AgeCount rows per `width`-year age bin, and per `by` column value when given"""
+        return self._fetch(age_counts_query('Recipient', by), (width,), AgeCount)
+
+    def add(self, recipient_id, f_name, l_name, address, gender, age, blood_group, contact):
+        with transaction(self.pool) as cursor:
+            cursor.execute("""
+                INSERT INTO Recipient (Recipient_ID, F_name, L_name, Address, Gender, Age, Blood_Group)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (recipient_id, f_name, l_name, address, gender, age, blood_group))
+            cursor.execute("""
+                INSERT INTO Recipient_Contact (Recipient_ID, Contact)
+                VALUES (%s, %s)
+            """, (recipient_id, contact))
+
+
+# ====================
+# DONATIONS
+# ====================
+class DonationRepo(Repository):
+    def recent(self, limit=5):
+        return self._fetch(RECENT_DONATIONS_QUERY, (limit,), RecentDonation)
+
+    def monthly_counts(self, months=6):
+        """Donations per 'YYYY-MM' month, newest first"""
+        return self._fetch(MONTHLY_TOTALS_QUERY, (months,), MonthCount)
+
+    def record(self, donation_id, hospital_id, donor_id, quantity, donation_date):
+        """Insert a donation and credit the stock ledger and rollups in the same transaction.
+
+        Raises NotEligible, changing nothing, when the donor gave too recently.
+        """
+        with transaction(self.pool) as cursor:
+            check_donation(cursor, donor_id, donation_date)
+            cursor.execute("""
+                INSERT INTO Donation (Donation_ID, Hospital_ID, Donor_ID, Quantity, Donation_date)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (donation_id, hospital_id, donor_id, quantity, donation_date))
+            cursor.execute("SELECT Blood_Group FROM Donor WHERE Donor_ID = %s", (donor_id,))
+            blood_group = cursor.fetchone()[0]
+            apply_donations(cursor, [(hospital_id, blood_group, quantity)])
+            roll_up_donations(cursor, [(donation_date, hospital_id, blood_group, quantity)])
+            record_donations(cursor, [(donor_id, blood_group, donation_date)])
+
+
+# ====================
+# REQUESTS
+# ====================
+class RequestRepo(Repository):
+    def recent(self, limit=5):
+        return self._fetch(RECENT_REQUESTS_QUERY, (limit,), RecentRequest)
+
+    def pending_ids(self):
+        return [row[0] for row in self._fetch(PENDING_IDS_QUERY)]
+
+    def create(self, request_id, hospital_id, recipient_id, quantity, blood_group, request_date):
+        with transaction(self.pool) as cursor:
+            cursor.execute("""
+                INSERT INTO Request (Request_ID, Hospital_ID, Recipient_ID, Status, Quantity, Blood_Group, Request_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (request_id, hospital_id, recipient_id, 'Pending', quantity, blood_group, request_date))
+            roll_up_requests(cursor, [(request_date, hospital_id, 'Pending', quantity)])
+
+    def update_status(self, request_id, new_status, source_group=None):
+        """Close a pending request; fulfilled requests are debited from the ledger.
+
+        A fulfilled request is supplied from `source_group` (default: its own
+        group), which is recorded and debited; an incompatible group raises
+        ValueError. Returns False, changing nothing, when the request is no
+        longer pending.
+        """
+        with transaction(self.pool) as cursor:
+            cursor.execute("""
+                SELECT Hospital_ID, Blood_Group, Quantity, Status, Request_date
+                FROM Request WHERE Request_ID = %s FOR UPDATE
+            """, (request_id,))
+            row = cursor.fetchone()
+            if not row or row[3] != 'Pending':
+                return False
+            source_group = (source_group or row[1]) if new_status == 'Fulfilled' else None
+            if source_group and not can_supply(source_group, row[1]):
+                raise ValueError(f"{source_group} blood cannot be given to {row[1]} recipients")
+            cursor.execute("UPDATE Request SET Status = %s, Source_Group = %s WHERE Request_ID = %s",
+                           (new_status, source_group, request_id))
+            restatus_request(cursor, row[4], row[0], row[2], 'Pending', new_status)
+            if source_group:
+                apply_fulfilment(cursor, [(row[0], source_group, row[2])])
+        return True
+
+
+# ====================
+# HOSPITALS
+# ====================
+class HospitalRepo(Repository):
+    def names(self):
+        return self._fetch("SELECT Hospital_ID, Name FROM Hospital ORDER BY Name", record=HospitalOption)
+
+    def directory(self):
+        """Every hospital with its contacts and emails joined"""
+        return self._fetch(HOSPITAL_DIRECTORY_QUERY, record=Hospital)
+
+    def activity(self):
+        return self._fetch(HOSPITAL_ACTIVITY_QUERY, record=HospitalActivity)
+
+
+# ====================
+# USERS
+# ====================
+class UserRepo(Repository):
+    def credentials(self, username):
+        return self._fetch_one(CREDENTIALS_QUERY, (username,), Credentials)
+
+    def profile(self, user_id):
+        """The user with their hospital's name, or None"""
+        return self._fetch_one(PROFILE_QUERY, (user_id,), UserProfile)
+
+    def register(self, hospital_id, h_name, h_address, h_contact, h_email,
+                 user_id, username, password_hash, u_contact, u_email):
+        """Create a hospital and its first user together"""
+        with transaction(self.pool) as cursor:
+            cursor.execute("INSERT INTO Hospital (Hospital_ID, Name, Address) VALUES (%s, %s, %s)",
+                           (hospital_id, h_name, h_address))
+            cursor.execute("INSERT INTO Hospital_Contact (Hospital_ID, Contact) VALUES (%s, %s)",
+                           (hospital_id, h_contact))
+            cursor.execute("INSERT INTO Hospital_Email (Hospital_ID, Email) VALUES (%s, %s)",
+                           (hospital_id, h_email))
+            cursor.execute("INSERT INTO User_Login (User_ID, Username, Password, Hospital_ID) VALUES (%s, %s, %s, %s)",
+                           (user_id, username, password_hash, hospital_id))
+            cursor.execute("INSERT INTO User_Contact (User_ID, Contact) VALUES (%s, %s)",
+                           (user_id, u_contact))
+            cursor.execute("INSERT INTO User_Email (User_ID, Email) VALUES (%s, %s)",
+                           (user_id, u_email))
+
+    def update_password(self, user_id, password_hash):
+        with transaction(self.pool) as cursor:
+            cursor.execute("UPDATE User_Login SET Password = %s WHERE User_ID = %s", (password_hash, user_id))
+
+    def delete(self, user_id):
+        with transaction(self.pool) as cursor:
+            cursor.execute("DELETE FROM User_Contact WHERE User_ID = %s", (user_id,))
+            cursor.execute("DELETE FROM User_Email WHERE User_ID = %s", (user_id,))
+            cursor.execute("DELETE FROM User_Login WHERE User_ID = %s", (user_id,))
+
+
+class Repositories:
+    """All repositories bound to one pool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.donors = DonorRepo(pool)
+        self.recipients = RecipientRepo(pool)
+        self.donations = DonationRepo(pool)
+        self.requests = RequestRepo(pool)
+        self.hospitals = HospitalRepo(pool)
+        self.users = UserRepo(pool)
+
+    def counts(self):
+        return Counts._make(fetch_prepared(self.pool, COUNTS_QUERY)[0])
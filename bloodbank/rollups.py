@@ -0,0 +1,197 @@
+"""Incrementally maintained donation and request rollups.
+
+Donation_Monthly holds the number and volume of donations per
+(month, hospital, blood group), with the month as 'YYYY-MM'. Grouping the
+Donation table by DATE_FORMAT(Donation_date) cannot use an index and reads
+the whole history on every chart refresh; the rollup has a few rows per
+month, and its primary key leads with Month, so "the last N months" reads
+only those months. Request_Monthly does the same for requests per
+(month, hospital, status), and Hospital_Activity keeps one row of donation
+and request totals per hospital for the Analytics activity chart.
+
+Writers call roll_up_donations()/roll_up_requests() on the cursor of the
+transaction that inserts the rows, and restatus_request() when a request
+is closed. rebuild() recomputes every rollup from Donation and Request.
+
+Run `python -m bloodbank.rollups rebuild` to backfill from the command line.
+"""
+import argparse
+from collections import defaultdict
+
+from bloodbank.db import ConnectionPool, fetch_all, transaction
+
+MONTHLY_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Donation_Monthly (
+        Month CHAR(7) NOT NULL,
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Blood_Group VARCHAR(3) NOT NULL,
+        Donations BIGINT NOT NULL DEFAULT 0,
+        Quantity BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (Month, Hospital_ID, Blood_Group)
+    )
+    """,
+]
+
+ACTIVITY_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Request_Monthly (
+        Month CHAR(7) NOT NULL,
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Status VARCHAR(10) NOT NULL,
+        Requests BIGINT NOT NULL DEFAULT 0,
+        Quantity BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (Month, Hospital_ID, Status)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Hospital_Activity (
+        Hospital_ID VARCHAR(12) PRIMARY KEY,
+        Donations BIGINT NOT NULL DEFAULT 0,
+        Requests BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+]
+
+CREATE_TABLES = MONTHLY_TABLES + ACTIVITY_TABLES
+
+MONTHLY_TOTALS_QUERY = """
+    SELECT Month, SUM(Donations) as count
+    FROM Donation_Monthly
+    WHERE Month >= (SELECT MIN(Month) FROM (
+        SELECT DISTINCT Month FROM Donation_Monthly ORDER BY Month DESC LIMIT %s
+    ) recent)
+    GROUP BY Month ORDER BY Month DESC
+"""
+
+
+def month_of(donation_date):
+    """'YYYY-MM' for a date, datetime or ISO date string"""
+    return str(donation_date)[:7]
+
+
+def _add_activity(cursor, column, counts):
+    if counts:
+        cursor.executemany(f"""
+            INSERT INTO Hospital_Activity (Hospital_ID, {column})
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE {column} = {column} + VALUES({column})
+        """, list(counts.items()))
+
+
+def _add_request_months(cursor, totals):
+    """Add signed (requests, quantity) totals keyed by (month, hospital, status)"""
+    cursor.executemany("""
+        INSERT INTO Request_Monthly (Month, Hospital_ID, Status, Requests, Quantity)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE Requests = Requests + VALUES(Requests), Quantity = Quantity + VALUES(Quantity)
+    """, [key + tuple(total) for key, total in totals.items()])
+
+
+def roll_up_donations(cursor, entries):
+    """Add (donation_date, hospital_id, blood_group, quantity) donations to the rollups"""
+    totals = defaultdict(lambda: [0, 0])
+    by_hospital = defaultdict(int)
+    for donation_date, hospital_id, blood_group, quantity in entries:
+        total = totals[(month_of(donation_date), hospital_id, blood_group)]
+        total[0] += 1
+        total[1] += int(quantity)
+        by_hospital[hospital_id] += 1
+    if not totals:
+        return
+    cursor.executemany("""
+        INSERT INTO Donation_Monthly (Month, Hospital_ID, Blood_Group, Donations, Quantity)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE Donations = Donations + VALUES(Donations), Quantity = Quantity + VALUES(Quantity)
+    """, [key + tuple(total) for key, total in totals.items()])
+    _add_activity(cursor, 'Donations', by_hospital)
+
+
+def roll_up_requests(cursor, entries):
+    """Add (request_date, hospital_id, status, quantity) requests to the rollups"""
+    totals = defaultdict(lambda: [0, 0])
+    by_hospital = defaultdict(int)
+    for request_date, hospital_id, status, quantity in entries:
+        total = totals[(month_of(request_date), hospital_id, status)]
+        total[0] += 1
+        total[1] += int(quantity)
+        by_hospital[hospital_id] += 1
+    if not totals:
+        return
+    _add_request_months(cursor, totals)
+    _add_activity(cursor, 'Requests', by_hospital)
+
+
+def restatus_request(cursor, request_date, hospital_id, quantity, old_status, new_status):
+    """Move one request from `old_status` to `new_status` in Request_Monthly"""
+    month = month_of(request_date)
+    _add_request_months(cursor, {
+        (month, hospital_id, old_status): (-1, -int(quantity)),
+        (month, hospital_id, new_status): (1, int(quantity)),
+    })
+
+
+def monthly_totals(pool, months=6):
+    """(month, donations) for the latest `months` months with donations, newest first"""
+    return fetch_all(pool, MONTHLY_TOTALS_QUERY, (months,))
+
+
+def backfill_monthly(cursor):
+    """Recompute Donation_Monthly from Donation on an open transaction's cursor"""
+    cursor.execute("DELETE FROM Donation_Monthly")
+    cursor.execute("""
+        INSERT INTO Donation_Monthly (Month, Hospital_ID, Blood_Group, Donations, Quantity)
+        SELECT DATE_FORMAT(don.Donation_date, '%Y-%m'), don.Hospital_ID, d.Blood_Group,
+            COUNT(*), SUM(don.Quantity)
+        FROM Donation don
+        JOIN Donor d ON d.Donor_ID = don.Donor_ID
+        GROUP BY DATE_FORMAT(don.Donation_date, '%Y-%m'), don.Hospital_ID, d.Blood_Group
+    """)
+
+
+def backfill_activity(cursor):
+    """Recompute Request_Monthly and Hospital_Activity on an open transaction's cursor"""
+    cursor.execute("DELETE FROM Request_Monthly")
+    cursor.execute("DELETE FROM Hospital_Activity")
+    cursor.execute("""
+        INSERT INTO Request_Monthly (Month, Hospital_ID, Status, Requests, Quantity)
+        SELECT DATE_FORMAT(Request_date, '%Y-%m'), Hospital_ID, Status, COUNT(*), SUM(Quantity)
+        FROM Request
+        GROUP BY DATE_FORMAT(Request_date, '%Y-%m'), Hospital_ID, Status
+    """)
+    cursor.execute("""
+        INSERT INTO Hospital_Activity (Hospital_ID, Donations, Requests)
+        SELECT Hospital_ID, SUM(Donations), SUM(Requests)
+        FROM (
+            SELECT Hospital_ID, COUNT(*) as Donations, 0 as Requests
+            FROM Donation GROUP BY Hospital_ID
+            UNION ALL
+            SELECT Hospital_ID, 0, COUNT(*)
+            FROM Request GROUP BY Hospital_ID
+        ) s
+        GROUP BY Hospital_ID
+    """)
+
+
+def rebuild(pool):
+    """Recompute every rollup from scratch in one transaction"""
+    with transaction(pool) as cursor:
+        backfill_monthly(cursor)
+        backfill_activity(cursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Donation and request rollup maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    pool = ConnectionPool(size=1)
+    with transaction(pool) as cursor:
+        for statement in CREATE_TABLES:
+            cursor.execute(statement)
+    rebuild(pool)
+    for month, donations in monthly_totals(pool, 12):
+        print(f"{month}  donations={donations}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Core schema of the blood bank database.
+
+The DDL is portable between the MySQL and SQLite backends. The stored
+routines exist only on MySQL, where missing ones are created; the SQLite backend provides Python
+equivalents on every connection. Databases are created and upgraded by
+bloodbank.migrations, which applies these definitions as version 1.
+"""
+from bloodbank.db import transaction
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Hospital (
+        Hospital_ID VARCHAR(12) PRIMARY KEY,
+        Name VARCHAR(100) NOT NULL,
+        Address VARCHAR(255)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Hospital_Contact (
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Contact VARCHAR(20) NOT NULL,
+        PRIMARY KEY (Hospital_ID, Contact),
+        FOREIGN KEY (Hospital_ID) REFERENCES Hospital(Hospital_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Hospital_Email (
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Email VARCHAR(100) NOT NULL,
+        PRIMARY KEY (Hospital_ID, Email),
+        FOREIGN KEY (Hospital_ID) REFERENCES Hospital(Hospital_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS User_Login (
+        User_ID VARCHAR(12) PRIMARY KEY,
+        Username VARCHAR(50) NOT NULL UNIQUE,
+        Password VARCHAR(255) NOT NULL,
+        Hospital_ID VARCHAR(12),
+        FOREIGN KEY (Hospital_ID) REFERENCES Hospital(Hospital_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS User_Contact (
+        User_ID VARCHAR(12) NOT NULL,
+        Contact VARCHAR(20) NOT NULL,
+        PRIMARY KEY (User_ID, Contact),
+        FOREIGN KEY (User_ID) REFERENCES User_Login(User_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS User_Email (
+        User_ID VARCHAR(12) NOT NULL,
+        Email VARCHAR(100) NOT NULL,
+        PRIMARY KEY (User_ID, Email),
+        FOREIGN KEY (User_ID) REFERENCES User_Login(User_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Donor (
+        Donor_ID VARCHAR(12) PRIMARY KEY,
+        F_name VARCHAR(50) NOT NULL,
+        L_name VARCHAR(50) NOT NULL,
+        Address VARCHAR(255),
+        Gender VARCHAR(10),
+        DOB DATE,
+        Age INT,
+        Blood_Group VARCHAR(3) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Donor_Contact (
+        Donor_ID VARCHAR(12) NOT NULL,
+        Contact VARCHAR(20) NOT NULL,
+        PRIMARY KEY (Donor_ID, Contact),
+        FOREIGN KEY (Donor_ID) REFERENCES Donor(Donor_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Recipient (
+        Recipient_ID VARCHAR(12) PRIMARY KEY,
+        F_name VARCHAR(50) NOT NULL,
+        L_name VARCHAR(50) NOT NULL,
+        Address VARCHAR(255),
+        Gender VARCHAR(10),
+        Age INT,
+        Blood_Group VARCHAR(3) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Recipient_Contact (
+        Recipient_ID VARCHAR(12) NOT NULL,
+        Contact VARCHAR(20) NOT NULL,
+        PRIMARY KEY (Recipient_ID, Contact),
+        FOREIGN KEY (Recipient_ID) REFERENCES Recipient(Recipient_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Donation (
+        Donation_ID VARCHAR(12) PRIMARY KEY,
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Donor_ID VARCHAR(12) NOT NULL,
+        Quantity INT NOT NULL,
+        Donation_date DATE NOT NULL,
+        FOREIGN KEY (Hospital_ID) REFERENCES Hospital(Hospital_ID),
+        FOREIGN KEY (Donor_ID) REFERENCES Donor(Donor_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Request (
+        Request_ID VARCHAR(12) PRIMARY KEY,
+        Hospital_ID VARCHAR(12) NOT NULL,
+        Recipient_ID VARCHAR(12) NOT NULL,
+        Status VARCHAR(10) NOT NULL DEFAULT 'Pending',
+        Quantity INT NOT NULL,
+        Blood_Group VARCHAR(3) NOT NULL,
+        Request_date DATE NOT NULL,
+        Source_Group VARCHAR(3),
+        FOREIGN KEY (Hospital_ID) REFERENCES Hospital(Hospital_ID),
+        FOREIGN KEY (Recipient_ID) REFERENCES Recipient(Recipient_ID)
+    )
+    """,
+]
+
+# Children before parents, for dropping
+TABLE_NAMES = [
+    'Request', 'Donation', 'Recipient_Contact', 'Recipient', 'Donor_Contact', 'Donor',
+    'User_Email', 'User_Contact', 'User_Login', 'Hospital_Email', 'Hospital_Contact', 'Hospital',
+]
+
+# MySQL only: (routine type, name, definition). Routines are created when
+# missing and never replaced, so operators' own definitions are kept.
+ROUTINES = [
+    ('FUNCTION', 'Calculate_Age', """
+    CREATE FUNCTION Calculate_Age(dob DATE) RETURNS INT
+    NOT DETERMINISTIC NO SQL
+    RETURN TIMESTAMPDIFF(YEAR, dob, CURDATE())
+    """),
+    ('PROCEDURE', 'GetDonorsByBloodGroup', """
+    CREATE PROCEDURE GetDonorsByBloodGroup(IN bg VARCHAR(3))
+    SELECT Donor_ID, F_name, L_name, Age, Blood_Group
+    FROM Donor
+    WHERE Blood_Group = bg
+    ORDER BY Donor_ID
+    """),
+]
+
+
+def _run(pool, statements):
+    with transaction(pool) as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_schema(pool, extra_tables=()):
+    """Drop the core tables plus `extra_tables`; destroys all data"""
+    _run(pool, [f"DROP TABLE IF EXISTS {name}" for name in list(extra_tables) + TABLE_NAMES])
@@ -0,0 +1,127 @@
+"""In-memory trigram index for finding people by partial name or phone number.
+
+Each person is a document numbered in insertion order. Names are indexed
+as the trigrams of every word padded with two leading spaces and one
+trailing space, so both word prefixes ("kav") and inner fragments match.
+Query words are left open (no trailing space) so each can be a prefix,
+except a last word followed by whitespace, which must end there;
+contact numbers are reduced to their digits and indexed as plain
+trigrams. A posting list per trigram is an array('i') of document
+numbers that only ever grows, so add() is cheap and the index can follow
+inserts without being rebuilt.
+
+search() counts, with one np.bincount over the query trigrams' posting
+lists, how many of them each document contains, keeps documents that
+match at least MIN_SCORE of them, and ranks those by that share, then by
+shorter name. A typo still leaves most trigrams intact, so near misses are
+found too.
+
+The index lives in the server process and is loaded with load(), which
+streams a listing's export query. Because add() ignores IDs it already
+holds, people added before or during a load are neither lost nor doubled.
+Rows written elsewhere (another process, or straight into the database)
+only appear after it is reloaded.
+"""
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from bloodbank.db import stream_rows
+
+MIN_SCORE = 0.5
+
+SearchHit = namedtuple('SearchHit', 'person_id name blood_group contacts score')
+
+_WORDS = re.compile(r"[^\W\d_]+")
+_DIGITS = re.compile(r"\d+")
+
+
+def name_trigrams(text, complete=True):
+    """Trigrams of every word; `complete=False` leaves words open as prefixes, bar a last one followed by whitespace"""
+    words = _WORDS.findall(text.lower())
+    last_closed = text[-1:].isspace()
+    grams = set()
+    for number, word in enumerate(words):
+        closed = complete or (last_closed and number == len(words) - 1)
+        padded = f"  {word}" + (" " if closed else "")
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def digit_trigrams(text):
+    """Trigrams of the digits of a phone number (or several, comma-separated)"""
+    grams = set()
+    for number in str(text or "").split(","):
+        digits = "".join(_DIGITS.findall(number))
+        grams.update(digits[i:i + 3] for i in range(len(digits) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Thread-safe trigram index over people's names and contact numbers"""
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.blood_groups = []
+        self.contacts = []
+        self.load_seconds = 0.0
+        self._name_lengths = array('i')
+        self._positions = {}
+        self._postings = defaultdict(lambda: array('i'))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, person_id, name, blood_group, contacts):
+        """Index one person; re-adding a known ID is ignored"""
+        grams = name_trigrams(name) | digit_trigrams(contacts)
+        with self._lock:
+            if person_id in self._positions:
+                return
+            doc = len(self.ids)
+            self._positions[person_id] = doc
+            self.ids.append(person_id)
+            self.names.append(name)
+            self.blood_groups.append(blood_group)
+            self.contacts.append(contacts)
+            self._name_lengths.append(min(len(name), 1023))
+            for gram in grams:
+                self._postings[gram].append(doc)
+
+    def load(self, pool, listing):
+        """Index every row of a Donor or Recipient listing (ID, name, ..., blood group, ..., contacts)"""
+        start = time.perf_counter()
+        for rows in stream_rows(pool, listing.export_query):
+            for row in rows:
+                self.add(row[0], row[1], row[4], row[6] or "")
+        self.load_seconds = time.perf_counter() - start
+        return self
+
+    def search(self, query, limit=20):
+        """The best `limit` SearchHits for a partial name and/or phone number"""
+        grams = name_trigrams(query, complete=False) | digit_trigrams(query)
+        with self._lock:
+            postings = [self._postings[gram] for gram in grams if gram in self._postings]
+            if not postings:
+                return []
+            docs = len(self.ids)
+            matched = np.bincount(np.concatenate([np.frombuffer(p, dtype=np.int32) for p in postings]),
+                                  minlength=docs)
+            name_lengths = np.frombuffer(self._name_lengths, dtype=np.int32)[:docs].copy()
+        candidates = np.flatnonzero(matched >= max(1, int(np.ceil(len(grams) * MIN_SCORE))))
+        # More matched trigrams first, then shorter names, then earlier insertions
+        rank = matched[candidates].astype(np.int64) * 1024 - name_lengths[candidates]
+        if len(candidates) > limit:
+            best = np.argpartition(-rank, limit - 1)[:limit]
+            candidates, rank = candidates[best], rank[best]
+        candidates = candidates[np.lexsort((candidates, -rank))]
+        with self._lock:
+            return [SearchHit(self.ids[doc], self.names[doc], self.blood_groups[doc], self.contacts[doc],
+                              float(matched[doc]) / len(grams))
+                    for doc in candidates.tolist()]
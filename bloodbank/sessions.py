@@ -0,0 +1,99 @@
+"""Server-side login sessions addressed by signed tokens.
+
+A token is `<session id>.<HMAC-SHA256 of the id>`, so forged or mangled
+tokens are rejected before the store is consulted. The store is an
+in-process LRU: each entry holds the user's profile and expires after
+BLOODBANK_SESSION_TTL seconds without use. The app puts the token in the
+page URL, so a browser refresh restores the session from memory without
+re-authenticating or re-querying the profile. Because a URL leaks easily
+(history, pasted links, screen shares), each session is bound to the
+client that logged in: create() stores a keyed digest of a client
+description (the app uses IP address and user agent), and get() refuses
+the token from any other client.
+
+Sessions live in the server process. A restart logs everyone out, and
+several server processes behind one URL need sticky routing. Without
+BLOODBANK_SESSION_SECRET a random key is generated per process, which has
+the same effect on outstanding tokens.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_TTL = float(os.environ.get('BLOODBANK_SESSION_TTL', str(30 * 60)))
+MAX_SESSIONS = int(os.environ.get('BLOODBANK_MAX_SESSIONS', '10000'))
+SESSION_SECRET = os.environ.get('BLOODBANK_SESSION_SECRET', '')
+
+
+class SessionStore:
+    """Thread-safe LRU of profiles keyed by session id, with a sliding TTL"""
+
+    def __init__(self, secret=SESSION_SECRET, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self._key = secret.encode() if secret else secrets.token_bytes(32)
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sign(self, session_id):
+        digest = hmac.new(self._key, session_id.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def _client_digest(self, client):
+        return hmac.new(self._key, f"client:{client}".encode(), hashlib.sha256).digest()
+
+    def _session_id(self, token):
+        """The session id of a correctly signed token, else None"""
+        session_id, _, signature = (token or "").partition(".")
+        if session_id and hmac.compare_digest(signature, self._sign(session_id)):
+            return session_id
+        return None
+
+    def create(self, profile, client=""):
+        """Start a session for `profile`, usable only by `client`, and return its token"""
+        session_id = secrets.token_urlsafe(24)
+        client_digest = self._client_digest(client)
+        with self._lock:
+            self._sessions[session_id] = (profile, time.monotonic() + self.ttl, client_digest)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return f"{session_id}.{self._sign(session_id)}"
+
+    def get(self, token, client=""):
+        """The profile of a live session of `client`, extending its lifetime; None otherwise"""
+        session_id = self._session_id(token)
+        if session_id is None:
+            return None
+        client_digest = self._client_digest(client)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            # Another client's token is refused but left valid for its owner
+            if entry is None or not hmac.compare_digest(entry[2], client_digest):
+                return None
+            if entry[1] < now:
+                del self._sessions[session_id]
+                return None
+            self._sessions[session_id] = (entry[0], now + self.ttl, entry[2])
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def revoke(self, token):
+        session_id = self._session_id(token)
+        if session_id is not None:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+
+    def revoke_user(self, user_id):
+        """End every session of a user, e.g. after the account is deleted"""
+        with self._lock:
+            for session_id in [s for s, (profile, *_) in self._sessions.items() if profile.user_id == user_id]:
+                del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)